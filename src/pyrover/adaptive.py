@@ -0,0 +1,150 @@
+"""
+Poll rate adapting to the activity of the controller
+
+Polling at the daytime rate all night, or while the battery floats at a
+stable voltage, costs bus time and power for readings that do not change.
+`AdaptivePollRate` stretches the interval while the controller is idle and
+goes back to the fastest rate as soon as something happens (charging state
+change, load switched on or off, new fault...), e.g.:
+
+    rate = AdaptivePollRate(min_interval=1.0, max_interval=60.0)
+    poller = Poller(rover, interval=rate.interval, policy=rate)
+    poller.start()
+    ...
+    print(rate.stats())
+"""
+
+from collections import deque
+from typing import Any, Deque, Dict, NamedTuple, Optional
+import logging
+
+from .poller import Snapshot
+from .types import ChargingState
+
+logger = logging.getLogger(__name__)
+
+
+class RateStats(NamedTuple):
+    interval: float
+    # Samples per second at the current interval
+    rate: float
+    # Samples per second measured over the recent samples
+    achieved_rate: Optional[float]
+    # Why the current interval was chosen: "event", "idle" or "active"
+    reason: str
+    samples: int
+
+
+class AdaptivePollRate:
+    """
+    Interval policy for `Poller`, slows down while the controller is idle
+    """
+
+    def __init__(
+        self,
+        min_interval: float = 1.0,
+        max_interval: float = 60.0,
+        backoff: float = 2.0,
+        night_voltage: float = 5.0,
+        voltage_tolerance: float = 0.1,
+        power_tolerance: int = 10,
+        window: int = 16,
+    ):
+        """
+        :param min_interval: Interval while the controller is active and after an event (seconds)
+        :param max_interval: Longest interval while idle (seconds)
+        :param backoff: Factor applied to the interval on each idle sample
+        :param night_voltage: Solar voltage under which charging deactivated means night (volts)
+        :param voltage_tolerance: Battery voltage change still considered stable (volts)
+        :param power_tolerance: Load or charging power change considered an event (watts)
+        :param window: Number of recent samples the achieved rate is measured over
+        """
+        if not 0 < min_interval <= max_interval:
+            raise ValueError(
+                f"intervals must satisfy 0 < min_interval ({min_interval}) <= max_interval ({max_interval})"
+            )
+        if backoff <= 1:
+            raise ValueError(f"backoff ({backoff}) must be greater than 1")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.night_voltage = night_voltage
+        self.voltage_tolerance = voltage_tolerance
+        self.power_tolerance = power_tolerance
+
+        self.interval = min_interval
+        self.reason = "active"
+        self.samples = 0
+        self._previous: Optional[Dict[str, Any]] = None
+        self._timestamps: Deque[float] = deque(maxlen=window)
+
+    def __call__(self, snapshot: Snapshot) -> float:
+        return self.update(snapshot)
+
+    def update(self, snapshot: Snapshot) -> float:
+        """
+        Account for a new sample
+
+        :return: Interval until the next sample (seconds)
+        """
+        values = snapshot.values
+        previous = self._previous
+        self._previous = values
+        self.samples += 1
+        self._timestamps.append(snapshot.timestamp)
+
+        event = self._event(previous, values) if previous is not None else None
+        if event is not None:
+            if self.interval != self.min_interval:
+                logger.info(f"{event}, back to polling every {self.min_interval}s")
+            self.interval, self.reason = self.min_interval, "event"
+        elif previous is not None and self._idle(previous, values):
+            self.interval, self.reason = min(self.interval * self.backoff, self.max_interval), "idle"
+        else:
+            self.interval, self.reason = self.min_interval, "active"
+        return self.interval
+
+    @property
+    def rate(self) -> float:
+        return 1.0 / self.interval
+
+    @property
+    def achieved_rate(self) -> Optional[float]:
+        if len(self._timestamps) < 2:
+            return None
+        elapsed = self._timestamps[-1] - self._timestamps[0]
+        return (len(self._timestamps) - 1) / elapsed if elapsed > 0 else None
+
+    def stats(self) -> RateStats:
+        return RateStats(
+            interval=self.interval,
+            rate=self.rate,
+            achieved_rate=self.achieved_rate,
+            reason=self.reason,
+            samples=self.samples,
+        )
+
+    def _event(self, previous: Dict[str, Any], values: Dict[str, Any]) -> Optional[str]:
+        # Description of what changed enough to poll at the fastest rate, None if nothing did
+        if values.get("charging_state") != previous.get("charging_state"):
+            return f"charging state changed to {values.get('charging_state')}"
+        if values.get("street_light_status") != previous.get("street_light_status"):
+            return f"load switched {values.get('street_light_status')}"
+        for name in ("load_power", "charging_power"):
+            if abs(values.get(name, 0) - previous.get(name, 0)) > self.power_tolerance:
+                return f"{name} changed from {previous.get(name)} to {values.get(name)}"
+        new_faults = set(values.get("controller_fault_information") or ()) - set(
+            previous.get("controller_fault_information") or ()
+        )
+        if new_faults:
+            return f"new faults {sorted(str(fault) for fault in new_faults)}"
+        return None
+
+    def _idle(self, previous: Dict[str, Any], values: Dict[str, Any]) -> bool:
+        state = values.get("charging_state")
+        if state == ChargingState.DEACTIVATED and values.get("solar_voltage", 0) < self.night_voltage:
+            return True
+        if state == ChargingState.FLOATING:
+            change = abs(values.get("battery_voltage", 0) - previous.get("battery_voltage", 0))
+            return change <= self.voltage_tolerance
+        return False
@@ -0,0 +1,217 @@
+"""
+Fault and threshold alarms evaluated on every poller snapshot
+
+The engine compares the raw 32-bit fault word with the previous one (no fault
+lists are built) and evaluates pre-compiled threshold rules. Alarms are
+debounced and raise/clear events are passed to the subscribers, e.g.:
+
+    engine = AlarmEngine(rules=DEFAULT_RULES, debounce=3)
+    engine.subscribe(lambda event: print(event))
+    poller.subscribe(engine.update)
+
+Rules hold no state so a single rule set can be shared by the engines of a
+whole fleet (one engine per controller).
+"""
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Union
+import logging
+import operator
+
+from .poller import Snapshot
+from .types import Fault
+
+logger = logging.getLogger(__name__)
+
+# Registers holding the fault word (high word first)
+FAULT_REGISTERS = (0x0121, 0x0122)
+
+_FAULT_MASK = sum(fault.value for fault in Fault)
+
+_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+
+class AlarmEvent(NamedTuple):
+    name: str
+    raised: bool
+    timestamp: float
+    value: Any = None
+    fault: Optional[Fault] = None
+
+
+AlarmSubscriber = Callable[[AlarmEvent], None]
+
+
+class ThresholdRule:
+    def __init__(
+        self,
+        name: str,
+        field: str,
+        op: str,
+        threshold: Union[float, str],
+        debounce: Optional[int] = None,
+        hysteresis: float = 0.0,
+    ):
+        """
+        :param name: Alarm name used in the events
+        :param field: Snapshot value compared by the rule, e.g. "battery_voltage"
+        :param op: Comparison raising the alarm, one of <, <=, >, >=, ==, !=
+        :param threshold: Constant or name of another snapshot value, e.g. "under_voltage_warning_level"
+        :param debounce: Consecutive samples required to raise/clear (default is the engine's)
+        :param hysteresis: Margin the value must move back past the threshold before clearing
+        """
+        if op not in _OPERATORS:
+            raise ValueError(f"unknown operator ({op})")
+        self.name = name
+        self.field = field
+        self.op = op
+        self.threshold = threshold
+        self.debounce = debounce
+        self.hysteresis = hysteresis
+
+        self._compare = _OPERATORS[op]
+        if op in ("<", "<="):
+            self._clear_margin = hysteresis
+        elif op in (">", ">="):
+            self._clear_margin = -hysteresis
+        else:
+            self._clear_margin = 0.0
+        if isinstance(threshold, str):
+            key = threshold
+            self._threshold: Callable[[Dict[str, Any]], Any] = lambda values: values.get(key)
+        else:
+            self._threshold = lambda values: threshold
+
+    def evaluate(self, values: Dict[str, Any], active: bool) -> Optional[bool]:
+        """
+        Whether the alarm condition holds, or None if the values are unavailable
+        """
+        value = values.get(self.field)
+        if value is None:
+            return None
+        threshold = self._threshold(values)
+        if threshold is None:
+            return None
+        if active:
+            return self._compare(value, threshold + self._clear_margin)
+        return self._compare(value, threshold)
+
+    def __repr__(self) -> str:
+        return f"ThresholdRule({self.name}: {self.field} {self.op} {self.threshold})"
+
+
+DEFAULT_RULES = (
+    ThresholdRule(
+        "battery_under_voltage_warning", "battery_voltage", "<", "under_voltage_warning_level", hysteresis=0.2
+    ),
+    ThresholdRule("battery_over_voltage", "battery_voltage", ">", "over_voltage_threshold", hysteresis=0.2),
+)
+
+
+class AlarmEngine:
+    def __init__(self, rules: Sequence[ThresholdRule] = (), debounce: int = 1, faults: bool = True):
+        """
+        :param rules: Threshold rules to evaluate
+        :param debounce: Consecutive samples required to raise or clear an alarm
+        :param faults: Raise an alarm for each controller fault bit
+        """
+        if debounce < 1:
+            raise ValueError(f"debounce ({debounce}) must be at least 1")
+        self.rules = tuple(rules)
+        self.debounce = debounce
+        self.faults = faults
+
+        self._subscribers: List[AlarmSubscriber] = []
+
+        # Fault state: active bits, bits with a pending transition and their sample counts
+        self._fault_active = 0
+        self._fault_pending = 0
+        self._fault_counts = [0] * 32
+
+        # Rule state, indexed like `rules`
+        self._rule_active = [False] * len(self.rules)
+        self._rule_counts = [0] * len(self.rules)
+        self._rule_debounce = [rule.debounce or debounce for rule in self.rules]
+
+    def subscribe(self, subscriber: AlarmSubscriber) -> None:
+        self._subscribers.append(subscriber)
+
+    @property
+    def fault_word(self) -> int:
+        """
+        Bitmask of the active (debounced) faults
+        """
+        return self._fault_active
+
+    def active(self) -> List[str]:
+        """
+        Names of the active alarms
+        """
+        names = [fault.name or str(fault) for fault in Fault if self._fault_active & fault.value]
+        names.extend(rule.name for rule, active in zip(self.rules, self._rule_active) if active)
+        return names
+
+    def update(self, snapshot: Snapshot) -> None:
+        """
+        Evaluate a new snapshot and emit the resulting raise/clear events
+        """
+        if self.faults:
+            registers = snapshot.registers
+            high, low = FAULT_REGISTERS
+            if high in registers and low in registers:
+                self._update_faults((registers[high] << 16 | registers[low]) & _FAULT_MASK, snapshot.timestamp)
+
+        values = snapshot.values
+        for i, rule in enumerate(self.rules):
+            active = self._rule_active[i]
+            condition = rule.evaluate(values, active)
+            if condition is None or condition == active:
+                self._rule_counts[i] = 0
+                continue
+            count = self._rule_counts[i] + 1
+            if count < self._rule_debounce[i]:
+                self._rule_counts[i] = count
+                continue
+            self._rule_counts[i] = 0
+            self._rule_active[i] = condition
+            self._emit(AlarmEvent(rule.name, condition, snapshot.timestamp, values.get(rule.field)))
+
+    def _update_faults(self, word: int, timestamp: float) -> None:
+        changed = word ^ self._fault_active
+        # Bits that went back to their active state before the debounce expired
+        settled = self._fault_pending & ~changed
+        if not changed and not settled:
+            return
+        while settled:
+            bit = settled & -settled
+            settled ^= bit
+            self._fault_counts[bit.bit_length() - 1] = 0
+        self._fault_pending &= changed
+
+        while changed:
+            bit = changed & -changed
+            changed ^= bit
+            index = bit.bit_length() - 1
+            count = self._fault_counts[index] + 1
+            if count < self.debounce:
+                self._fault_counts[index] = count
+                self._fault_pending |= bit
+                continue
+            self._fault_counts[index] = 0
+            self._fault_pending &= ~bit
+            self._fault_active ^= bit
+            fault = Fault(bit)
+            self._emit(AlarmEvent(fault.name or str(fault), bool(word & bit), timestamp, fault=fault))
+
+    def _emit(self, event: AlarmEvent) -> None:
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber(event)
+            except Exception:
+                logger.exception(f"alarm subscriber failed ({subscriber})")
@@ -0,0 +1,253 @@
+"""
+Fleet anomaly detection across controllers (requires NumPy: `pip install pyrover[fleet]`)
+
+The latest telemetry of every device is kept in a device x field matrix and
+each cycle is scored with array operations over the whole fleet instead of
+loops over per-device dicts:
+
+- peer score: robust z-score of each value against the median and MAD of its
+  peer group (e.g. the controllers of a site, whose panels see the same sky)
+- baseline score: deviation of the peer score from its own rolling mean, so a
+  device that always runs below its peers (a smaller array) is only flagged
+  when it changes
+
+Until its baseline covers `min_history` cycles, a value is judged by its peer
+score. After that, a peer score over the threshold is only ignored while it
+stays within the threshold of the device's usual offset. The baseline does not
+learn from the values it does not explain, so a lasting failure (e.g. an array
+dropping well below its peers) keeps being flagged instead of becoming the new
+baseline.
+
+e.g. with the time-aligned snapshots of `pyrover.fleet`:
+
+    analytics = FleetAnalytics(devices, groups={device: site_of(device) for device in devices})
+    sampler.subscribe(analytics.update_fleet)
+    analytics.subscribe(lambda anomalies: [print(anomaly) for anomaly in anomalies])
+
+A negative score means below the peers (e.g. an underperforming array for
+`charging_power`), a positive one above (e.g. a hot `controller_temperature`).
+"""
+
+from typing import Any, Callable, Dict, Hashable, List, Mapping, NamedTuple, Optional, Sequence
+import logging
+import time
+import warnings
+
+import numpy as np
+
+from .fleet import FleetSnapshot
+from .poller import Snapshot
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FIELDS = (
+    "charging_power",
+    "solar_voltage",
+    "solar_current",
+    "battery_voltage",
+    "controller_temperature",
+    "battery_temperature",
+)
+
+# Smallest spread a field's peers are assumed to have, so identical values (e.g. no power at night)
+# do not turn tiny differences into large scores
+DEFAULT_MIN_SPREAD: Dict[str, float] = {
+    "charging_power": 10.0,
+    "solar_voltage": 0.5,
+    "solar_current": 0.2,
+    "battery_voltage": 0.1,
+    "controller_temperature": 1.0,
+    "battery_temperature": 1.0,
+}
+
+# Scales the MAD to the standard deviation of normally distributed values
+_MAD_SCALE = 1.4826
+
+AnomalySubscriber = Callable[[List["Anomaly"]], Any]
+
+
+class Anomaly(NamedTuple):
+    device: Hashable
+    field: str
+    # "peer" or "baseline"
+    kind: str
+    value: float
+    # Value the device usually has relative to its peers, the peer group median until it has a baseline
+    expected: float
+    score: float
+    timestamp: float
+
+
+class FleetAnalytics:
+    def __init__(
+        self,
+        devices: Sequence[Hashable],
+        fields: Sequence[str] = DEFAULT_FIELDS,
+        groups: Optional[Mapping[Any, Hashable]] = None,
+        threshold: float = 3.5,
+        baseline_threshold: float = 4.0,
+        window: int = 60,
+        min_history: int = 10,
+        min_peers: int = 3,
+        max_age: Optional[float] = 60.0,
+        min_spread: Optional[Mapping[str, float]] = None,
+    ):
+        """
+        :param devices: Devices of the fleet, each a row of the matrix
+        :param fields: Numeric fields scored, each a column of the matrix
+        :param groups: Peer group of each device (default is a single group)
+        :param threshold: Absolute peer score over which a value is anomalous
+        :param baseline_threshold: Absolute baseline score over which a value is anomalous
+        :param window: Number of cycles the rolling baselines are averaged over
+        :param min_history: Cycles of a device before its baseline is used
+        :param min_peers: Smallest number of fresh values in a group to score it
+        :param max_age: Values older than this are left out of the cycle (seconds), None keeps them
+        :param min_spread: Smallest spread of each field's peers, in the field's unit
+        """
+        if len(set(devices)) != len(devices):
+            raise ValueError("devices must be unique")
+        self.devices = list(devices)
+        self.fields = list(fields)
+        self.threshold = threshold
+        self.baseline_threshold = baseline_threshold
+        self.min_history = min_history
+        self.min_peers = min_peers
+        self.max_age = max_age
+
+        self._rows = {device: row for row, device in enumerate(self.devices)}
+        self._columns = {field: column for column, field in enumerate(self.fields)}
+        group_of = groups or {}
+        names = sorted({group_of.get(device) for device in self.devices}, key=repr)
+        codes = {name: code for code, name in enumerate(names)}
+        self.groups = np.array([codes[group_of.get(device)] for device in self.devices], dtype=np.intp)
+        self._group_masks = [self.groups == code for code in range(len(names))]
+        spreads = {**DEFAULT_MIN_SPREAD, **(min_spread or {})}
+        self._min_spread = np.array([spreads.get(field, 0.0) for field in self.fields]) / _MAD_SCALE
+
+        shape = (len(self.devices), len(self.fields))
+        # Latest value of each field of each device, NaN if never read
+        self.matrix = np.full(shape, np.nan)
+        # Time of each device's latest values
+        self.timestamps = np.full(len(self.devices), -np.inf)
+        # Peer scores of the latest cycle
+        self.scores = np.full(shape, np.nan)
+        # Rolling mean and variance of the peer scores, and the number of cycles they cover
+        self._alpha = 2.0 / (window + 1)
+        self._mean = np.zeros(shape)
+        self._variance = np.ones(shape)
+        self._history = np.zeros(shape, dtype=np.int64)
+        self._subscribers: List[AnomalySubscriber] = []
+
+    def subscribe(self, subscriber: AnomalySubscriber) -> None:
+        """
+        Call `subscriber` with the anomalies of each cycle that has some
+        """
+        self._subscribers.append(subscriber)
+
+    def subscriber(self, device: Hashable) -> Callable[[Snapshot], None]:
+        """
+        Poller subscriber updating the row of `device`, call `evaluate()` once per cycle
+        """
+        return lambda snapshot: self.update(device, snapshot.values, snapshot.timestamp)
+
+    def update(self, device: Hashable, values: Mapping[str, Any], timestamp: Optional[float] = None) -> None:
+        """
+        Store the latest values of a device
+        """
+        row = self._rows[device]
+        self.matrix[row] = [_number(values.get(field)) for field in self.fields]
+        self.timestamps[row] = time.time() if timestamp is None else timestamp
+
+    def update_fleet(self, snapshot: FleetSnapshot) -> List[Anomaly]:
+        """
+        Store the samples of a `pyrover.fleet.FleetSnapshot` and evaluate the cycle
+        """
+        for device, sample in snapshot.samples.items():
+            if sample.error is None and device in self._rows:
+                self.update(device, sample.values, sample.timestamp)
+        return self.evaluate(snapshot.trigger)
+
+    def score(self, device: Hashable, field: str) -> Optional[float]:
+        """
+        Peer score of a value in the latest cycle, None if it was not scored
+        """
+        score = self.scores[self._rows[device], self._columns[field]]
+        return None if np.isnan(score) else float(score)
+
+    def evaluate(self, timestamp: Optional[float] = None) -> List[Anomaly]:
+        """
+        Score the latest values and update the rolling baselines
+
+        :param timestamp: Time of the cycle, the reference for `max_age` (default is now)
+        :return: The anomalies of the cycle
+        """
+        now = time.time() if timestamp is None else timestamp
+        values = self.matrix.copy()
+        if self.max_age is not None:
+            values[now - self.timestamps > self.max_age] = np.nan
+
+        medians = np.full(values.shape, np.nan)
+        spreads = np.full(values.shape, np.nan)
+        with warnings.catch_warnings():
+            # Columns without any value in a group
+            warnings.simplefilter("ignore", RuntimeWarning)
+            for mask in self._group_masks:
+                group = values[mask]
+                enough = np.count_nonzero(~np.isnan(group), axis=0) >= self.min_peers
+                median = np.nanmedian(group, axis=0)
+                mad = np.nanmedian(np.abs(group - median), axis=0)
+                medians[mask] = np.where(enough, median, np.nan)
+                spreads[mask] = np.maximum(mad, self._min_spread)
+        scale = spreads * _MAD_SCALE
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = (values - medians) / scale
+            deviation = np.sqrt(self._variance)
+            baseline_scores = (scores - self._mean) / np.maximum(deviation, 0.5)
+        self.scores = scores
+
+        scored = ~np.isnan(scores)
+        established = self._history >= self.min_history
+        # Far from the peers, and not explained by the device's usual offset
+        explained = established & (np.abs(scores - self._mean) <= self.threshold)
+        peer = scored & ~explained & (np.abs(scores) > self.threshold)
+        baseline = scored & ~peer & established & (np.abs(baseline_scores) > self.baseline_threshold)
+        expected = np.where(established, medians + self._mean * scale, medians)
+        anomalies = [
+            Anomaly(
+                device=self.devices[row],
+                field=self.fields[column],
+                kind=kind,
+                value=float(values[row, column]),
+                expected=float(expected[row, column]),
+                score=float(kind_scores[row, column]),
+                timestamp=now,
+            )
+            for kind, flagged, kind_scores in (("peer", peer, scores), ("baseline", baseline, baseline_scores))
+            for row, column in zip(*np.nonzero(flagged))
+        ]
+
+        # The first `min_history` cycles are averaged as they are, then anomalous scores only move the baselines
+        # by a bounded step and peer anomalies not at all
+        learning = scored & ~(established & peer)
+        alpha = np.where(established, self._alpha, 1.0 / (self._history + 1))
+        bound = np.where(established, self.baseline_threshold * np.maximum(deviation, 0.5), np.inf)
+        step = np.clip(np.where(learning, scores - self._mean, 0.0), -bound, bound)
+        self._mean += alpha * step
+        self._variance = np.where(learning, (1 - alpha) * (self._variance + alpha * step**2), self._variance)
+        self._history += scored
+
+        if anomalies:
+            logger.debug(f"{len(anomalies)} anomalies at {now}")
+            for subscriber in list(self._subscribers):
+                try:
+                    subscriber(anomalies)
+                except Exception:
+                    logger.exception(f"anomaly subscriber failed ({subscriber})")
+        return anomalies
+
+
+def _number(value: Any) -> float:
+    # Non numeric and missing values are left out of the scores
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return np.nan
+    return float(value)
@@ -0,0 +1,273 @@
+"""
+Shared access to a controller for independent consumers
+
+A dashboard, an exporter, the alarm engine and ad-hoc scripts reading the
+same controller compete for a slow serial line. `Broker` sits in front of the
+controller and hands each of them a `Consumer` with the controller's getters:
+
+- a request whose registers were read recently enough for the consumer
+  (its freshness tolerance, `max_age`) is answered from the cache
+- a request for registers already being read by another consumer waits for
+  that transaction instead of issuing its own (single-flight)
+- each consumer has a bus-time budget, a fraction of the line over a sliding
+  window; past it, requests are answered from the cache whatever its age, or
+  rejected with `BudgetExceeded` when nothing was read yet
+
+e.g.:
+
+    broker = Broker(rover)
+    dashboard = broker.consumer("dashboard", max_age=5.0, budget=0.1)
+    alarms = broker.consumer("alarms", max_age=1.0)
+    dashboard.charging_power(), alarms.get("battery_voltage", "charging_state")
+    print(broker.stats()["dashboard"].hit_ratio)
+"""
+
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional, Sequence, Tuple
+import logging
+import threading
+import time
+
+from .decoders import BufferDecoder
+from .registers import BLOCKS, FIELD_REGISTERS, RegisterSpan
+from .renogy_rover import RenogyRoverController
+
+logger = logging.getLogger(__name__)
+
+
+class BudgetExceeded(RuntimeError):
+    """
+    A consumer over its bus-time budget asked for registers that were never read
+    """
+
+
+class ConsumerStats(NamedTuple):
+    name: str
+    requests: int
+    # Answered from the cache within the freshness tolerance
+    hits: int
+    # Answered by joining another consumer's transaction
+    coalesced: int
+    # Transactions led by the consumer
+    transactions: int
+    # Answered from an outdated cache because the budget was spent
+    stale: int
+    rejected: int
+    # Bus time charged to the consumer over the window (seconds)
+    bus_time: float
+    # Share of the window the bus spent on the consumer's requests
+    utilisation: float
+    budget: Optional[float]
+
+    @property
+    def hit_ratio(self) -> float:
+        return self.hits / self.requests if self.requests else 0.0
+
+    @property
+    def coalesce_ratio(self) -> float:
+        return self.coalesced / self.requests if self.requests else 0.0
+
+
+class _Flight:
+    # A transaction in progress, joined by the consumers asking for registers it covers
+    def __init__(self, span: RegisterSpan):
+        self.span = span
+        self.done = threading.Event()
+        self.registers: Dict[int, int] = {}
+        self.error: Optional[BaseException] = None
+        self.consumers: List["Consumer"] = []
+
+
+class Consumer:
+    """
+    A broker client, with the controller's getters (e.g. `consumer.charging_power()`)
+    """
+
+    def __init__(self, broker: "Broker", name: str, max_age: float, budget: Optional[float]):
+        self.broker = broker
+        self.name = name
+        self.max_age = max_age
+        self.budget = budget
+        self.requests = 0
+        self.hits = 0
+        self.coalesced = 0
+        self.transactions = 0
+        self.stale = 0
+        self.rejected = 0
+        # Start time and bus time of the transactions charged to the consumer, over the window
+        self._usage: Deque[Tuple[float, float]] = deque()
+
+    def read(self, span: RegisterSpan, max_age: Optional[float] = None) -> List[int]:
+        """
+        Registers of a span, read no longer than `max_age` seconds ago (default is the consumer's)
+        """
+        registers = self.broker._read(self, span, self.max_age if max_age is None else max_age)
+        return [registers[address] for address in range(span.address, span.end)]
+
+    def get(self, *fields: str, max_age: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Decoded values of fields, the fields of each register block are read together
+        """
+        profile = self.broker.controller.profile
+        values: Dict[str, Any] = {}
+        for span, names in _cover(fields, profile.blocks if profile is not None else BLOCKS):
+            registers = self.read(span, max_age)
+            values.update(BufferDecoder(span, names).decode(registers))
+        return {name: values[name] for name in fields}
+
+    def all_data(self, max_age: Optional[float] = None) -> Dict[str, Any]:
+        profile = self.broker.controller.profile
+        fields = profile.fields if profile is not None else list(FIELD_REGISTERS)
+        return self.get(*fields, max_age=max_age)
+
+    def bus_time(self, now: Optional[float] = None) -> float:
+        """
+        Bus time charged to the consumer over the window (seconds)
+        """
+        with self.broker._lock:
+            return self._bus_time(time.monotonic() if now is None else now)
+
+    def stats(self) -> ConsumerStats:
+        with self.broker._lock:
+            bus_time = self._bus_time(time.monotonic())
+            return ConsumerStats(
+                name=self.name,
+                requests=self.requests,
+                hits=self.hits,
+                coalesced=self.coalesced,
+                transactions=self.transactions,
+                stale=self.stale,
+                rejected=self.rejected,
+                bus_time=bus_time,
+                utilisation=bus_time / self.broker.window,
+                budget=self.budget,
+            )
+
+    def __getattr__(self, name: str) -> Callable[[], Any]:
+        if name not in FIELD_REGISTERS:
+            raise AttributeError(f"{type(self).__name__} has no attribute {name}")
+        return lambda: self.get(name)[name]
+
+    def _bus_time(self, now: float) -> float:
+        usage = self._usage
+        while usage and usage[0][0] < now - self.broker.window:
+            usage.popleft()
+        return sum(seconds for _, seconds in usage)
+
+
+class Broker:
+    def __init__(self, controller: RenogyRoverController, window: float = 60.0):
+        """
+        :param controller: Controller shared by the consumers
+        :param window: Sliding window the bus-time budgets and utilisation are measured over (seconds)
+        """
+        self.controller = controller
+        self.window = window
+        self.consumers: Dict[str, Consumer] = {}
+
+        self._lock = threading.Lock()
+        # Value and read time (time.monotonic()) of each register
+        self._registers: Dict[int, Tuple[int, float]] = {}
+        self._flights: List[_Flight] = []
+
+    def consumer(self, name: str, max_age: float = 1.0, budget: Optional[float] = None) -> Consumer:
+        """
+        Register a consumer
+
+        :param name: Unique name, used in the stats
+        :param max_age: Freshness tolerance, age of the cached registers still acceptable (seconds)
+        :param budget: Share of the bus time the consumer may use over the window (0-1), None for no limit
+        """
+        if budget is not None and not 0 < budget <= 1:
+            raise ValueError(f"budget ({budget}) must be in (0, 1]")
+        with self._lock:
+            if name in self.consumers:
+                raise ValueError(f"consumer {name} already registered")
+            consumer = self.consumers[name] = Consumer(self, name, max_age, budget)
+        return consumer
+
+    def stats(self) -> Dict[str, ConsumerStats]:
+        return {name: consumer.stats() for name, consumer in list(self.consumers.items())}
+
+    def utilisation(self) -> float:
+        """
+        Share of the window the bus spent on the consumers' requests
+        """
+        return sum(stats.bus_time for stats in self.stats().values()) / self.window
+
+    def _read(self, consumer: Consumer, span: RegisterSpan, max_age: float) -> Dict[int, int]:
+        addresses = range(span.address, span.end)
+        with self._lock:
+            consumer.requests += 1
+            now = time.monotonic()
+            cached = [self._registers.get(address) for address in addresses]
+            if all(entry is not None and now - entry[1] <= max_age for entry in cached):
+                consumer.hits += 1
+                return {address: entry[0] for address, entry in zip(addresses, cached) if entry is not None}
+            flight = next((flight for flight in self._flights if flight.span.contains(span)), None)
+            if flight is not None:
+                consumer.coalesced += 1
+                flight.consumers.append(consumer)
+                leader = False
+            elif consumer.budget is not None and consumer._bus_time(now) >= consumer.budget * self.window:
+                if all(entry is not None for entry in cached):
+                    consumer.stale += 1
+                    return {address: entry[0] for address, entry in zip(addresses, cached) if entry is not None}
+                consumer.rejected += 1
+                raise BudgetExceeded(f"{consumer.name} spent its bus-time budget ({consumer.budget:.0%})")
+            else:
+                flight = _Flight(span)
+                flight.consumers.append(consumer)
+                self._flights.append(flight)
+                consumer.transactions += 1
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.registers
+
+        buffer = [0] * span.number_of_registers
+        started = time.monotonic()
+        try:
+            # Bus time starts once the port is ours, waiting for other users of the port is not charged
+            with self.controller.lock:
+                started = time.monotonic()
+                self.controller.read_into(span, buffer)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            ended = time.monotonic()
+            with self._lock:
+                self._flights.remove(flight)
+                if flight.error is None:
+                    flight.registers = dict(zip(addresses, buffer))
+                    read_at = (started + ended) / 2
+                    self._registers.update((address, (value, read_at)) for address, value in zip(addresses, buffer))
+                # The participants share the cost of the transaction
+                share = (ended - started) / len(flight.consumers)
+                for participant in flight.consumers:
+                    participant._usage.append((started, share))
+            flight.done.set()
+        return flight.registers
+
+
+def _cover(fields: Sequence[str], blocks: Sequence[RegisterSpan]) -> List[Tuple[RegisterSpan, List[str]]]:
+    # Smallest span of each block covering the requested fields of the block
+    unknown = [name for name in fields if name not in FIELD_REGISTERS]
+    if unknown:
+        raise ValueError(f"unknown fields {unknown}")
+    spans = []
+    for block in blocks:
+        names = [name for name in fields if block.contains(FIELD_REGISTERS[name])]
+        if names:
+            start = min(FIELD_REGISTERS[name].address for name in names)
+            end = max(FIELD_REGISTERS[name].end for name in names)
+            spans.append((RegisterSpan(start, end - start), names))
+    covered = {name for _, names in spans for name in names}
+    missing = [name for name in fields if name not in covered]
+    if missing:
+        raise ValueError(f"fields not supported by the controller {missing}")
+    return spans
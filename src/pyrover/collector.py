@@ -0,0 +1,345 @@
+"""
+Multiprocess collector for large fleets of controllers
+
+Devices are sharded across worker processes (all the devices of a serial port
+go to the same worker). Each worker polls its devices and writes the raw
+registers of the latest reading into a table in shared memory, one fixed size
+row per device, so readers get the fleet state without going through the
+workers, e.g.:
+
+    collector = Collector([Device("/dev/ttyUSB0", 1), Device("/dev/ttyUSB1", 1)], workers=2)
+    collector.start()
+    ...
+    snapshot = collector.snapshot(Device("/dev/ttyUSB0", 1))
+    print(snapshot.values["charging_power"])
+
+Other processes can read the same table with
+`ResultTable.attach(collector.table_name, len(devices))`. Rows are protected
+by a sequence counter (odd while a row is being written) so a reader never
+returns a half written row. A row left odd by a worker that died while writing
+it reads as missing until the restarted worker writes it again. Crashed
+workers are restarted by a supervisor thread.
+"""
+
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+import multiprocessing
+import struct
+import threading
+import time
+
+from .decoders import BufferDecoder
+from .poller import Snapshot
+from .registers import BLOCKS
+from .renogy_rover import RenogyRoverController
+from .rollout import Device
+
+logger = logging.getLogger(__name__)
+
+# Sequence counter, error count, timestamp of the reading (0 if never read)
+_ROW_HEADER = struct.Struct("<IId")
+_NUMBER_OF_REGISTERS = sum(block.number_of_registers for block in BLOCKS)
+_REGISTERS = struct.Struct(f"<{_NUMBER_OF_REGISTERS}H")
+_ROW_SIZE = _ROW_HEADER.size + _REGISTERS.size
+
+_ADDRESSES = [address for block in BLOCKS for address in range(block.address, block.end)]
+
+# Time a reader waits for a row being written before giving up on it (seconds)
+_READ_TIMEOUT = 0.1
+
+
+class ResultTable:
+    """
+    Latest registers of each device, in shared memory
+    """
+
+    def __init__(self, devices: int, name: Optional[str] = None, create: bool = True, tracked: bool = True):
+        """
+        :param devices: Number of rows
+        :param name: Shared memory name (generated when creating a table)
+        :param create: Create the shared memory instead of attaching to an existing one
+        :param tracked: Let this process' resource tracker unlink the memory when the process exits
+        """
+        self.devices = devices
+        self._memory = shared_memory.SharedMemory(name=name, create=create, size=max(1, devices * _ROW_SIZE))
+        if not tracked:
+            resource_tracker.unregister(self._memory._name, "shared_memory")  # type: ignore[attr-defined]
+        buffer = self._memory.buf
+        assert buffer is not None
+        self._buffer = buffer
+        self._decoders: List[Tuple[int, BufferDecoder]] = []
+        offset = 0
+        for block in BLOCKS:
+            self._decoders.append((offset, BufferDecoder(block)))
+            offset += block.number_of_registers
+
+    @classmethod
+    def attach(cls, name: str, devices: int, tracked: bool = False) -> "ResultTable":
+        """
+        Open a table created by another process
+
+        :param tracked: Only for the creator and its child processes, which share its resource tracker
+        """
+        return cls(devices, name=name, create=False, tracked=tracked)
+
+    @property
+    def name(self) -> str:
+        return self._memory.name
+
+    def write(self, index: int, timestamp: float, registers: Dict[int, int]) -> None:
+        """
+        Store the registers of a reading, missing registers are stored as 0
+        """
+        buffer = self._buffer
+        offset = index * _ROW_SIZE
+        sequence, errors, _ = _ROW_HEADER.unpack_from(buffer, offset)
+        begin, end = _sequences(sequence)
+        _ROW_HEADER.pack_into(buffer, offset, begin, errors, 0.0)
+        _REGISTERS.pack_into(buffer, offset + _ROW_HEADER.size, *(registers.get(a, 0) for a in _ADDRESSES))
+        _ROW_HEADER.pack_into(buffer, offset, end, errors, timestamp)
+
+    def record_error(self, index: int) -> None:
+        buffer = self._buffer
+        offset = index * _ROW_SIZE
+        sequence, errors, timestamp = _ROW_HEADER.unpack_from(buffer, offset)
+        begin, end = _sequences(sequence)
+        _ROW_HEADER.pack_into(buffer, offset, begin, errors, timestamp)
+        _ROW_HEADER.pack_into(buffer, offset, end, errors + 1, timestamp)
+
+    def errors(self, index: int) -> int:
+        return _ROW_HEADER.unpack_from(self._buffer, index * _ROW_SIZE)[1]
+
+    def registers(self, index: int, timeout: float = _READ_TIMEOUT) -> Optional[Tuple[float, Tuple[int, ...]]]:
+        """
+        Timestamp and registers of the latest reading
+
+        :param timeout: Time to wait for a row being written (seconds)
+        :return: None if the device was never read, or if its row is still being written after `timeout`
+            (e.g. the worker died while writing it)
+        """
+        buffer = self._buffer
+        offset = index * _ROW_SIZE
+        deadline = time.monotonic() + timeout
+        while True:
+            sequence, _, timestamp = _ROW_HEADER.unpack_from(buffer, offset)
+            if not sequence & 1:
+                values = _REGISTERS.unpack_from(buffer, offset + _ROW_HEADER.size)
+                if _ROW_HEADER.unpack_from(buffer, offset)[0] == sequence:
+                    break
+            if time.monotonic() > deadline:
+                logger.warning(f"row {index} of the result table is still being written, skipped")
+                return None
+            # Being written
+            time.sleep(0)
+        if not timestamp:
+            return None
+        return timestamp, values
+
+    def read(self, index: int) -> Optional[Snapshot]:
+        """
+        Decoded latest reading, None if the device was never read or its row cannot be read (see `registers`)
+        """
+        row = self.registers(index)
+        if row is None:
+            return None
+        timestamp, values = row
+        decoded: Dict[str, Any] = {}
+        for offset, decoder in self._decoders:
+            decoder.decode(values, decoded, offset)
+        return Snapshot(timestamp=timestamp, values=decoded, registers=dict(zip(_ADDRESSES, values)))
+
+    def close(self) -> None:
+        self._memory.close()
+
+    def unlink(self) -> None:
+        self._memory.unlink()
+
+
+def _sequences(sequence: int) -> Tuple[int, int]:
+    # Odd sequence while writing a row and the next even one once written. The parity is set rather than
+    # incremented, so a row left odd by a worker that died while writing it is fixed by the next write
+    begin = (sequence | 1) & 0xFFFFFFFF
+    return begin, (begin + 1) & 0xFFFFFFFF
+
+
+def _create_controller(device: Device) -> RenogyRoverController:
+    return RenogyRoverController(port=device.port, address=device.address)
+
+
+def _work(
+    table_name: str,
+    devices: int,
+    shard: List[Tuple[int, Device]],
+    interval: float,
+    stop: Any,
+    controller_factory: Callable[[Device], RenogyRoverController],
+) -> None:
+    # Workers share the resource tracker of the collector, which unlinks the memory
+    table = ResultTable.attach(table_name, devices, tracked=True)
+    controllers: Dict[int, RenogyRoverController] = {}
+    try:
+        while not stop.is_set():
+            started = time.monotonic()
+            for index, device in shard:
+                if stop.is_set():
+                    break
+                try:
+                    controller = controllers.get(index)
+                    if controller is None:
+                        controller = controllers[index] = controller_factory(device)
+                    profile = controller.profile
+                    with controller.prefetch(*(profile.blocks if profile is not None else BLOCKS)) as registers:
+                        table.write(index, time.time(), registers)
+                except Exception as e:
+                    logger.warning(f"reading {device.port}@{device.address} failed: {e}")
+                    table.record_error(index)
+                    # Reconnect on the next cycle
+                    controllers.pop(index, None)
+            stop.wait(max(0.0, interval - (time.monotonic() - started)))
+    finally:
+        table.close()
+
+
+def shard_devices(devices: Sequence[Device], workers: int) -> List[List[Tuple[int, Device]]]:
+    """
+    Split the devices in at most `workers` shards, keeping the devices of a port together
+
+    :return: (index in `devices`, device) of each shard
+    """
+    ports: Dict[str, List[Tuple[int, Device]]] = {}
+    for index, device in enumerate(devices):
+        ports.setdefault(device.port, []).append((index, device))
+    shards: List[List[Tuple[int, Device]]] = [[] for _ in range(min(workers, len(ports)))]
+    # Biggest ports first, each to the least loaded shard
+    for port_devices in sorted(ports.values(), key=len, reverse=True):
+        min(shards, key=len).extend(port_devices)
+    return shards
+
+
+class Collector:
+    def __init__(
+        self,
+        devices: Sequence[Device],
+        workers: int = 4,
+        interval: float = 1.0,
+        check_interval: float = 1.0,
+        controller_factory: Callable[[Device], RenogyRoverController] = _create_controller,
+        start_method: Optional[str] = None,
+    ):
+        """
+        :param devices: Controllers to poll, the row of each device in the table is its index
+        :param workers: Maximum number of worker processes (at most one per port is useful)
+        :param interval: Time between the start of two poll cycles of a worker (seconds)
+        :param check_interval: Time between two checks of the supervisor (seconds)
+        :param controller_factory: Creates the controller of a device in the worker, must be picklable
+        :param start_method: multiprocessing start method (default is the platform's)
+        """
+        if len(set(devices)) != len(devices):
+            raise ValueError("devices must be unique")
+        self.devices = list(devices)
+        self.interval = interval
+        self.check_interval = check_interval
+        self.controller_factory = controller_factory
+        self.shards = shard_devices(self.devices, workers)
+        self.restarts = [0] * len(self.shards)
+
+        self._context: Any = multiprocessing.get_context(start_method)
+        self._index = {device: index for index, device in enumerate(self.devices)}
+        self._table: Optional[ResultTable] = None
+        self._processes: List[Any] = []
+        self._stop = self._context.Event()
+        self._supervisor_stop = threading.Event()
+        self._supervisor: Optional[threading.Thread] = None
+
+    @property
+    def table_name(self) -> str:
+        if self._table is None:
+            raise RuntimeError("collector is not started")
+        return self._table.name
+
+    def start(self) -> None:
+        if self._table is not None:
+            return
+        self._table = ResultTable(len(self.devices))
+        self._stop.clear()
+        self._processes = [self._spawn(i) for i in range(len(self.shards))]
+        self._supervisor_stop.clear()
+        self._supervisor = threading.Thread(target=self._supervise, name="pyrover-collector", daemon=True)
+        self._supervisor.start()
+
+    def stop(self, timeout: Optional[float] = 5.0) -> None:
+        if self._table is None:
+            return
+        self._supervisor_stop.set()
+        if self._supervisor is not None:
+            self._supervisor.join(timeout)
+            self._supervisor = None
+        self._stop.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self._processes = []
+        self._table.close()
+        self._table.unlink()
+        self._table = None
+
+    def supervise(self) -> int:
+        """
+        Restart the workers that died
+
+        :return: Number of workers restarted
+        """
+        restarted = 0
+        for i, process in enumerate(self._processes):
+            if process.is_alive() or self._stop.is_set():
+                continue
+            logger.warning(f"collector worker {i} exited ({process.exitcode}), restarting")
+            process.join()
+            self._processes[i] = self._spawn(i)
+            self.restarts[i] += 1
+            restarted += 1
+        return restarted
+
+    def snapshot(self, device: Device) -> Optional[Snapshot]:
+        """
+        Latest reading of a device, None if it was never read
+        """
+        if self._table is None:
+            raise RuntimeError("collector is not started")
+        return self._table.read(self._index[device])
+
+    def errors(self, device: Device) -> int:
+        if self._table is None:
+            raise RuntimeError("collector is not started")
+        return self._table.errors(self._index[device])
+
+    def fleet(self) -> Dict[Device, Optional[Snapshot]]:
+        """
+        Latest reading of every device
+        """
+        return {device: self.snapshot(device) for device in self.devices}
+
+    def _spawn(self, shard: int) -> Any:
+        assert self._table is not None
+        process = self._context.Process(
+            target=_work,
+            args=(
+                self._table.name,
+                len(self.devices),
+                self.shards[shard],
+                self.interval,
+                self._stop,
+                self.controller_factory,
+            ),
+            name=f"pyrover-collector-{shard}",
+            daemon=True,
+        )
+        process.start()
+        return process
+
+    def _supervise(self) -> None:
+        while not self._supervisor_stop.wait(self.check_interval):
+            self.supervise()
@@ -0,0 +1,241 @@
+"""
+Decoders working directly on raw register buffers
+
+Each decoder takes a buffer of 16 bit registers (an `array("H")`, a
+memoryview, a list...) and the index of the field's first register, so values
+can be decoded in place from a buffer filled by
+`RenogyRoverController.read_into()` without intermediate lists, e.g.:
+
+    telemetry = RegisterSpan(0x0100, 10)
+    buffer = array("H", bytes(2 * telemetry.number_of_registers))
+    decoder = BufferDecoder(telemetry)
+    values = {}
+    while True:
+        rover.read_into(telemetry, buffer)
+        decoder.decode(buffer, values)
+
+The decoders return the same values as the matching `RenogyRoverController`
+getters.
+"""
+
+from array import array
+from enum import IntFlag
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Type, Union
+
+from .registers import FIELD_REGISTERS, RegisterSpan
+from .types import (
+    BatteryType,
+    ChargingMethod,
+    ChargingModeController,
+    ChargingState,
+    Fault,
+    LoadWorkingModes,
+    ProductType,
+    Toggle,
+)
+
+Buffer = Union[array, memoryview, Sequence[int]]
+Decoder = Callable[[Buffer, int], Any]
+
+
+def u16(buffer: Buffer, index: int) -> int:
+    return buffer[index]
+
+
+def u32(buffer: Buffer, index: int) -> int:
+    return buffer[index] << 16 | buffer[index + 1]
+
+
+def high_byte(buffer: Buffer, index: int) -> int:
+    return buffer[index] >> 8
+
+
+def low_byte(buffer: Buffer, index: int) -> int:
+    return buffer[index] & 0x00FF
+
+
+def _scaled(scale: float) -> Decoder:
+    return lambda buffer, index: buffer[index] / scale
+
+
+def _scaled_u32(scale: float) -> Decoder:
+    return lambda buffer, index: (buffer[index] << 16 | buffer[index + 1]) / scale
+
+
+def _signed_magnitude(byte: int) -> int:
+    # b7 is the sign, b0-b6 the magnitude
+    value = byte & 0x7F
+    return -value if byte >> 7 == 1 else value
+
+
+def _enum(enum: Type[IntFlag], extract: Decoder, keep_unknown: bool = False) -> Decoder:
+    # Like the getters: values without a member decode to a combination of flags, invalid values to None
+    # (or to the raw value)
+    members = {member.value: member for member in enum}
+
+    def decode(buffer: Buffer, index: int) -> Any:
+        value = extract(buffer, index)
+        member = members.get(value)
+        if member is not None:
+            return member
+        try:
+            return enum(value)
+        except ValueError:
+            return value if keep_unknown else None
+
+    return decode
+
+
+def _bit(shift: int) -> Decoder:
+    return lambda buffer, index: buffer[index] >> shift & 0x01
+
+
+def _version(buffer: Buffer, index: int) -> str:
+    return f"{buffer[index] & 0x00FF}.{buffer[index + 1] >> 8}.{buffer[index + 1] & 0x00FF}"
+
+
+def _string(buffer: Buffer, index: int, number_of_registers: int = 8) -> str:
+    registers = buffer[index : index + number_of_registers]
+    return bytes(b for register in registers for b in (register >> 8, register & 0xFF)).decode("latin1").strip()
+
+
+def _faults(buffer: Buffer, index: int) -> List[Fault]:
+    faults = buffer[index] << 16 | buffer[index + 1]
+    return [fault for fault in Fault if faults & fault.value == fault.value]
+
+
+FIELD_DECODERS: Dict[str, Decoder] = {
+    # System information
+    "max_system_voltage": high_byte,
+    "rated_charging_current": low_byte,
+    "rated_discharging_current": high_byte,
+    "product_type": _enum(ProductType, low_byte, keep_unknown=True),
+    "product_model": _string,
+    "software_version": _version,
+    "hardware_version": _version,
+    "serial_number": u32,
+    "device_address": u16,
+    # Charging information
+    "battery_percentage": u16,
+    "battery_voltage": _scaled(10.0),
+    "charging_current": _scaled(100.0),
+    "controller_temperature": lambda buffer, index: _signed_magnitude(buffer[index] >> 8),
+    "battery_temperature": lambda buffer, index: _signed_magnitude(buffer[index] & 0x00FF),
+    # Load information
+    "load_voltage": _scaled(10.0),
+    "load_current": _scaled(100.0),
+    "load_power": u16,
+    # Solar panel information
+    "solar_voltage": _scaled(10.0),
+    "solar_current": _scaled(100.0),
+    "charging_power": u16,
+    # Historical information
+    "battery_min_voltage_today": _scaled(10.0),
+    "battery_max_voltage_today": _scaled(10.0),
+    "max_charging_current_today": _scaled(100.0),
+    "max_discharging_current_today": _scaled(100.0),
+    "max_charging_power_today": u16,
+    "min_charging_power_today": u16,
+    "charging_amphours_today": u16,
+    "discharging_amphours_today": u16,
+    "power_generation_today": _scaled(1_000.0),
+    "power_consumption_today": _scaled(1_000.0),
+    "total_operating_days": u16,
+    "total_battery_over_discharges": u16,
+    "total_battery_full_charges": u16,
+    "total_battery_charge_amphours": u32,
+    "total_battery_discharge_amphours": u32,
+    "cumulative_power_generation": _scaled_u32(1_000.0),
+    "cumulative_power_consumption": _scaled_u32(1_000.0),
+    "street_light_status": _enum(Toggle, lambda buffer, index: buffer[index] >> 15),
+    "street_light_brightness": lambda buffer, index: buffer[index] >> 8 & 0x7F,
+    "charging_state": _enum(ChargingState, low_byte),
+    # Controller fault information
+    "controller_fault_information": _faults,
+    # Battery parameter settings
+    "nominal_battery_capacity": u16,
+    "system_voltage_setting": high_byte,
+    "recognized_voltage": low_byte,
+    "battery_type": _enum(BatteryType, u16),
+    "over_voltage_threshold": _scaled(10.0),
+    "charging_voltage_limit": _scaled(10.0),
+    "equalizing_charging_voltage": _scaled(10.0),
+    "boost_charging_voltage": _scaled(10.0),
+    "floating_voltage": _scaled(10.0),
+    "boost_charging_recovery_voltage": _scaled(10.0),
+    "over_discharge_recovery_voltage": _scaled(10.0),
+    "under_voltage_warning_level": _scaled(10.0),
+    "over_discharge_voltage": _scaled(10.0),
+    "discharging_limit_voltage": _scaled(10.0),
+    "end_of_charge_soc": high_byte,
+    "end_of_discharge_soc": low_byte,
+    "over_discharge_time_delay": u16,
+    "equalizing_charging_time": u16,
+    "boost_charging_time": u16,
+    "equalizing_charging_interval": u16,
+    "temperature_compensation_factor": u16,
+    # Load operating duration and power settings
+    "first_stage_operating_duration": u16,
+    "first_stage_operating_power": u16,
+    "second_stage_operating_duration": u16,
+    "second_stage_operating_power": u16,
+    "third_stage_operating_duration": u16,
+    "third_stage_operating_power": u16,
+    "morning_on_operating_duration": u16,
+    "morning_on_operating_power": u16,
+    # Mode setting
+    "load_working_mode": _enum(LoadWorkingModes, u16),
+    "light_control_delay": u16,
+    "light_control_voltage": u16,
+    "led_load_current_setting": lambda buffer, index: buffer[index] * 10 / 1_000.0,
+    # Special power control
+    "charging_mode_controlled_by": _enum(ChargingModeController, _bit(10)),
+    "special_power_control_state": _enum(Toggle, _bit(9)),
+    "each_night_on_function_state": _enum(Toggle, _bit(8)),
+    "no_charging_below_freezing": _enum(Toggle, _bit(2)),
+    "charging_method": _enum(ChargingMethod, _bit(0)),
+}
+
+
+class BufferDecoder:
+    """
+    Decodes the fields of a register span from a buffer holding that span
+    """
+
+    def __init__(self, span: RegisterSpan, fields: Optional[Sequence[str]] = None):
+        """
+        :param span: Span held by the buffers, index 0 is `span.address`
+        :param fields: Fields to decode (default is every field contained in the span)
+        """
+        if fields is None:
+            fields = [name for name, field_span in FIELD_REGISTERS.items() if span.contains(field_span)]
+        for name in fields:
+            if not span.contains(FIELD_REGISTERS[name]):
+                raise ValueError(f"field ({name}) is not in span {span}")
+        self.span = span
+        self.fields = list(fields)
+        self._decoders: List[Tuple[str, int, Decoder]] = [
+            (name, FIELD_REGISTERS[name].address - span.address, FIELD_DECODERS[name]) for name in self.fields
+        ]
+        self._index = {name: (index, decode) for name, index, decode in self._decoders}
+
+    def decode(self, buffer: Buffer, values: Optional[Dict[str, Any]] = None, offset: int = 0) -> Dict[str, Any]:
+        """
+        Decode every field, reusing `values` if given
+
+        :param buffer: Registers of the span starting at `offset`
+        :param values: Dict updated in place
+        :param offset: Index of the span's first register in the buffer
+        """
+        if values is None:
+            values = {}
+        for name, index, decode in self._decoders:
+            values[name] = decode(buffer, offset + index)
+        return values
+
+    def value(self, buffer: Buffer, name: str, offset: int = 0) -> Any:
+        """
+        Decode a single field
+        """
+        index, decode = self._index[name]
+        return decode(buffer, offset + index)
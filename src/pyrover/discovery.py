@@ -0,0 +1,158 @@
+"""
+Find the controllers on a bus without knowing their address or baud rate
+
+Each address is first probed with a single register read and a short timeout
+(the time the frames take at the baud rate plus a margin), so absent
+addresses cost a few tens of milliseconds instead of the default 0.5 s. Only
+the addresses that answer have their system information block (0x000A-0x001A)
+read to identify them, e.g.:
+
+    for device in scan("/dev/ttyUSB0"):
+        print(device.address, device.baudrate, device.model, device.serial_number)
+
+Modbus RTU is half-duplex with a single master, so the probes of one bus are
+sent one after the other and a scan lasts as long as the silent addresses take
+to time out. By default only the factory baud rate (9600) is tried, which takes
+about 17 seconds on a bus without any controller. Scanning every supported baud
+rate (`baudrates=BAUDRATES`) takes about 3 minutes on such a bus, it stops at
+the first baud rate some devices answer at. `scan_ports()` scans several ports
+in parallel.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Sequence, Union
+import logging
+
+from .registers import SYSTEM_INFO_BLOCK
+from .renogy_rover import RenogyRoverController
+from .types import ProductType
+
+logger = logging.getLogger(__name__)
+
+# Valid Modbus slave addresses
+ADDRESSES = range(1, 248)
+# Baud rates supported by the Renogy controllers, the factory default first
+BAUDRATES = (9600, 19200, 4800, 2400, 115200, 57600, 38400, 1200)
+# Baud rates tried by default: the factory default
+DEFAULT_BAUDRATES = BAUDRATES[:1]
+
+# Modbus RTU characters: start bit, 8 data bits, parity (or a second stop bit), stop bit
+_BITS_PER_CHARACTER = 11
+# Request and response frames of a single register read: address, function, payload, CRC
+_PROBE_BYTES = 8 + 7
+# Request and response frames of the system information block read
+_IDENTIFY_BYTES = 8 + 5 + 2 * SYSTEM_INFO_BLOCK.number_of_registers
+
+
+class DiscoveredDevice(NamedTuple):
+    port: str
+    address: int
+    baudrate: int
+    model: str
+    serial_number: int
+    product_type: Union[ProductType, int]
+    software_version: str
+
+
+def scan(
+    port: str,
+    addresses: Iterable[int] = ADDRESSES,
+    baudrates: Sequence[int] = DEFAULT_BAUDRATES,
+    probe_timeout: float = 0.05,
+    identify_timeout: float = 0.5,
+    all_baudrates: bool = False,
+) -> List[DiscoveredDevice]:
+    """
+    Find the controllers answering on a serial port
+
+    :param port: Serial port to scan
+    :param addresses: Slave addresses to probe
+    :param baudrates: Baud rates to try, in order (`BAUDRATES` for every supported one)
+    :param probe_timeout: Time allowed for the single register probe on top of the transmission of its frames,
+        which grows at low baud rates (seconds)
+    :param identify_timeout: Same for the system information read of the devices that answered (seconds)
+    :param all_baudrates: Keep scanning the other baud rates once devices were found (devices on a bus
+        normally share one baud rate)
+    :return: The devices found, by baud rate and address
+    """
+    addresses = list(addresses)
+    found: List[DiscoveredDevice] = []
+    controller = RenogyRoverController(port=port, address=addresses[0] if addresses else 1, timeout=probe_timeout)
+    serial = controller.device.serial
+    assert serial is not None
+    logger.info(f"scanning {port}, up to {scan_time(len(addresses), baudrates, probe_timeout):.0f}s if nothing answers")
+    for baudrate in baudrates:
+        serial.baudrate = baudrate
+        timeout = _frame_time(_PROBE_BYTES, baudrate) + probe_timeout
+        responding = [address for address in addresses if _probe(controller, address, timeout)]
+        logger.info(f"{port} at {baudrate} bauds: {len(responding)} device(s) answered")
+        for address in responding:
+            try:
+                timeout = _frame_time(_IDENTIFY_BYTES, baudrate) + identify_timeout
+                found.append(_identify(controller, address, baudrate, timeout))
+            except Exception as e:
+                logger.warning(f"{port}@{address} answered at {baudrate} bauds but could not be identified: {e}")
+        if found and not all_baudrates:
+            break
+    return found
+
+
+def scan_ports(ports: Sequence[str], max_concurrency: int = 4, **kwargs) -> Dict[str, List[DiscoveredDevice]]:
+    """
+    Scan several serial ports in parallel, see `scan()` for the keyword arguments
+
+    :return: The devices found on each port
+    """
+    if max_concurrency < 1:
+        raise ValueError(f"max_concurrency ({max_concurrency}) must be at least 1")
+    if not ports:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(ports))) as executor:
+        return dict(zip(ports, executor.map(lambda port: scan(port, **kwargs), ports)))
+
+
+def scan_time(
+    addresses: int = len(ADDRESSES), baudrates: Sequence[int] = DEFAULT_BAUDRATES, probe_timeout: float = 0.05
+) -> float:
+    """
+    Duration of a `scan()` of a bus where no device answers (seconds)
+    """
+    return sum(addresses * (_frame_time(_PROBE_BYTES, baudrate) + probe_timeout) for baudrate in baudrates)
+
+
+def _frame_time(number_of_bytes: int, baudrate: int) -> float:
+    # Transmission time of frames (seconds)
+    return number_of_bytes * _BITS_PER_CHARACTER / baudrate
+
+
+def _set_timeout(controller: RenogyRoverController, timeout: float) -> None:
+    serial = controller.device.serial
+    assert serial is not None
+    serial.timeout = timeout
+
+
+def _probe(controller: RenogyRoverController, address: int, timeout: float) -> bool:
+    controller.device.address = address
+    _set_timeout(controller, timeout)
+    try:
+        controller.device_address()
+    except Exception as e:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"no answer from {address}: {e}")
+        return False
+    return True
+
+
+def _identify(controller: RenogyRoverController, address: int, baudrate: int, timeout: float) -> DiscoveredDevice:
+    controller.device.address = address
+    _set_timeout(controller, timeout)
+    with controller.prefetch(SYSTEM_INFO_BLOCK):
+        return DiscoveredDevice(
+            port=controller.port,
+            address=address,
+            baudrate=baudrate,
+            model=controller.product_model(),
+            serial_number=controller.serial_number(),
+            product_type=controller.product_type(),
+            software_version=controller.software_version(),
+        )
@@ -0,0 +1,174 @@
+"""
+Metadata about the values returned by `RenogyRoverController`
+
+Describes the unit and kind of value of each field so exporters (message
+bus, databases...) can derive their schema from a single place.
+"""
+
+from enum import IntFlag
+from typing import Any, Dict, List, NamedTuple, Optional
+import typing
+
+from .registers import FIELD_REGISTERS
+from .renogy_rover import RenogyRoverController
+
+
+class FieldInfo(NamedTuple):
+    name: str
+    # Python type of the value: "int", "float", "str", "enum" or "list"
+    kind: str
+    unit: Optional[str] = None
+    # "measurement" for instantaneous values, "total_increasing" for counters
+    state_class: Optional[str] = None
+    description: str = ""
+
+    @property
+    def numeric(self) -> bool:
+        """
+        Whether the value can be stored as a number (enums are stored as their integer value)
+        """
+        return self.kind in ("int", "float", "enum")
+
+
+_UNITS: Dict[str, str] = {
+    "max_system_voltage": "V",
+    "rated_charging_current": "A",
+    "rated_discharging_current": "A",
+    "battery_percentage": "%",
+    "battery_voltage": "V",
+    "charging_current": "A",
+    "controller_temperature": "°C",
+    "battery_temperature": "°C",
+    "load_voltage": "V",
+    "load_current": "A",
+    "load_power": "W",
+    "solar_voltage": "V",
+    "solar_current": "A",
+    "charging_power": "W",
+    "battery_min_voltage_today": "V",
+    "battery_max_voltage_today": "V",
+    "max_charging_current_today": "A",
+    "max_discharging_current_today": "A",
+    "max_charging_power_today": "W",
+    "min_charging_power_today": "W",
+    "charging_amphours_today": "Ah",
+    "discharging_amphours_today": "Ah",
+    "power_generation_today": "kWh",
+    "power_consumption_today": "kWh",
+    "total_operating_days": "d",
+    "total_battery_charge_amphours": "Ah",
+    "total_battery_discharge_amphours": "Ah",
+    "cumulative_power_generation": "kWh",
+    "cumulative_power_consumption": "kWh",
+    "street_light_brightness": "%",
+    "nominal_battery_capacity": "Ah",
+    "system_voltage_setting": "V",
+    "recognized_voltage": "V",
+    "over_voltage_threshold": "V",
+    "charging_voltage_limit": "V",
+    "equalizing_charging_voltage": "V",
+    "boost_charging_voltage": "V",
+    "floating_voltage": "V",
+    "boost_charging_recovery_voltage": "V",
+    "over_discharge_recovery_voltage": "V",
+    "under_voltage_warning_level": "V",
+    "over_discharge_voltage": "V",
+    "discharging_limit_voltage": "V",
+    "end_of_charge_soc": "%",
+    "end_of_discharge_soc": "%",
+    "over_discharge_time_delay": "s",
+    "equalizing_charging_time": "min",
+    "boost_charging_time": "min",
+    "equalizing_charging_interval": "d",
+    "first_stage_operating_duration": "h",
+    "first_stage_operating_power": "%",
+    "second_stage_operating_duration": "h",
+    "second_stage_operating_power": "%",
+    "third_stage_operating_duration": "h",
+    "third_stage_operating_power": "%",
+    "morning_on_operating_duration": "h",
+    "morning_on_operating_power": "%",
+    "light_control_delay": "min",
+    "light_control_voltage": "V",
+    "led_load_current_setting": "A",
+}
+
+# Instantaneous readings
+_MEASUREMENTS = (
+    "battery_percentage",
+    "battery_voltage",
+    "charging_current",
+    "controller_temperature",
+    "battery_temperature",
+    "load_voltage",
+    "load_current",
+    "load_power",
+    "solar_voltage",
+    "solar_current",
+    "charging_power",
+)
+
+# Counters that only go up (the "today" counters reset daily)
+_COUNTERS = (
+    "charging_amphours_today",
+    "discharging_amphours_today",
+    "power_generation_today",
+    "power_consumption_today",
+    "total_operating_days",
+    "total_battery_over_discharges",
+    "total_battery_full_charges",
+    "total_battery_charge_amphours",
+    "total_battery_discharge_amphours",
+    "cumulative_power_generation",
+    "cumulative_power_consumption",
+)
+
+
+def _kind(annotation: Any) -> str:
+    if annotation in (int, float, str):
+        return annotation.__name__
+    if typing.get_origin(annotation) is list:
+        return "list"
+    # Union[SomeEnum, None] or Union[SomeEnum, int]
+    if any(isinstance(arg, type) and issubclass(arg, IntFlag) for arg in typing.get_args(annotation)):
+        return "enum"
+    raise TypeError(f"unsupported field type ({annotation})")
+
+
+def _build_fields() -> Dict[str, FieldInfo]:
+    fields = {}
+    for name in FIELD_REGISTERS:
+        getter = getattr(RenogyRoverController, name)
+        annotation = typing.get_type_hints(getter)["return"]
+        if name in _MEASUREMENTS:
+            state_class: Optional[str] = "measurement"
+        elif name in _COUNTERS:
+            state_class = "total_increasing"
+        else:
+            state_class = None
+        fields[name] = FieldInfo(
+            name=name,
+            kind=_kind(annotation),
+            unit=_UNITS.get(name),
+            state_class=state_class,
+            description=" ".join((getter.__doc__ or "").split()),
+        )
+    return fields
+
+
+FIELDS: Dict[str, FieldInfo] = _build_fields()
+
+
+def numeric_fields() -> List[FieldInfo]:
+    return [field for field in FIELDS.values() if field.numeric]
+
+
+def encode_value(value: Any) -> Any:
+    """
+    JSON friendly version of a field value (enums become their name, combinations without one their value)
+    """
+    if isinstance(value, IntFlag):
+        return value.name if value.name is not None else int(value)
+    if isinstance(value, list):
+        return [encode_value(v) for v in value]
+    return value
@@ -0,0 +1,220 @@
+"""
+Time-aligned telemetry snapshots of a fleet of controllers
+
+Reading the controllers one after the other spreads a fleet "snapshot" over
+seconds, long enough for a cloud to make panels look different when they are
+not. `FleetSampler` reads the telemetry block (0x0100-0x0109) of every device
+at the same instant: one thread per serial port, all released at a common
+start time, reading their devices back to back without other transactions in
+between, e.g.:
+
+    sampler = FleetSampler([Device("/dev/ttyUSB0", 1), Device("/dev/ttyUSB0", 2), Device("/dev/ttyUSB1", 1)])
+    snapshot = sampler.sample()
+    print(snapshot.skew)
+    for device, sample in snapshot.samples.items():
+        print(device, sample.timestamp, sample.values["solar_voltage"])
+
+Each sample is timestamped at the middle of its transaction, the best
+estimate of when the controller latched the registers.
+"""
+
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+import logging
+import threading
+import time
+
+from .decoders import BufferDecoder
+from .registers import RegisterSpan
+from .renogy_rover import RenogyRoverController
+from .rollout import Device
+
+logger = logging.getLogger(__name__)
+
+TELEMETRY_BLOCK = RegisterSpan(0x0100, 10)  # 0x0100-0x0109
+
+
+class AlignedSample(NamedTuple):
+    device: Device
+    # Acquisition time, the middle of the transaction (seconds since the epoch)
+    timestamp: float
+    # Duration of the transaction, the uncertainty of the timestamp (seconds)
+    duration: float
+    # Time after the first acquisition of the snapshot (seconds)
+    skew: float
+    values: Dict[str, Any]
+    registers: Dict[int, int]
+    error: Optional[str] = None
+
+
+class FleetSnapshot(NamedTuple):
+    # Time the ports were released (seconds since the epoch)
+    trigger: float
+    samples: Dict[Device, AlignedSample]
+    # Time between the first and the last acquisition (seconds)
+    skew: float
+
+    @property
+    def errors(self) -> Dict[Device, str]:
+        return {device: sample.error for device, sample in self.samples.items() if sample.error is not None}
+
+
+def _create_controller(device: Device) -> RenogyRoverController:
+    return RenogyRoverController(port=device.port, address=device.address)
+
+
+class FleetSampler:
+    def __init__(
+        self,
+        devices: Sequence[Device],
+        span: RegisterSpan = TELEMETRY_BLOCK,
+        lead_time: float = 0.01,
+        spin_time: float = 0.002,
+        controller_factory: Callable[[Device], RenogyRoverController] = _create_controller,
+    ):
+        """
+        :param devices: Controllers to sample, devices sharing a port are read in this order
+        :param span: Registers read from each device
+        :param lead_time: Delay between scheduling a snapshot and releasing the ports, so every
+            port thread is waiting when the time comes (seconds)
+        :param spin_time: Final part of the wait spent polling the clock instead of sleeping, for a
+            more precise release (seconds)
+        :param controller_factory: Creates the controller of a device
+        """
+        if len(set(devices)) != len(devices):
+            raise ValueError("devices must be unique")
+        self.devices = list(devices)
+        self.span = span
+        self.lead_time = lead_time
+        self.spin_time = spin_time
+        self.latest: Optional[FleetSnapshot] = None
+
+        self._decoder = BufferDecoder(span)
+        self._ports: Dict[str, List[Tuple[Device, RenogyRoverController]]] = {}
+        for device in self.devices:
+            self._ports.setdefault(device.port, []).append((device, controller_factory(device)))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._subscribers: List[Any] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sample(self) -> FleetSnapshot:
+        """
+        Read every device as close to the same instant as possible
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=max(1, len(self._ports)), thread_name_prefix="pyrover-fleet"
+            )
+        # Wall clock time of the performance counter's origin, to timestamp with the precise counter
+        origin = time.time() - time.perf_counter()
+        release = time.perf_counter() + self.lead_time
+        futures = [self._executor.submit(self._read_port, controllers, release) for controllers in self._ports.values()]
+        readings = [reading for future in futures for reading in future.result()]
+
+        acquired = [reading[1] for reading in readings if reading[5] is None]
+        first = min(acquired) if acquired else release
+        samples = {
+            device: AlignedSample(
+                device=device,
+                timestamp=origin + middle,
+                duration=duration,
+                skew=middle - first if error is None else 0.0,
+                values=values,
+                registers=registers,
+                error=error,
+            )
+            for device, middle, duration, values, registers, error in readings
+        }
+        snapshot = FleetSnapshot(
+            trigger=origin + release,
+            samples={device: samples[device] for device in self.devices},
+            skew=max(acquired) - first if acquired else 0.0,
+        )
+        self.publish(snapshot)
+        return snapshot
+
+    def subscribe(self, subscriber: Any) -> None:
+        """
+        Call `subscriber` with every new `FleetSnapshot`
+        """
+        self._subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber: Any) -> None:
+        self._subscribers.remove(subscriber)
+
+    def publish(self, snapshot: FleetSnapshot) -> None:
+        self.latest = snapshot
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber(snapshot)
+            except Exception:
+                logger.exception(f"fleet subscriber failed ({subscriber})")
+
+    def start(self, interval: float = 1.0) -> None:
+        """
+        Take a snapshot every `interval` seconds in a background thread until `stop()` is called
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="pyrover-fleet-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def close(self) -> None:
+        self.stop()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _run(self, interval: float) -> None:
+        next_sample = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                logger.warning(f"fleet sample failed: {e}")
+            next_sample += interval
+            delay = next_sample - time.monotonic()
+            if delay < 0:
+                next_sample = time.monotonic()
+                delay = 0
+            self._stop.wait(delay)
+
+    def _read_port(self, controllers: List[Tuple[Device, RenogyRoverController]], release: float) -> List[Any]:
+        # Device, acquisition time (performance counter), duration, values, registers and error of each device
+        buffer = array("H", bytes(2 * self.span.number_of_registers))
+        readings = []
+        # Hold the bus so the devices are read back to back
+        with controllers[0][1].lock:
+            _wait_until(release, self.spin_time)
+            for device, controller in controllers:
+                started = time.perf_counter()
+                try:
+                    controller.read_into(self.span, buffer)
+                except Exception as e:
+                    ended = time.perf_counter()
+                    logger.warning(f"fleet sample of {device.port}@{device.address} failed: {e}")
+                    readings.append((device, (started + ended) / 2, ended - started, {}, {}, str(e)))
+                    continue
+                ended = time.perf_counter()
+                registers = dict(zip(range(self.span.address, self.span.end), buffer))
+                values = self._decoder.decode(buffer)
+                readings.append((device, (started + ended) / 2, ended - started, values, registers, None))
+        return readings
+
+
+def _wait_until(deadline: float, spin_time: float) -> None:
+    # Sleep until shortly before the deadline (performance counter) then spin for precision
+    remaining = deadline - time.perf_counter() - spin_time
+    if remaining > 0:
+        time.sleep(remaining)
+    while time.perf_counter() < deadline:
+        pass
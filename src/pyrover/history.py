@@ -0,0 +1,234 @@
+"""
+Daily history stored by the controller
+
+Besides the "today" registers (0x010B-0x0114) the controller keeps one record
+per day in flash, from 0xF000. The protocol documents in docs/ only give the
+size of the history block ("20 words" in V1.7, "20 bytes" in ROVER MODBUS), so
+the layout used here is an assumption that was not checked against a
+controller: reading 0xF000 + n returns the record of n days ago, starting with
+10 registers laid out like 0x010B-0x0114, and reading more registers returns
+the records of the days before it back to back. `day_registers` sets the size
+of a record if a controller turns out to use another one. A few transactions
+fetch weeks of history, e.g.:
+
+    sync = HistorySync(rover, "/var/lib/pyrover/history.json")
+    for record in sync.sync():
+        print(record.date, record.values["power_generation"])
+
+Records are identified by their operating day number (`total_operating_days`
+on the day they were recorded) and the sync cursor, the last day synced, is
+stored in a local file so each sync only fetches the days completed since the
+previous one.
+"""
+
+from array import array
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+import json
+import logging
+import os
+
+import minimalmodbus
+
+from .decoders import FIELD_DECODERS
+from .registers import FIELD_REGISTERS, RegisterSpan
+from .renogy_rover import RenogyRoverController
+
+logger = logging.getLogger(__name__)
+
+HISTORY_ADDRESS = 0xF000
+# Size of a daily record, assumed (see above)
+DAY_REGISTERS = 10
+# Registers of a Modbus read at most
+MAX_READ_REGISTERS = 125
+# 12 days of 10 registers fit in a Modbus read
+DAYS_PER_READ = MAX_READ_REGISTERS // DAY_REGISTERS
+
+# Fields of a daily record: the "today" fields without the suffix, e.g. "power_generation"
+_DECODERS = [
+    (name[: -len("_today")], span.address - FIELD_REGISTERS["battery_min_voltage_today"].address, FIELD_DECODERS[name])
+    for name, span in FIELD_REGISTERS.items()
+    if name.endswith("_today")
+]
+
+
+class DailyRecord(NamedTuple):
+    # Operating day number of the record
+    day: int
+    days_ago: int
+    # Estimated from the time of the read, the controller has no clock
+    date: date
+    values: Dict[str, Any]
+
+
+def decode_day(buffer: Any, offset: int = 0) -> Dict[str, Any]:
+    """
+    Values of a daily record, same scaling as the matching "today" getters
+    """
+    return {name: decode(buffer, offset + index) for name, index, decode in _DECODERS}
+
+
+def read_history(
+    controller: RenogyRoverController,
+    first: int,
+    days: int,
+    days_per_read: Optional[int] = None,
+    day_registers: int = DAY_REGISTERS,
+) -> List[Dict[str, Any]]:
+    """
+    Read the records of `days` consecutive days, most recent first
+
+    :param first: Days ago of the most recent record (0 is today)
+    :param days: Number of records
+    :param days_per_read: Records fetched per transaction (default is as many as fit in a read)
+    :param day_registers: Size of a record, the first 10 registers are decoded
+    """
+    if day_registers < DAY_REGISTERS:
+        raise ValueError(f"day_registers ({day_registers}) must be at least {DAY_REGISTERS}")
+    most = MAX_READ_REGISTERS // day_registers
+    days_per_read = most if days_per_read is None else days_per_read
+    if not 1 <= days_per_read <= most:
+        raise ValueError(f"days_per_read ({days_per_read}) must be between 1 and {most}")
+    buffer = array("H", bytes(2 * day_registers * days))
+    for start in range(0, days, days_per_read):
+        count = min(days_per_read, days - start)
+        span = RegisterSpan(HISTORY_ADDRESS + first + start, count * day_registers)
+        controller.read_into(span, buffer, start * day_registers)
+    return [decode_day(buffer, i * day_registers) for i in range(days)]
+
+
+class HistorySync:
+    """
+    Incremental download of the daily history of a controller
+    """
+
+    def __init__(
+        self,
+        controller: RenogyRoverController,
+        path: str,
+        key: Optional[str] = None,
+        max_days: int = 30,
+        days_per_read: Optional[int] = None,
+        include_today: bool = False,
+        day_registers: int = DAY_REGISTERS,
+    ):
+        """
+        :param controller: Controller to read
+        :param path: JSON file holding the cursors, can be shared by several controllers
+        :param key: Key of the controller's cursor in the file (default is its serial number)
+        :param max_days: Number of days fetched by the first sync, or after the cursor was lost
+        :param days_per_read: Records fetched per transaction (default is as many as fit in a read), lowered to 1
+            if the controller rejects block reads
+        :param include_today: Also return the record of the current day, which is still being updated
+        :param day_registers: Size of a record, see `read_history()`
+        """
+        self.controller = controller
+        self.path = path
+        self.key = key
+        self.max_days = max_days
+        self.days_per_read = MAX_READ_REGISTERS // day_registers if days_per_read is None else days_per_read
+        self.include_today = include_today
+        self.day_registers = day_registers
+
+    @property
+    def cursor(self) -> Optional[int]:
+        """
+        Operating day number of the last synced record, None before the first sync
+        """
+        if self.key is None:
+            self.key = str(self.controller.serial_number())
+        return self._load().get(self.key)
+
+    def pending(self, today: Optional[date] = None) -> List[DailyRecord]:
+        """
+        Read the records newer than the cursor, oldest first, without moving the cursor
+
+        :param today: Date of the current day on the controller (default is the local date)
+        """
+        cursor = self.cursor
+        synced = cursor is not None
+        current_day = self.controller.total_operating_days()
+        if cursor is not None and cursor > current_day:
+            logger.warning(f"operating days went back from {cursor} to {current_day}, history was cleared")
+            cursor = None
+        # Days ago of the newest and oldest records to read, the days up to the cursor are complete and synced
+        newest = 0 if self.include_today else 1
+        missing = current_day - 1 - (cursor or 0)
+        if synced and missing > self.max_days:
+            logger.warning(
+                f"{missing - self.max_days} day(s) of history before the last {self.max_days} days skipped "
+                "(max_days), they will not be synced"
+            )
+        oldest = min(self.max_days, missing)
+        if oldest < newest:
+            return []
+        values = self._read(newest, oldest - newest + 1)
+        today = today or date.today()
+        records = [
+            DailyRecord(current_day - days_ago, days_ago, today - timedelta(days=days_ago), record)
+            for days_ago, record in zip(range(newest, oldest + 1), values)
+        ]
+        records.reverse()
+        return records
+
+    def commit(self, records: List[DailyRecord]) -> None:
+        """
+        Move the cursor past the records, which will not be returned by `pending()` again
+        """
+        completed = [record.day for record in records if record.days_ago > 0]
+        if not completed:
+            return
+        cursors = self._load()
+        assert self.key is not None
+        cursors[self.key] = max(completed)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + ".tmp", "w") as file:
+            json.dump(cursors, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(self.path + ".tmp", self.path)
+
+    def sync(
+        self, send: Optional[Callable[[List[DailyRecord]], Any]] = None, today: Optional[date] = None
+    ) -> List[DailyRecord]:
+        """
+        Read the new records and move the cursor past them
+
+        :param send: Called with the new records before the cursor moves, the cursor stays if it raises
+        :return: The new records, oldest first
+        """
+        records = self.pending(today)
+        if records and send is not None:
+            send(records)
+        self.commit(records)
+        return records
+
+    def _read(self, first: int, days: int) -> List[Dict[str, Any]]:
+        if self.days_per_read > 1:
+            try:
+                return read_history(self.controller, first, days, self.days_per_read, self.day_registers)
+            except minimalmodbus.IllegalRequestError as e:
+                logger.warning(f"block read of the history rejected ({e}), reading one day per transaction")
+                self.days_per_read = 1
+        records: List[Dict[str, Any]] = []
+        for days_ago in range(first, first + days):
+            try:
+                records.extend(read_history(self.controller, days_ago, 1, 1, self.day_registers))
+            except minimalmodbus.IllegalRequestError:
+                # Past the oldest record stored
+                logger.info(f"no history before {days_ago} days ago")
+                break
+        return records
+
+    def _load(self) -> Dict[str, int]:
+        try:
+            with open(self.path) as file:
+                cursors = json.load(file)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            logger.warning(f"ignoring invalid history cursor file: {e}")
+            return {}
+        return {key: int(day) for key, day in cursors.items()}
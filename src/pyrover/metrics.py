@@ -0,0 +1,187 @@
+"""
+Derived energy metrics maintained incrementally from poller snapshots
+
+Every update costs O(1): integrals use the trapezoidal rule between two
+consecutive samples, averages are time-weighted EWMAs and daily counters are
+reset when the local calendar day changes, e.g.:
+
+    metrics = EnergyMetrics()
+    poller.subscribe(metrics.update)
+    ...
+    metrics.values()["charging_wh_today"]
+"""
+
+from datetime import date
+from typing import Any, Dict, NamedTuple, Optional
+import math
+
+from .poller import Snapshot
+
+
+class Reconciliation(NamedTuple):
+    """
+    A device counter compared with the value integrated from samples
+    """
+
+    device: float
+    integrated: float
+
+    @property
+    def error(self) -> float:
+        return self.integrated - self.device
+
+    @property
+    def ratio(self) -> Optional[float]:
+        return self.integrated / self.device if self.device else None
+
+
+class EnergyMetrics:
+    def __init__(self, time_constant: float = 300.0, max_gap: float = 300.0):
+        """
+        :param time_constant: Time constant of the moving averages (seconds)
+        :param max_gap: Samples further apart than this are not integrated (seconds)
+        """
+        self.time_constant = time_constant
+        self.max_gap = max_gap
+
+        # Instantaneous
+        self.efficiency: Optional[float] = None
+        self.net_power: float = 0.0
+        self.net_current: float = 0.0
+
+        # Moving averages
+        self.charging_power_ewma: Optional[float] = None
+        self.net_power_ewma: Optional[float] = None
+        self.efficiency_ewma: Optional[float] = None
+
+        # Integrals since the first sample
+        self.solar_wh = 0.0
+        self.charging_wh = 0.0
+        self.load_wh = 0.0
+        self.charging_ah = 0.0
+        self.load_ah = 0.0
+
+        # Daily counters
+        self.day: Optional[date] = None
+        self.charging_wh_today = 0.0
+        self.load_wh_today = 0.0
+        self.charging_ah_today = 0.0
+        self.peak_charging_power_today = 0
+
+        self._previous: Optional[Dict[str, Any]] = None
+        self._previous_timestamp = 0.0
+        self._first_cumulative_generation: Optional[float] = None
+        self._device: Dict[str, float] = {}
+
+    def update(self, snapshot: Snapshot) -> None:
+        """
+        Fold a new snapshot into the metrics
+        """
+        values = snapshot.values
+        solar_power = values["solar_voltage"] * values["solar_current"]
+        charging_power = values["charging_power"]
+        load_power = values["load_power"]
+
+        self.efficiency = charging_power / solar_power if solar_power > 0 else None
+        self.net_power = charging_power - load_power
+        self.net_current = values["charging_current"] - values["load_current"]
+
+        day = date.fromtimestamp(snapshot.timestamp)
+        if day != self.day:
+            self.day = day
+            self.charging_wh_today = 0.0
+            self.load_wh_today = 0.0
+            self.charging_ah_today = 0.0
+            self.peak_charging_power_today = 0
+        self.peak_charging_power_today = max(self.peak_charging_power_today, charging_power)
+
+        previous = self._previous
+        dt = snapshot.timestamp - self._previous_timestamp
+        if previous is None:
+            self.charging_power_ewma = charging_power
+            self.net_power_ewma = self.net_power
+            self.efficiency_ewma = self.efficiency
+        elif 0 < dt <= self.max_gap:
+            hours = dt / 3600.0
+            solar_wh = (previous["solar_voltage"] * previous["solar_current"] + solar_power) / 2 * hours
+            charging_wh = (previous["charging_power"] + charging_power) / 2 * hours
+            load_wh = (previous["load_power"] + load_power) / 2 * hours
+            charging_ah = (previous["charging_current"] + values["charging_current"]) / 2 * hours
+            load_ah = (previous["load_current"] + values["load_current"]) / 2 * hours
+
+            self.solar_wh += solar_wh
+            self.charging_wh += charging_wh
+            self.load_wh += load_wh
+            self.charging_ah += charging_ah
+            self.load_ah += load_ah
+            self.charging_wh_today += charging_wh
+            self.load_wh_today += load_wh
+            self.charging_ah_today += charging_ah
+
+            alpha = 1.0 - math.exp(-dt / self.time_constant)
+            self.charging_power_ewma = _ewma(self.charging_power_ewma, charging_power, alpha)
+            self.net_power_ewma = _ewma(self.net_power_ewma, self.net_power, alpha)
+            self.efficiency_ewma = _ewma(self.efficiency_ewma, self.efficiency, alpha)
+
+        self._previous = values
+        self._previous_timestamp = snapshot.timestamp
+
+        # Device counters used for reconciliation
+        for key in ("power_generation_today", "charging_amphours_today", "cumulative_power_generation"):
+            if key in values:
+                self._device[key] = values[key]
+        if self._first_cumulative_generation is None and "cumulative_power_generation" in values:
+            self._first_cumulative_generation = values["cumulative_power_generation"]
+
+    def reconciliation(self) -> Dict[str, Reconciliation]:
+        """
+        Compare the integrated values with the device's own counters
+
+        `cumulative_power_generation` is compared using its increase since the first sample.
+        Energy is compared in watt hours.
+        """
+        result: Dict[str, Reconciliation] = {}
+        if "power_generation_today" in self._device:
+            result["power_generation_today"] = Reconciliation(
+                device=self._device["power_generation_today"] * 1_000.0, integrated=self.charging_wh_today
+            )
+        if "charging_amphours_today" in self._device:
+            result["charging_amphours_today"] = Reconciliation(
+                device=self._device["charging_amphours_today"], integrated=self.charging_ah_today
+            )
+        if self._first_cumulative_generation is not None:
+            generated = self._device["cumulative_power_generation"] - self._first_cumulative_generation
+            result["cumulative_power_generation"] = Reconciliation(
+                device=generated * 1_000.0, integrated=self.charging_wh
+            )
+        return result
+
+    def values(self) -> Dict[str, Any]:
+        """
+        Current value of every metric, keyed by name
+        """
+        return {
+            "efficiency": self.efficiency,
+            "net_power": self.net_power,
+            "net_current": self.net_current,
+            "charging_power_ewma": self.charging_power_ewma,
+            "net_power_ewma": self.net_power_ewma,
+            "efficiency_ewma": self.efficiency_ewma,
+            "solar_wh": self.solar_wh,
+            "charging_wh": self.charging_wh,
+            "load_wh": self.load_wh,
+            "charging_ah": self.charging_ah,
+            "load_ah": self.load_ah,
+            "charging_wh_today": self.charging_wh_today,
+            "load_wh_today": self.load_wh_today,
+            "charging_ah_today": self.charging_ah_today,
+            "peak_charging_power_today": self.peak_charging_power_today,
+        }
+
+
+def _ewma(average: Optional[float], value: Optional[float], alpha: float) -> Optional[float]:
+    if value is None:
+        return average
+    if average is None:
+        return value
+    return average + alpha * (value - average)
@@ -0,0 +1,126 @@
+"""
+Periodic polling of a Renogy Rover controller
+
+The poller reads the controller once per interval and hands each reading (a
+`Snapshot`) to its subscribers, e.g.:
+
+    poller = Poller(RenogyRoverController(port="/dev/ttyUSB0"), interval=1.0)
+    poller.subscribe(lambda snapshot: print(snapshot.values["charging_power"]))
+    poller.start()
+"""
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+import logging
+import threading
+import time
+
+from .registers import BLOCKS, RegisterSpan
+from .renogy_rover import RenogyRoverController
+
+logger = logging.getLogger(__name__)
+
+
+class Snapshot(NamedTuple):
+    """
+    All values read from a controller during one poll cycle
+    """
+
+    timestamp: float
+    values: Dict[str, Any]
+    registers: Dict[int, int]
+
+
+# Return values are ignored
+Subscriber = Callable[[Snapshot], Any]
+# Interval until the next poll given the latest snapshot (seconds), e.g. `pyrover.adaptive.AdaptivePollRate`
+IntervalPolicy = Callable[[Snapshot], float]
+
+
+class Poller:
+    def __init__(
+        self,
+        controller: RenogyRoverController,
+        interval: float = 1.0,
+        spans: Optional[Sequence[RegisterSpan]] = None,
+        policy: Optional[IntervalPolicy] = None,
+    ):
+        """
+        :param controller: Controller to poll
+        :param interval: Time between the start of two poll cycles (seconds)
+        :param spans: Register blocks read on each cycle (default is all the blocks the controller supports)
+        :param policy: Sets `interval` after each successful poll
+        """
+        self.controller = controller
+        self.interval = interval
+        self.spans = tuple(spans) if spans is not None else None
+        self.policy = policy
+        self.latest: Optional[Snapshot] = None
+
+        self._subscribers: List[Subscriber] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, subscriber: Subscriber) -> None:
+        """
+        Call `subscriber` with every new snapshot
+        """
+        self._subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.remove(subscriber)
+
+    def poll(self) -> Snapshot:
+        """
+        Read the controller once and publish the snapshot to the subscribers
+        """
+        timestamp = time.time()
+        spans = self.spans
+        if spans is None:
+            profile = self.controller.profile
+            spans = profile.blocks if profile is not None else BLOCKS
+        with self.controller.prefetch(*spans) as registers:
+            values = self.controller.all_data()
+        snapshot = Snapshot(timestamp=timestamp, values=values, registers=registers)
+        if self.policy is not None:
+            self.interval = self.policy(snapshot)
+        self.publish(snapshot)
+        return snapshot
+
+    def publish(self, snapshot: Snapshot) -> None:
+        self.latest = snapshot
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber(snapshot)
+            except Exception:
+                logger.exception(f"poller subscriber failed ({subscriber})")
+
+    def start(self) -> None:
+        """
+        Poll in a background thread until `stop()` is called
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="pyrover-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        next_poll = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                logger.warning(f"poll failed: {e}")
+            next_poll += self.interval
+            delay = next_poll - time.monotonic()
+            if delay < 0:
+                # Fell behind, skip the missed cycles instead of bursting to catch up
+                next_poll = time.monotonic()
+                delay = 0
+            self._stop.wait(delay)
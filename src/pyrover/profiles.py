@@ -0,0 +1,128 @@
+"""
+Capability profiles of the controller models
+
+A profile lists the register ranges a model does not implement so that polls
+skip the matching getters instead of paying a timeout or an illegal address
+exception on every cycle, e.g.:
+
+    rover = RenogyRoverController(port="/dev/ttyUSB0", detect_profile=True)
+    rover.profile.name  # "rover", or the model of a probed controller
+    rover.all_data()  # only the supported fields
+
+Known models are matched on their `product_model` prefix. Only the Rover ships
+with a profile; other models (e.g. the Wanderer) are probed once, block by
+block then field by field, and the result is cached for the process by model.
+"""
+
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Tuple
+import logging
+import threading
+
+from .registers import BLOCKS, FIELD_REGISTERS, RegisterSpan
+
+if TYPE_CHECKING:
+    from .renogy_rover import RenogyRoverController
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceProfile(NamedTuple):
+    name: str
+    # `product_model` prefixes of the models using the profile
+    model_prefixes: Tuple[str, ...] = ()
+    unsupported: Tuple[RegisterSpan, ...] = ()
+
+    def supports(self, span: RegisterSpan) -> bool:
+        return not any(span.address < other.end and other.address < span.end for other in self.unsupported)
+
+    @property
+    def fields(self) -> List[str]:
+        """
+        Names of the supported getters
+        """
+        return [name for name, span in FIELD_REGISTERS.items() if self.supports(span)]
+
+    def trim(self, span: RegisterSpan) -> List[RegisterSpan]:
+        """
+        Supported parts of a span
+        """
+        spans = []
+        start = span.address
+        for other in sorted(self.unsupported):
+            if other.end <= start or other.address >= span.end:
+                continue
+            if other.address > start:
+                spans.append(RegisterSpan(start, other.address - start))
+            start = max(start, other.end)
+        if start < span.end:
+            spans.append(RegisterSpan(start, span.end - start))
+        return spans
+
+    @property
+    def blocks(self) -> Tuple[RegisterSpan, ...]:
+        """
+        Supported parts of the register blocks, for `RenogyRoverController.prefetch()`
+        """
+        return tuple(part for block in BLOCKS for part in self.trim(block))
+
+
+ROVER = DeviceProfile("rover", model_prefixes=("RNG-CTRL-RVR",))
+
+PROFILES = (ROVER,)
+
+_probed: Dict[str, DeviceProfile] = {}
+_probed_lock = threading.Lock()
+
+
+def profile_for_model(model: str) -> Optional[DeviceProfile]:
+    """
+    Shipped profile of a model, None if the model is unknown
+    """
+    matches = [profile for profile in PROFILES for prefix in profile.model_prefixes if model.startswith(prefix)]
+    return matches[0] if matches else None
+
+
+def probe_profile(controller: "RenogyRoverController", name: str = "probed") -> DeviceProfile:
+    """
+    Find the unsupported registers of a controller by reading each block, then each field of the failing blocks
+    """
+    unsupported: List[RegisterSpan] = []
+    for block in BLOCKS:
+        if _readable(controller, block):
+            continue
+        # Fields sharing registers are probed once
+        spans = sorted({span for span in FIELD_REGISTERS.values() if block.contains(span)})
+        for span in spans:
+            if not _readable(controller, span):
+                unsupported.append(span)
+    return DeviceProfile(name, unsupported=tuple(unsupported))
+
+
+def detect_profile(controller: "RenogyRoverController") -> DeviceProfile:
+    """
+    Profile of a connected controller: the shipped profile of its model, or the (cached) probed profile
+    """
+    model = controller.product_model()
+    profile = profile_for_model(model)
+    if profile is not None:
+        return profile
+    with _probed_lock:
+        profile = _probed.get(model)
+    if profile is not None:
+        return profile
+    # Not probed under the lock, so controllers on other ports are detected meanwhile. Controllers of the
+    # same model detected at the same time may each probe, the first result is kept
+    logger.info(f"unknown model ({model}), probing the supported registers")
+    profile = probe_profile(controller, name=model)
+    with _probed_lock:
+        return _probed.setdefault(model, profile)
+
+
+def _readable(controller: "RenogyRoverController", span: RegisterSpan) -> bool:
+    try:
+        with controller.prefetch(span):
+            pass
+    except IOError as e:
+        logger.debug(f"registers {hex(span.address)}-{hex(span.end - 1)} not readable: {e}")
+        return False
+    return True
@@ -0,0 +1,321 @@
+"""
+Profiling of the Modbus transactions of a controller
+
+Opt-in: nothing is recorded outside of a `profiling()` context, e.g.:
+
+    with rover.profiling() as p:
+        poller.poll()
+    print(p.format_summary())
+    p.save_chrome_trace("poll.json")  # open in chrome://tracing or https://ui.perfetto.dev
+
+Every transaction records when it started, how long it waited for the port
+lock, how long it spent on the bus (request sent until response decoded by
+minimalmodbus), the bytes of the request and response frames and the public
+method or step that triggered it. Public methods of the controller are timed
+too, so the time a getter spends outside of transactions (decoding) is
+reported as processing time.
+
+Profiles can be nested: the transactions and steps of an inner profile are
+recorded by the enclosing ones too.
+"""
+
+from contextlib import contextmanager, nullcontext
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, TypeVar
+import json
+import os
+import threading
+import time
+
+if TYPE_CHECKING:
+    from .renogy_rover import RenogyRoverController
+
+T = TypeVar("T")
+
+# Modbus RTU frame sizes: address, function code, payload, CRC
+_READ_REQUEST_BYTES = 8  # address, function 3, start, count, CRC
+_READ_RESPONSE_OVERHEAD = 5  # address, function 3, byte count, CRC
+_WRITE_REQUEST_OVERHEAD = 9  # address, function 16, start, count, byte count, CRC
+_WRITE_RESPONSE_BYTES = 8  # address, function 16, start, count, CRC
+
+_MISSING = object()
+
+
+class Transaction(NamedTuple):
+    kind: str
+    address: int
+    number_of_registers: int
+    # Seconds since the start of the profile
+    start: float
+    lock_wait: float
+    wire_time: float
+    bytes_sent: int
+    bytes_received: int
+    # Innermost public method or step running when the transaction was sent
+    caller: Optional[str]
+    thread: int
+    error: Optional[str] = None
+
+
+class Call(NamedTuple):
+    name: str
+    # Seconds since the start of the profile
+    start: float
+    duration: float
+    # Time spent in nested calls
+    children: float
+    # Time of the transactions made by the call itself (not by nested calls)
+    lock_wait: float
+    wire_time: float
+    thread: int
+
+    @property
+    def processing_time(self) -> float:
+        """
+        Time spent by the call itself outside of transactions
+        """
+        return self.duration - self.children - self.lock_wait - self.wire_time
+
+
+class CallerStats(NamedTuple):
+    caller: str
+    calls: int
+    transactions: int
+    bytes: int
+    lock_wait: float
+    wire_time: float
+    processing_time: float
+
+
+class _Frame:
+    def __init__(self, name: str, start: float):
+        self.name = name
+        self.start = start
+        self.children = 0.0
+        self.lock_wait = 0.0
+        self.wire_time = 0.0
+
+
+def _frame_bytes(kind: str, number_of_registers: int) -> Tuple[int, int]:
+    if kind == "write_register":
+        return _WRITE_REQUEST_OVERHEAD + 2 * number_of_registers, _WRITE_RESPONSE_BYTES
+    return _READ_REQUEST_BYTES, _READ_RESPONSE_OVERHEAD + 2 * number_of_registers
+
+
+class Profile:
+    def __init__(self, controller: "RenogyRoverController", parent: Optional["Profile"] = None):
+        """
+        :param controller: Profiled controller
+        :param parent: Enclosing profile, which records the transactions and steps of this one too
+        """
+        self.controller = controller
+        self.parent = parent
+        self.transactions: List[Transaction] = []
+        self.calls: List[Call] = []
+
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Instance attributes shadowed by the timed methods, restored when profiling stops
+        self._shadowed: List[Tuple[str, Any]] = []
+
+    @contextmanager
+    def step(self, name: str) -> Iterator[None]:
+        """
+        Attribute the transactions made inside the context to `name`, e.g. a poll planner step
+        """
+        with self.parent.step(name) if self.parent is not None else nullcontext():
+            with self._frame(name):
+                yield
+
+    @contextmanager
+    def _frame(self, name: str) -> Iterator[None]:
+        # Step of this profile only
+        stack = self._stack()
+        frame = _Frame(name, time.perf_counter())
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            stack.pop()
+            end = time.perf_counter()
+            duration = end - frame.start
+            if stack:
+                stack[-1].children += duration
+            call = Call(
+                name=name,
+                start=frame.start - self._origin,
+                duration=duration,
+                children=frame.children,
+                lock_wait=frame.lock_wait,
+                wire_time=frame.wire_time,
+                thread=threading.get_ident(),
+            )
+            with self._lock:
+                self.calls.append(call)
+
+    def transaction(self, lock: Any, kind: str, address: int, number_of_registers: int, send: Callable[[], T]) -> T:
+        """
+        Run and record a transaction (used by the controller)
+        """
+        start = time.perf_counter()
+        error = None
+        with lock:
+            sent = time.perf_counter()
+            try:
+                return send()
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                end = time.perf_counter()
+                profile: Optional[Profile] = self
+                while profile is not None:
+                    profile._record(kind, address, number_of_registers, start, sent, end, error)
+                    profile = profile.parent
+
+    def _record(
+        self,
+        kind: str,
+        address: int,
+        number_of_registers: int,
+        start: float,
+        sent: float,
+        end: float,
+        error: Optional[str],
+    ) -> None:
+        stack = self._stack()
+        bytes_sent, bytes_received = _frame_bytes(kind, number_of_registers)
+        if stack:
+            stack[-1].lock_wait += sent - start
+            stack[-1].wire_time += end - sent
+        transaction = Transaction(
+            kind=kind,
+            address=address,
+            number_of_registers=number_of_registers,
+            start=start - self._origin,
+            lock_wait=sent - start,
+            wire_time=end - sent,
+            bytes_sent=bytes_sent,
+            bytes_received=0 if error else bytes_received,
+            caller=stack[-1].name if stack else None,
+            thread=threading.get_ident(),
+            error=error,
+        )
+        with self._lock:
+            self.transactions.append(transaction)
+
+    def summary(self) -> List[CallerStats]:
+        """
+        Totals by caller, slowest first
+        """
+        stats: Dict[str, List[Any]] = {}
+        for call in self.calls:
+            entry = stats.setdefault(call.name, [0, 0, 0, 0.0, 0.0, 0.0])
+            entry[0] += 1
+            entry[5] += call.processing_time
+        for transaction in self.transactions:
+            entry = stats.setdefault(transaction.caller or "-", [0, 0, 0, 0.0, 0.0, 0.0])
+            entry[1] += 1
+            entry[2] += transaction.bytes_sent + transaction.bytes_received
+            entry[3] += transaction.lock_wait
+            entry[4] += transaction.wire_time
+        rows = [CallerStats(name, *entry) for name, entry in stats.items()]
+        return sorted(rows, key=lambda row: row.lock_wait + row.wire_time + row.processing_time, reverse=True)
+
+    def format_summary(self) -> str:
+        lines = [f"{'caller':<36} {'calls':>6} {'reads':>6} {'bytes':>8} {'lock ms':>9} {'wire ms':>9} {'proc ms':>9}"]
+        for row in self.summary():
+            lines.append(
+                f"{row.caller:<36} {row.calls:>6} {row.transactions:>6} {row.bytes:>8} "
+                f"{row.lock_wait * 1e3:>9.2f} {row.wire_time * 1e3:>9.2f} {row.processing_time * 1e3:>9.2f}"
+            )
+        wire = sum(t.wire_time for t in self.transactions)
+        sent = sum(t.bytes_sent + t.bytes_received for t in self.transactions)
+        lines.append(f"{len(self.transactions)} transaction(s), {sent} bytes, {wire * 1e3:.2f} ms on the bus")
+        return "\n".join(lines)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "transactions": [t._asdict() for t in self.transactions],
+            "calls": [dict(c._asdict(), processing_time=c.processing_time) for c in self.calls],
+        }
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """
+        Trace in the Chrome trace event format
+        """
+        pid = os.getpid()
+        events: List[Dict[str, Any]] = []
+        for call in self.calls:
+            events.append(
+                {
+                    "name": call.name,
+                    "cat": "call",
+                    "ph": "X",
+                    "ts": call.start * 1e6,
+                    "dur": call.duration * 1e6,
+                    "pid": pid,
+                    "tid": call.thread,
+                    "args": {"processing_ms": call.processing_time * 1e3},
+                }
+            )
+        for t in self.transactions:
+            args = {
+                "address": hex(t.address),
+                "registers": t.number_of_registers,
+                "bytes_sent": t.bytes_sent,
+                "bytes_received": t.bytes_received,
+                "lock_wait_ms": t.lock_wait * 1e3,
+            }
+            if t.error:
+                args["error"] = t.error
+            events.append(
+                {
+                    "name": f"{t.kind} {hex(t.address)}",
+                    "cat": "transaction",
+                    "ph": "X",
+                    "ts": (t.start + t.lock_wait) * 1e6,
+                    "dur": t.wire_time * 1e6,
+                    "pid": pid,
+                    "tid": t.thread,
+                    "args": args,
+                }
+            )
+        events.sort(key=lambda event: event["ts"])
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_chrome_trace(self, path: str) -> None:
+        with open(path, "w") as file:
+            json.dump(self.to_chrome_trace(), file)
+
+    def _stack(self) -> List[_Frame]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _start(self, names: List[str]) -> None:
+        # Time the public methods by shadowing them on the instance, on top of another profile's if nested
+        attributes = self.controller.__dict__
+        for name in names:
+            method = getattr(self.controller, name)
+            self._shadowed.append((name, attributes.get(name, _MISSING)))
+            attributes[name] = self._timed(name, method)
+
+    def _stop(self) -> None:
+        attributes = self.controller.__dict__
+        for name, previous in reversed(self._shadowed):
+            if previous is _MISSING:
+                attributes.pop(name, None)
+            else:
+                attributes[name] = previous
+        self._shadowed = []
+
+    def _timed(self, name: str, method: Callable[..., Any]) -> Callable[..., Any]:
+        def timed(*args, **kwargs):
+            # The enclosing profiles time the method with their own wrappers
+            with self._frame(name):
+                return method(*args, **kwargs)
+
+        timed.__doc__ = method.__doc__
+        return timed
@@ -0,0 +1,271 @@
+"""
+Publish poller snapshots to an MQTT style message bus
+
+Each poll cycle is published as a single compact JSON message (all fields, or
+only the changed fields in delta mode) instead of one message per field.
+Messages are buffered while the broker is unavailable and the backlog is sent
+in batches once it comes back. Home Assistant discovery topics are generated
+from the field metadata, e.g.:
+
+    publisher = Publisher(client, device_id="rover1")
+    publisher.publish_discovery(model="RNG-CTRL-RVR40")
+    poller.subscribe(publisher.update)
+
+`client` is anything with a `publish(topic, payload, retain)` method that
+raises when the message cannot be sent (e.g. a thin wrapper around a
+paho-mqtt client). `LocalBroker` is an in-process stand-in for tests.
+"""
+
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional, Protocol, Sequence, Tuple
+import json
+import logging
+import time
+
+from .fields import FIELDS, encode_value
+from .poller import Snapshot
+
+logger = logging.getLogger(__name__)
+
+
+class Message(NamedTuple):
+    topic: str
+    payload: bytes
+    retain: bool = False
+
+
+class MessageClient(Protocol):
+    def publish(self, topic: str, payload: bytes, retain: bool = False) -> Any: ...
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    """
+    Whether an MQTT topic matches a subscription pattern (supports the + and # wildcards)
+    """
+    pattern_levels = pattern.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(pattern_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels) or (level != "+" and level != topic_levels[i]):
+            return False
+    return len(pattern_levels) == len(topic_levels)
+
+
+class LocalBroker:
+    """
+    In-process stand-in for an MQTT broker
+
+    Set `online` to False to simulate an outage: publishing then raises a ConnectionError.
+    """
+
+    def __init__(self):
+        self.online = True
+        self.messages: List[Message] = []
+        self.retained: Dict[str, bytes] = {}
+        self._subscriptions: List[Tuple[str, Callable[[Message], None]]] = []
+
+    def publish(self, topic: str, payload: bytes, retain: bool = False) -> None:
+        if not self.online:
+            raise ConnectionError("broker unavailable")
+        message = Message(topic, payload, retain)
+        self.messages.append(message)
+        if retain:
+            self.retained[topic] = payload
+        for pattern, callback in list(self._subscriptions):
+            if topic_matches(pattern, topic):
+                callback(message)
+
+    def subscribe(self, pattern: str, callback: Callable[[Message], None]) -> None:
+        self._subscriptions.append((pattern, callback))
+        for topic, payload in self.retained.items():
+            if topic_matches(pattern, topic):
+                callback(Message(topic, payload, True))
+
+
+class Publisher:
+    def __init__(
+        self,
+        client: MessageClient,
+        device_id: str,
+        topic_prefix: str = "pyrover",
+        fields: Optional[Sequence[str]] = None,
+        delta: bool = False,
+        keyframe_interval: int = 60,
+        batch_size: int = 50,
+        max_buffer: int = 1000,
+        overflow: str = "drop_oldest",
+        retry_interval: float = 5.0,
+        discovery_prefix: str = "homeassistant",
+    ):
+        """
+        :param client: Message bus client
+        :param device_id: Unique id of the controller, used in the topics
+        :param topic_prefix: First level of the state topics
+        :param fields: Fields to publish (default is every field of the snapshots)
+        :param delta: Only publish the fields that changed since the previous cycle
+        :param keyframe_interval: In delta mode, publish all fields every N cycles
+        :param batch_size: Maximum number of buffered cycles sent in one backlog message
+        :param max_buffer: Maximum number of cycles buffered while the broker is unavailable
+        :param overflow: When the buffer is full, "drop_oldest" cycles or "reject" the new ones
+        :param retry_interval: Minimum time between two attempts to reach the broker (seconds)
+        :param discovery_prefix: Home Assistant discovery prefix
+        """
+        if overflow not in ("drop_oldest", "reject"):
+            raise ValueError(f"unknown overflow policy ({overflow})")
+        self.client = client
+        self.device_id = device_id
+        self.fields = list(fields) if fields is not None else None
+        self.delta = delta
+        self.keyframe_interval = keyframe_interval
+        self.batch_size = batch_size
+        self.max_buffer = max_buffer
+        self.overflow = overflow
+        self.retry_interval = retry_interval
+        self.discovery_prefix = discovery_prefix
+
+        self.state_topic = f"{topic_prefix}/{device_id}/state"
+        self.backlog_topic = f"{topic_prefix}/{device_id}/backlog"
+
+        self.published = 0
+        self.dropped = 0
+        self.rejected = 0
+
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        self._last: Dict[str, Any] = {}
+        self._cycles = 0
+        self._retry_at = 0.0
+
+    @property
+    def buffered(self) -> int:
+        """
+        Number of cycles waiting to be sent
+        """
+        return len(self._buffer)
+
+    @property
+    def backpressure(self) -> bool:
+        """
+        True once the buffer is more than half full, producers should slow down
+        """
+        return len(self._buffer) * 2 > self.max_buffer
+
+    def discovery_messages(self, model: Optional[str] = None) -> List[Message]:
+        """
+        Home Assistant MQTT discovery config for each published field
+        """
+        device = {"identifiers": [f"pyrover_{self.device_id}"], "name": self.device_id, "manufacturer": "Renogy"}
+        if model:
+            device["model"] = model
+        messages = []
+        for name in self.fields if self.fields is not None else FIELDS:
+            field = FIELDS[name]
+            # Delta messages only carry the changed fields, the others keep the sensor's current state
+            value = f"value_json.v.{name} | default(this.state)" if self.delta else f"value_json.v.{name}"
+            template = f"{{{{ {value} }}}}"
+            config: Dict[str, Any] = {
+                "name": name.replace("_", " ").capitalize(),
+                "unique_id": f"pyrover_{self.device_id}_{name}",
+                "state_topic": self.state_topic,
+                "value_template": template,
+                "device": device,
+            }
+            if field.unit:
+                config["unit_of_measurement"] = field.unit
+            if field.state_class:
+                config["state_class"] = field.state_class
+                device_class = "battery" if name == "battery_percentage" else _DEVICE_CLASSES.get(field.unit or "")
+                if device_class:
+                    config["device_class"] = device_class
+            topic = f"{self.discovery_prefix}/sensor/pyrover_{self.device_id}/{name}/config"
+            messages.append(Message(topic, _dumps(config), retain=True))
+        return messages
+
+    def publish_discovery(self, model: Optional[str] = None) -> None:
+        for message in self.discovery_messages(model):
+            self.client.publish(message.topic, message.payload, retain=True)
+
+    def update(self, snapshot: Snapshot) -> bool:
+        """
+        Queue a snapshot and try to send everything that is buffered
+
+        :return: False if the snapshot was rejected because the buffer is full
+        """
+        values = snapshot.values
+        if self.fields is not None:
+            values = {name: values[name] for name in self.fields if name in values}
+        keyframe = not self.delta or self._cycles % self.keyframe_interval == 0
+        if keyframe:
+            changed = values
+        else:
+            changed = {name: value for name, value in values.items() if self._last.get(name, _MISSING) != value}
+        self._last.update(values)
+        self._cycles += 1
+
+        payload: Dict[str, Any] = {"ts": round(snapshot.timestamp, 3), "v": _encode(changed)}
+        if self.delta and keyframe:
+            payload["k"] = 1
+
+        if len(self._buffer) >= self.max_buffer:
+            if self.overflow == "reject":
+                self.rejected += 1
+                # The next cycle has to carry everything again
+                self._cycles = 0
+                return False
+            dropped = self._buffer.popleft()
+            self.dropped += 1
+            if self.delta and self._buffer:
+                # Later deltas build on the dropped cycle, fold its values into the next one
+                following = self._buffer[0]
+                following["v"] = {**dropped["v"], **following["v"]}
+                if "k" in dropped:
+                    following["k"] = 1
+        self._buffer.append(payload)
+        self.flush()
+        return True
+
+    def flush(self, force: bool = False) -> int:
+        """
+        Send the buffered cycles, older ones in batches on the backlog topic and the latest on the state topic
+
+        :param force: Try even if the last failure was less than `retry_interval` ago
+        :return: Number of cycles sent
+        """
+        if not self._buffer or (not force and time.monotonic() < self._retry_at):
+            return 0
+        sent = 0
+        try:
+            while len(self._buffer) > 1:
+                count = min(self.batch_size, len(self._buffer) - 1)
+                batch = [self._buffer[i] for i in range(count)]
+                self.client.publish(self.backlog_topic, _dumps(batch), retain=False)
+                for _ in range(count):
+                    self._buffer.popleft()
+                sent += count
+            self.client.publish(self.state_topic, _dumps(self._buffer[0]), retain=False)
+            self._buffer.popleft()
+            sent += 1
+        except Exception as e:
+            logger.warning(f"publish failed, {len(self._buffer)} cycle(s) buffered: {e}")
+            self._retry_at = time.monotonic() + self.retry_interval
+        self.published += sent
+        return sent
+
+
+_MISSING = object()
+
+_DEVICE_CLASSES = {
+    "V": "voltage",
+    "A": "current",
+    "W": "power",
+    "kWh": "energy",
+    "°C": "temperature",
+}
+
+
+def _encode(values: Dict[str, Any]) -> Dict[str, Any]:
+    return {name: encode_value(value) for name, value in values.items()}
+
+
+def _dumps(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode()
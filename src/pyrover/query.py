@@ -0,0 +1,298 @@
+"""
+Queries over the history recorded by `pyrover.sqlite_sink`
+
+A time window is split into aligned pieces answered from the coarsest level
+available: whole days from the day rollups, whole hours from the hour
+rollups, whole minutes from the minute rollups and only the edges from the
+raw samples. Each piece only reads the partitions overlapping it, through
+the (device, ts) primary key, so a query over a year reads a few hundred
+rows, e.g.:
+
+    history = HistoryQuery("/var/lib/pyrover/history.db")
+    peaks = history.series("rover-1", "charging_power", time.time() - 90 * 86400, time.time(), DAY, "max")
+    hours = {state: seconds / 3600 for state, seconds in history.time_in_state("rover-1", start, end).items()}
+
+Times are in seconds since the epoch. Integrals (e.g. watts into
+watt-seconds) assume the samples of each bucket are evenly spaced.
+"""
+
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+import math
+import sqlite3
+import threading
+
+from .sqlite_sink import DAY, HOUR, MINUTE, NO_STATE, SAMPLES, Level, partition_key, partition_range, table_name
+from .types import ChargingState
+
+FUNCTIONS = ("min", "max", "mean", "sum", "integral")
+
+State = Union[ChargingState, int]
+
+
+class Aggregate(NamedTuple):
+    samples: int
+    min: Optional[float]
+    max: Optional[float]
+    sum: Optional[float]
+    # Time integral (value x seconds)
+    integral: Optional[float]
+    # Time covered by the buckets holding samples (seconds)
+    duration: float
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum / self.samples if self.sum is not None and self.samples else None
+
+    def value(self, function: str) -> Optional[float]:
+        if function not in FUNCTIONS:
+            raise ValueError(f"unknown function ({function}), expected one of {FUNCTIONS}")
+        return getattr(self, function)
+
+
+# State, number of samples, min, max, sum and time covered (seconds) of a bucket or raw sample
+_Row = Tuple[int, int, Optional[float], Optional[float], Optional[float], float]
+
+
+class HistoryQuery:
+    def __init__(self, path: str):
+        """
+        :param path: Database written by `SqliteSink`, opened read only
+        """
+        self.path = path
+        self._connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def devices(self) -> List[str]:
+        with self._lock:
+            return [name for (name,) in self._connection.execute("SELECT name FROM devices ORDER BY id")]
+
+    def fields(self) -> List[str]:
+        with self._lock:
+            return [name for (name,) in self._connection.execute("SELECT name FROM fields ORDER BY name")]
+
+    def samples(self, device: str, field: str, start: float, end: float) -> List[Tuple[float, Any]]:
+        """
+        Raw samples of a field in [start, end), oldest first (only as far back as the samples retention)
+        """
+        with self._lock:
+            device_id = self._device_id(device)
+            self._check_field(field)
+            points: List[Tuple[float, Any]] = []
+            for table, first, last in self._tables(SAMPLES, _ms(start), _ms(end)):
+                points.extend(
+                    (ts / 1000, value)
+                    for ts, value in self._connection.execute(
+                        f"SELECT ts, {field} FROM {table} WHERE device = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                        (device_id, first, last),
+                    )
+                )
+            return points
+
+    def aggregate(self, device: str, field: str, start: float, end: float) -> Aggregate:
+        """
+        Min, max, sum, integral... of a field over [start, end)
+        """
+        with self._lock:
+            return _combine(self._rows(device, field, _ms(start), _ms(end)))
+
+    def aggregate_by_state(self, device: str, field: str, start: float, end: float) -> Dict[State, Aggregate]:
+        """
+        Same as `aggregate()` for each value of the state field (charging state by default)
+        """
+        with self._lock:
+            rows = self._rows(device, field, _ms(start), _ms(end))
+            by_state: Dict[int, List[_Row]] = {}
+            for row in rows:
+                by_state.setdefault(row[0], []).append(row)
+            return {self._state(state): _combine(state_rows) for state, state_rows in sorted(by_state.items())}
+
+    def time_in_state(self, device: str, start: float, end: float) -> Dict[State, float]:
+        """
+        Seconds spent in each value of the state field over [start, end)
+        """
+        with self._lock:
+            state_field = self._state_field()
+            if state_field is None:
+                raise ValueError("the history has no state field")
+        return {
+            state: aggregate.duration
+            for state, aggregate in self.aggregate_by_state(device, state_field, start, end).items()
+        }
+
+    def series(
+        self, device: str, field: str, start: float, end: float, level: Level = DAY, function: str = "mean"
+    ) -> List[Tuple[float, Optional[float]]]:
+        """
+        One value per bucket of `level` in [start, end), e.g. the daily peak with `DAY` and "max"
+
+        :return: (bucket start, value) of the buckets holding samples, oldest first
+        """
+        if level not in (MINUTE, HOUR, DAY):
+            raise ValueError(f"series are by minute, hour or day, not {level.name}")
+        if function not in FUNCTIONS:
+            raise ValueError(f"unknown function ({function}), expected one of {FUNCTIONS}")
+        bucket = level.bucket * 1000
+        first, last = _ms(start), _ms(end)
+        with self._lock:
+            device_id = self._device_id(device)
+            self._check_field(field)
+            # Whole buckets already rolled up are read in one pass, the others are aggregated one by one
+            aligned_start = -(-first // bucket) * bucket
+            aligned_end = max(aligned_start, min(last // bucket * bucket, self._rolled_up(level)))
+            buckets: Dict[int, List[_Row]] = {}
+            if aligned_start < aligned_end:
+                for row in self._rollup_rows(level, device_id, field, aligned_start, aligned_end):
+                    buckets.setdefault(row[0], []).append(row[1:])
+            pieces = [(first, min(aligned_start, last))] + [
+                (t, min(t + bucket, last)) for t in range(aligned_end, last, bucket)
+            ]
+            for piece_start, piece_end in pieces:
+                if piece_start < piece_end:
+                    rows = self._rows(device, field, piece_start, piece_end)
+                    buckets.setdefault(piece_start // bucket * bucket, []).extend(rows)
+        series = []
+        for ts, rows in sorted(buckets.items()):
+            aggregate = _combine(rows)
+            if aggregate.samples:
+                series.append((ts / 1000, aggregate.value(function)))
+        return series
+
+    def plan(self, start: float, end: float) -> List[Tuple[str, float, float]]:
+        """
+        Levels and ranges read to answer a query over [start, end)
+        """
+        with self._lock:
+            return [(level.name, first / 1000, last / 1000) for level, first, last in self._plan(_ms(start), _ms(end))]
+
+    def _plan(self, start: int, end: int) -> List[Tuple[Level, int, int]]:
+        # Split [start, end) (milliseconds) in pieces aligned on the coarsest rolled up buckets
+        if start >= end:
+            return []
+        for level in (DAY, HOUR, MINUTE):
+            bucket = level.bucket * 1000
+            first = -(-start // bucket) * bucket
+            last = min(end // bucket * bucket, self._rolled_up(level))
+            if first < last:
+                return self._plan(start, first) + [(level, first, last)] + self._plan(last, end)
+        return [(SAMPLES, start, end)]
+
+    def _rows(self, device: str, field: str, start: int, end: int) -> List[_Row]:
+        device_id = self._device_id(device)
+        self._check_field(field)
+        rows: List[_Row] = []
+        for level, first, last in self._plan(start, end):
+            if level == SAMPLES:
+                rows.extend(self._sample_rows(device_id, field, first, last))
+            else:
+                rows.extend(row[1:] for row in self._rollup_rows(level, device_id, field, first, last))
+        return rows
+
+    def _sample_rows(self, device_id: int, field: str, start: int, end: int) -> List[_Row]:
+        state_column = self._state_field() or str(NO_STATE)
+        values: List[Tuple[int, Any]] = []
+        for table, first, last in self._tables(SAMPLES, start, end):
+            values.extend(
+                self._connection.execute(
+                    f"SELECT COALESCE({state_column}, {NO_STATE}), {field} FROM {table} "
+                    f"WHERE device = ? AND ts >= ? AND ts < ? AND {field} IS NOT NULL",
+                    (device_id, first, last),
+                )
+            )
+        # The piece is shorter than a minute, its samples share its duration
+        duration = (end - start) / 1000 / len(values) if values else 0.0
+        return [(state, 1, value, value, value, duration) for state, value in values]
+
+    def _rollup_rows(
+        self, level: Level, device_id: int, field: str, start: int, end: int
+    ) -> List[Tuple[int, int, int, Optional[float], Optional[float], Optional[float], float]]:
+        # Bucket start and `_Row` of each rollup row, a bucket's time is shared by its states by sample count.
+        # The row's count is the number of values of the field, samples without one are not in its sum
+        rows = []
+        for table, first, last in self._tables(level, start, end):
+            rows.extend(
+                self._connection.execute(
+                    f"SELECT ts, state, count, {field}_count, {field}_min, {field}_max, {field}_sum "
+                    f"FROM {table} WHERE device = ? AND ts >= ? AND ts < ?",
+                    (device_id, first, last),
+                )
+            )
+        totals: Dict[int, int] = {}
+        for ts, _, count, _, _, _, _ in rows:
+            totals[ts] = totals.get(ts, 0) + count
+        return [
+            (ts, state, values, low, high, total, level.bucket * count / totals[ts])
+            for ts, state, count, values, low, high, total in rows
+        ]
+
+    def _tables(self, level: Level, start: int, end: int) -> List[Tuple[str, int, int]]:
+        # Existing partitions overlapping [start, end) and the part of the range each holds
+        existing = {name for (name,) in self._connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        tables = []
+        key = partition_key(level, start / 1000)
+        while True:
+            first, last = partition_range(level, key)
+            if first * 1000 >= end:
+                break
+            if table_name(level, key) in existing:
+                tables.append((table_name(level, key), max(start, int(first * 1000)), min(end, int(last * 1000))))
+            key = partition_key(level, last)
+        return tables
+
+    def _rolled_up(self, level: Level) -> int:
+        # End of the buckets rolled up (milliseconds)
+        row = self._connection.execute("SELECT value FROM meta WHERE key = ?", (level.name,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def _device_id(self, device: str) -> int:
+        row = self._connection.execute("SELECT id FROM devices WHERE name = ?", (device,)).fetchone()
+        if row is None:
+            raise KeyError(f"unknown device ({device})")
+        return row[0]
+
+    def _check_field(self, field: str) -> None:
+        # Also keeps arbitrary SQL out of the queries
+        if self._connection.execute("SELECT 1 FROM fields WHERE name = ?", (field,)).fetchone() is None:
+            raise ValueError(f"field not recorded ({field})")
+
+    def _state_field(self) -> Optional[str]:
+        row = self._connection.execute("SELECT name FROM fields WHERE state = 1").fetchone()
+        return row[0] if row is not None else None
+
+    def _state(self, value: int) -> State:
+        if self._state_field() == "charging_state":
+            try:
+                return ChargingState(value)
+            except ValueError:
+                pass
+        return value
+
+
+def _ms(timestamp: float) -> int:
+    return int(math.floor(timestamp * 1000))
+
+
+def _combine(rows: Sequence[_Row]) -> Aggregate:
+    samples = 0
+    low: Optional[float] = None
+    high: Optional[float] = None
+    total: Optional[float] = None
+    integral: Optional[float] = None
+    duration = 0.0
+    for _, count, row_min, row_max, row_sum, row_duration in rows:
+        if not count:
+            continue
+        samples += count
+        duration += row_duration
+        if row_min is not None:
+            low = row_min if low is None else min(low, row_min)
+        if row_max is not None:
+            high = row_max if high is None else max(high, row_max)
+        if row_sum is not None:
+            total = row_sum if total is None else total + row_sum
+            # Mean of the bucket over the time it covers
+            part = row_sum / count * row_duration
+            integral = part if integral is None else integral + part
+    return Aggregate(samples=samples, min=low, max=high, sum=total, integral=integral, duration=duration)
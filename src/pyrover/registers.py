@@ -0,0 +1,139 @@
+"""
+Register map of the Renogy Rover
+
+Describes where each value exposed by `RenogyRoverController` lives in the
+controller's register space so that related values can be fetched together
+in a single Modbus transaction instead of one transaction per getter.
+"""
+
+from typing import Dict, NamedTuple
+
+
+class RegisterSpan(NamedTuple):
+    """
+    A contiguous range of 16 bit registers
+    """
+
+    address: int
+    number_of_registers: int
+
+    @property
+    def end(self) -> int:
+        """
+        First address past the end of the span
+        """
+        return self.address + self.number_of_registers
+
+    def contains(self, other: "RegisterSpan") -> bool:
+        return self.address <= other.address and other.end <= self.end
+
+
+# Blocks that can each be read in a single transaction
+SYSTEM_INFO_BLOCK = RegisterSpan(0x000A, 17)  # 0x000A-0x001A
+DYNAMIC_DATA_BLOCK = RegisterSpan(0x0100, 35)  # 0x0100-0x0122
+SETTINGS_BLOCK = RegisterSpan(0xE002, 32)  # 0xE002-0xE021
+
+BLOCKS = (SYSTEM_INFO_BLOCK, DYNAMIC_DATA_BLOCK, SETTINGS_BLOCK)
+
+# Registers backing each of the `RenogyRoverController` getters
+FIELD_REGISTERS: Dict[str, RegisterSpan] = {
+    # System information
+    "max_system_voltage": RegisterSpan(0x000A, 1),
+    "rated_charging_current": RegisterSpan(0x000A, 1),
+    "rated_discharging_current": RegisterSpan(0x000B, 1),
+    "product_type": RegisterSpan(0x000B, 1),
+    "product_model": RegisterSpan(0x000C, 8),
+    "software_version": RegisterSpan(0x0014, 2),
+    "hardware_version": RegisterSpan(0x0016, 2),
+    "serial_number": RegisterSpan(0x0018, 2),
+    "device_address": RegisterSpan(0x001A, 1),
+    # Charging information
+    "battery_percentage": RegisterSpan(0x0100, 1),
+    "battery_voltage": RegisterSpan(0x0101, 1),
+    "charging_current": RegisterSpan(0x0102, 1),
+    "controller_temperature": RegisterSpan(0x0103, 1),
+    "battery_temperature": RegisterSpan(0x0103, 1),
+    # Load information
+    "load_voltage": RegisterSpan(0x0104, 1),
+    "load_current": RegisterSpan(0x0105, 1),
+    "load_power": RegisterSpan(0x0106, 1),
+    # Solar panel information
+    "solar_voltage": RegisterSpan(0x0107, 1),
+    "solar_current": RegisterSpan(0x0108, 1),
+    "charging_power": RegisterSpan(0x0109, 1),
+    # Historical information
+    "battery_min_voltage_today": RegisterSpan(0x010B, 1),
+    "battery_max_voltage_today": RegisterSpan(0x010C, 1),
+    "max_charging_current_today": RegisterSpan(0x010D, 1),
+    "max_discharging_current_today": RegisterSpan(0x010E, 1),
+    "max_charging_power_today": RegisterSpan(0x010F, 1),
+    "min_charging_power_today": RegisterSpan(0x0110, 1),
+    "charging_amphours_today": RegisterSpan(0x0111, 1),
+    "discharging_amphours_today": RegisterSpan(0x0112, 1),
+    "power_generation_today": RegisterSpan(0x0113, 1),
+    "power_consumption_today": RegisterSpan(0x0114, 1),
+    "total_operating_days": RegisterSpan(0x0115, 1),
+    "total_battery_over_discharges": RegisterSpan(0x0116, 1),
+    "total_battery_full_charges": RegisterSpan(0x0117, 1),
+    "total_battery_charge_amphours": RegisterSpan(0x0118, 2),
+    "total_battery_discharge_amphours": RegisterSpan(0x011A, 2),
+    "cumulative_power_generation": RegisterSpan(0x011C, 2),
+    "cumulative_power_consumption": RegisterSpan(0x011E, 2),
+    "street_light_status": RegisterSpan(0x0120, 1),
+    "street_light_brightness": RegisterSpan(0x0120, 1),
+    "charging_state": RegisterSpan(0x0120, 1),
+    # Controller fault information
+    "controller_fault_information": RegisterSpan(0x0121, 2),
+    # Battery parameter settings
+    "nominal_battery_capacity": RegisterSpan(0xE002, 1),
+    "system_voltage_setting": RegisterSpan(0xE003, 1),
+    "recognized_voltage": RegisterSpan(0xE003, 1),
+    "battery_type": RegisterSpan(0xE004, 1),
+    "over_voltage_threshold": RegisterSpan(0xE005, 1),
+    "charging_voltage_limit": RegisterSpan(0xE006, 1),
+    "equalizing_charging_voltage": RegisterSpan(0xE007, 1),
+    "boost_charging_voltage": RegisterSpan(0xE008, 1),
+    "floating_voltage": RegisterSpan(0xE009, 1),
+    "boost_charging_recovery_voltage": RegisterSpan(0xE00A, 1),
+    "over_discharge_recovery_voltage": RegisterSpan(0xE00B, 1),
+    "under_voltage_warning_level": RegisterSpan(0xE00C, 1),
+    "over_discharge_voltage": RegisterSpan(0xE00D, 1),
+    "discharging_limit_voltage": RegisterSpan(0xE00E, 1),
+    "end_of_charge_soc": RegisterSpan(0xE00F, 1),
+    "end_of_discharge_soc": RegisterSpan(0xE00F, 1),
+    "over_discharge_time_delay": RegisterSpan(0xE010, 1),
+    "equalizing_charging_time": RegisterSpan(0xE011, 1),
+    "boost_charging_time": RegisterSpan(0xE012, 1),
+    "equalizing_charging_interval": RegisterSpan(0xE013, 1),
+    "temperature_compensation_factor": RegisterSpan(0xE014, 1),
+    # Load operating duration and power settings
+    "first_stage_operating_duration": RegisterSpan(0xE015, 1),
+    "first_stage_operating_power": RegisterSpan(0xE016, 1),
+    "second_stage_operating_duration": RegisterSpan(0xE017, 1),
+    "second_stage_operating_power": RegisterSpan(0xE018, 1),
+    "third_stage_operating_duration": RegisterSpan(0xE019, 1),
+    "third_stage_operating_power": RegisterSpan(0xE01A, 1),
+    "morning_on_operating_duration": RegisterSpan(0xE01B, 1),
+    "morning_on_operating_power": RegisterSpan(0xE01C, 1),
+    # Mode setting
+    "load_working_mode": RegisterSpan(0xE01D, 1),
+    "light_control_delay": RegisterSpan(0xE01E, 1),
+    "light_control_voltage": RegisterSpan(0xE01F, 1),
+    "led_load_current_setting": RegisterSpan(0xE020, 1),
+    # Special power control
+    "charging_mode_controlled_by": RegisterSpan(0xE021, 1),
+    "special_power_control_state": RegisterSpan(0xE021, 1),
+    "each_night_on_function_state": RegisterSpan(0xE021, 1),
+    "no_charging_below_freezing": RegisterSpan(0xE021, 1),
+    "charging_method": RegisterSpan(0xE021, 1),
+}
+
+# 32 bit values (high word first) checked for torn reads: True for the counters, which only
+# increase, False for the values that never change
+DOUBLE_WORDS: Dict[str, bool] = {
+    "serial_number": False,
+    "total_battery_charge_amphours": True,
+    "total_battery_discharge_amphours": True,
+    "cumulative_power_generation": True,
+    "cumulative_power_consumption": True,
+}
@@ -5,13 +5,26 @@ This driver also works with the Renogy Wanderer controller, however, the
 Wanderer does not support all of the features that the Rover does and will
 therefore return fewer values.
 
+Controllers can be shared between threads: every Modbus transaction holds a
+lock shared by all the controllers on the same serial port, so frames never
+interleave on the line.
+
 based on:
     https://github.com/corbinbs/solarshed/blob/master/solarshed/controllers/renogy_rover.py
 """
 
-from typing import Any, Union, List, Dict
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, ContextManager, Iterator, Optional, Tuple, TypeVar, Union, List, Dict
 import minimalmodbus
 import logging
+import threading
+import time
+
+from .profiles import DeviceProfile, detect_profile as _detect_profile
+from .profiling import Profile
+from .registers import BLOCKS, DOUBLE_WORDS, FIELD_REGISTERS, RegisterSpan
+from .rtu import RtuInstrument
+from .simulator import SimulatedInstrument
 
 from .types import (
     BatteryType,
@@ -26,29 +39,113 @@ from .types import (
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Reads of a 32 bit value looking torn until a plausible one, or two consecutive reads agree
+_TORN_READ_ATTEMPTS = 3
+
 
 def _create_controller(port: str, address: int):
     return minimalmodbus.Instrument(port=port, slaveaddress=address)
 
 
+def _create_rtu_controller(port: str, address: int):
+    return RtuInstrument(port=port, slaveaddress=address)
+
+
+def _create_simulated_controller(port: str, address: int):
+    return SimulatedInstrument(port=port, slaveaddress=address)
+
+
+def _torn(previous: int, value: int, counter: bool) -> bool:
+    # Whether a 32 bit value may pair a high and a low word from different updates
+    if counter:
+        return value < previous or value - previous >= 0x10000
+    return value != previous
+
+
+_port_locks: Dict[str, threading.RLock] = {}
+_port_locks_guard = threading.Lock()
+
+
+def port_lock(port: str) -> threading.RLock:
+    """
+    Transaction lock shared by every controller on a serial port
+    """
+    with _port_locks_guard:
+        lock = _port_locks.get(port)
+        if lock is None:
+            lock = _port_locks[port] = threading.RLock()
+        return lock
+
+
 class RenogyRoverController:
     """
     Communicates using the Modbus RTU protocol (via provided USB<->RS232 cable)
     """
 
-    def __init__(self, port: str, address: int = 1, baudrate: int = 9600, timeout: float = 0.5):
+    def __init__(
+        self,
+        port: str,
+        address: int = 1,
+        baudrate: int = 9600,
+        timeout: float = 0.5,
+        profile: Optional[DeviceProfile] = None,
+        detect_profile: bool = False,
+        transport: str = "minimalmodbus",
+    ):
         """
         :param port: Serial port (e.g., '/dev/ttyUSB0' or 'COM3')
         :param address: Modbus slave address (default is 1)
         :param baudrate: Baud rate for serial communication (default is 9600)
         :param timeout: Timeout for serial communication in seconds (default is 0.5)
-        """
-        self.device = _create_controller(port=port, address=address)
+        :param profile: Capabilities of the controller, `all_data()` skips the unsupported fields
+        :param detect_profile: Detect the capabilities when connecting (see `pyrover.profiles`)
+        :param transport: "minimalmodbus", "rtu" for the lighter built-in transport (see `pyrover.rtu`)
+            or "simulated" for an in-memory controller (see `pyrover.simulator`)
+        """
+        if transport == "minimalmodbus":
+            self.device = _create_controller(port=port, address=address)
+        elif transport == "rtu":
+            self.device = _create_rtu_controller(port=port, address=address)
+        elif transport == "simulated":
+            self.device = _create_simulated_controller(port=port, address=address)
+        else:
+            raise ValueError(f"unknown transport ({transport})")
         assert self.device.serial is not None, f"modbus failed to initialize; port={port} address={address}"
 
         self.device.serial.baudrate = baudrate
         self.device.serial.timeout = timeout
 
+        self.port = port
+        # Held during each transaction, hold it to run several transactions back to back
+        self.lock = port_lock(port)
+
+        # Prefetched registers are per thread so a prefetch doesn't leak into other threads' reads
+        self._local = threading.local()
+        # Time and values of the latest `all_data()` call
+        self._cache: Optional[Tuple[float, Dict[str, Any]]] = None
+        # Latest value of each 32 bit register pair read by `prefetch()`, by address, to detect torn reads
+        self._double_words: Dict[int, int] = {}
+        # Number of pairs read again because they looked torn
+        self.torn_reads = 0
+
+        # Active `profiling()` context
+        self._profiler: Optional[Profile] = None
+
+        self.profile = profile
+        if detect_profile:
+            self.detect_profile()
+
+    @property
+    def _registers(self) -> Optional[Dict[int, int]]:
+        # Register values prefetched by `prefetch()`, served instead of reading from the device
+        return getattr(self._local, "registers", None)
+
+    @_registers.setter
+    def _registers(self, registers: Optional[Dict[int, int]]) -> None:
+        self._local.registers = registers
+
     def all_data_keys(self) -> List[str]:
         return [
             key
@@ -57,29 +154,222 @@ class RenogyRoverController:
                 not key.startswith("_")
                 and not key.startswith("all_data")
                 and not key.startswith("set_")
-                and key not in ("stop_polling",)
+                and key not in ("stop_polling", "prefetch", "read_into", "cached_data", "detect_profile", "profiling")
                 and callable(getattr(self, key))
+                and (self.profile is None or key not in FIELD_REGISTERS or self.profile.supports(FIELD_REGISTERS[key]))
             )
         ]
 
+    @contextmanager
+    def profiling(self) -> Iterator[Profile]:
+        """
+        Record every transaction and the time spent in each public method (see `pyrover.profiling`)
+
+        Inside another `profiling()` context, the enclosing profile records everything too.
+        """
+        previous = self._profiler
+        profiler = Profile(self, parent=previous)
+        names = self.all_data_keys() + [key for key in dir(self) if key.startswith("set_")]
+        self._profiler = profiler
+        profiler._start(names + ["all_data", "read_into"])
+        try:
+            yield profiler
+        finally:
+            profiler._stop()
+            self._profiler = previous
+
+    def detect_profile(self) -> DeviceProfile:
+        """
+        Detect the capabilities of the controller and skip the unsupported fields from now on
+        """
+        self.profile = _detect_profile(self)
+        return self.profile
+
     def all_data(self) -> Dict[str, Any]:
-        return {key: getattr(self, key)() for key in self.all_data_keys()}
+        """
+        Values of every supported field, from the same poll cycle
+
+        Each register is read once, with the block reads of `prefetch()` (unless a prefetch
+        already covers it), so 32 bit values and fields sharing a register are consistent.
+        """
+        blocks = self.profile.blocks if self.profile is not None else BLOCKS
+        spans = [span for span in blocks if self._prefetched(span.address, span.number_of_registers) is None]
+        with self.prefetch(*spans) if spans else nullcontext():
+            data = {key: getattr(self, key)() for key in self.all_data_keys()}
+        self._cache = (time.time(), data)
+        return data
+
+    def cached_data(self, max_age: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Values of the latest `all_data()` call, from any thread
+
+        Returns immediately instead of waiting for the port while another thread
+        polls the controller. The controller is only read when there are no
+        values yet or they are older than `max_age`.
+
+        :param max_age: Maximum age of the values (seconds), None accepts any age
+        """
+        cache = self._cache
+        if cache is None or (max_age is not None and time.time() - cache[0] > max_age):
+            return dict(self.all_data())
+        return dict(cache[1])
+
+    @property
+    def cached_at(self) -> Optional[float]:
+        """
+        Time of the latest `all_data()` call
+        """
+        cache = self._cache
+        return cache[0] if cache is not None else None
+
+    @contextmanager
+    def prefetch(self, *spans: RegisterSpan, registers: Optional[Dict[int, int]] = None) -> Iterator[Dict[int, int]]:
+        """
+        Read each span in a single transaction and serve getters from the result
+
+        Getters called inside the context read from the prefetched registers
+        instead of issuing their own transaction, e.g.:
+
+            with rover.prefetch(SETTINGS_BLOCK):
+                capacity, battery = rover.nominal_battery_capacity(), rover.battery_type()
+
+        A 32 bit value read while the controller updates it can pair the new low word with
+        the old high word. The pairs of `DOUBLE_WORDS` going backwards, jumping by a whole
+        high word or changing when they are constant are read again until two reads agree.
+
+        :param spans: Register spans to read (see `pyrover.registers`)
+        :param registers: Register values that were already read, served along with the spans
+        :return: The prefetched registers keyed by address
+        """
+        registers = {**(self._registers or {}), **(registers or {})}
+        # The spans are read back to back, without other transactions in between
+        with self.lock, self._step("prefetch"):
+            for span in spans:
+                fresh = self._prefetched(span.address, span.number_of_registers) is None
+                values = self._read_registers(span.address, number_of_registers=span.number_of_registers)
+                registers.update(zip(range(span.address, span.end), values))
+                if fresh:
+                    self._check_double_words(span, registers)
+
+        previous = self._registers
+        self._registers = registers
+        try:
+            yield registers
+        finally:
+            self._registers = previous
+
+    def read_into(self, span: RegisterSpan, buffer: Any, offset: int = 0) -> None:
+        """
+        Read a span into a caller supplied buffer such as an `array("H")` or a memoryview
+
+        Combined with `pyrover.decoders.BufferDecoder` this lets high rate sampling reuse the
+        same buffer on every cycle. Devices providing `read_registers_into()` fill the buffer
+        directly, others are read as usual and the registers are copied into the buffer.
+
+        :param span: Registers to read
+        :param buffer: Mutable buffer of 16 bit registers
+        :param offset: Index in the buffer of the span's first register
+        """
+        read_registers_into = getattr(self.device, "read_registers_into", None)
+        if read_registers_into is not None and self._prefetched(span.address, span.number_of_registers) is None:
+            self._transaction(
+                "read_registers_into",
+                span.address,
+                span.number_of_registers,
+                lambda: read_registers_into(span.address, buffer, offset, span.number_of_registers),
+            )
+            return
+        values = self._read_registers(span.address, number_of_registers=span.number_of_registers)
+        for i in range(span.number_of_registers):
+            buffer[offset + i] = values[i]
+
+    def _check_double_words(self, span: RegisterSpan, registers: Dict[int, int]) -> None:
+        # Replace the torn 32 bit values of a span just read by a consistent reading
+        for name, counter in DOUBLE_WORDS.items():
+            if not span.contains(FIELD_REGISTERS[name]):
+                continue
+            address = FIELD_REGISTERS[name].address
+            value = registers[address] << 16 | registers[address + 1]
+            previous = self._double_words.get(address)
+            if previous is not None and _torn(previous, value, counter):
+                self.torn_reads += 1
+                torn = value
+                for _ in range(_TORN_READ_ATTEMPTS):
+                    high, low = self._transaction(
+                        "read_registers", address, 2, lambda: self.device.read_registers(address, number_of_registers=2)
+                    )
+                    value, last = high << 16 | low, value
+                    if value == last or not _torn(previous, value, counter):
+                        break
+                else:
+                    logger.warning(f"{name} still changing after {_TORN_READ_ATTEMPTS} reads, keeping {value}")
+                logger.info(f"{name} read as {torn} after {previous}, read again as {value}")
+                registers[address], registers[address + 1] = value >> 16, value & 0xFFFF
+            self._double_words[address] = value
+
+    def _transaction(self, kind: str, address: int, number_of_registers: int, send: Callable[[], T]) -> T:
+        # Every exchange with the device goes through here
+        profiler = self._profiler
+        if profiler is not None:
+            return profiler.transaction(self.lock, kind, address, number_of_registers, send)
+        with self.lock:
+            return send()
+
+    def _step(self, name: str) -> ContextManager[None]:
+        profiler = self._profiler
+        return profiler.step(name) if profiler is not None else nullcontext()
+
+    def _prefetched(self, address: int, number_of_registers: int) -> Optional[List[int]]:
+        if self._registers is None:
+            return None
+        try:
+            return [self._registers[a] for a in range(address, address + number_of_registers)]
+        except KeyError:
+            return None
 
     def _read_register(self, address: int, **kwargs) -> int:
-        value = self.device.read_register(address, **kwargs)
-        logger.debug(f"read_register[address={hex(address)} value={hex(value)}]")
+        prefetched = self._prefetched(address, 1)
+        if prefetched is not None:
+            return prefetched[0]
+        value = self._transaction("read_register", address, 1, lambda: self.device.read_register(address, **kwargs))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"read_register[address={hex(address)} value={hex(value)}]")
         return value
 
     def _read_registers(self, address: int, number_of_registers: int, **kwargs) -> List[int]:
-        values = self.device.read_registers(address, number_of_registers=number_of_registers, **kwargs)
-        logger.debug(f"read_registers[address={hex(address)} value={list(hex(v) for v in values)}]")
+        prefetched = self._prefetched(address, number_of_registers)
+        if prefetched is not None:
+            return prefetched
+        values = self._transaction(
+            "read_registers",
+            address,
+            number_of_registers,
+            lambda: self.device.read_registers(address, number_of_registers=number_of_registers, **kwargs),
+        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"read_registers[address={hex(address)} value={list(hex(v) for v in values)}]")
         return values
 
     def _read_string(self, address: int, number_of_registers: int, **kwargs) -> str:
-        value = self.device.read_string(address, number_of_registers=number_of_registers, **kwargs)
-        logger.debug(f'read_string[address={hex(address)} value="{value}"]')
+        prefetched = self._prefetched(address, number_of_registers)
+        if prefetched is not None:
+            # Same decoding as minimalmodbus: two characters per register, high byte first
+            return bytes(b for register in prefetched for b in (register >> 8, register & 0xFF)).decode("latin1")
+        value = self._transaction(
+            "read_string",
+            address,
+            number_of_registers,
+            lambda: self.device.read_string(address, number_of_registers=number_of_registers, **kwargs),
+        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f'read_string[address={hex(address)} value="{value}"]')
         return value
 
+    def _write_register(self, address: int, value: int) -> None:
+        self._transaction("write_register", address, 1, lambda: self.device.write_register(address, value))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"write_register[address={hex(address)} value={hex(value)}]")
+
     # System information
     def max_system_voltage(self) -> int:
         """
@@ -351,7 +641,7 @@ class RenogyRoverController:
 
         :param state: Toggle
         """
-        self.device.write_register(0x010A, state.value)
+        self._write_register(0x010A, state.value)
 
     def street_light_status(self) -> Union[Toggle, None]:
         """
@@ -382,7 +672,7 @@ class RenogyRoverController:
         if intensity < 0 or intensity > 100:
             logger.warning(f"intensity ({intensity}) must be between 0 and 100")
             return
-        self.device.write_register(0xE001, intensity)
+        self._write_register(0xE001, intensity)
 
     def charging_state(self) -> Union[ChargingState, None]:
         """
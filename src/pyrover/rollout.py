@@ -0,0 +1,274 @@
+"""
+Push a settings profile to a fleet of Renogy Rover controllers
+
+A profile maps setting names (the names of the `RenogyRoverController` getters)
+to the values they should have, e.g.:
+
+    profile = {"battery_type": BatteryType.LITHIUM, "boost_charging_voltage": 14.4}
+    report = rollout([Device("/dev/ttyUSB0", 1), Device("/dev/ttyUSB1", 1)], profile, dry_run=True)
+    print(report.summary())
+
+The current settings of each device are read with a single block read of the
+0xE002-0xE021 registers, only the registers that differ are written, and the
+block is read again to verify the result. Devices sharing a serial port are
+handled one after the other while separate ports are handled in parallel.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from enum import IntFlag
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+import logging
+
+from .registers import FIELD_REGISTERS, SETTINGS_BLOCK
+from .renogy_rover import RenogyRoverController
+
+logger = logging.getLogger(__name__)
+
+
+class _Setting(NamedTuple):
+    address: int
+    shift: int = 0
+    mask: int = 0xFFFF
+    scale: int = 1
+
+    def encode(self, value: Any) -> int:
+        raw = int(value) if isinstance(value, IntFlag) else round(value * self.scale)
+        if raw < 0 or raw > self.mask:
+            raise ValueError(f"value ({value}) out of range for register {hex(self.address)}")
+        return raw
+
+    def extract(self, register: int) -> int:
+        return register >> self.shift & self.mask
+
+    def merge(self, register: int, raw: int) -> int:
+        return register & ~(self.mask << self.shift) & 0xFFFF | raw << self.shift
+
+
+# Writable settings. `nominal_battery_capacity` (0xE002) and `recognized_voltage` (low byte
+# of 0xE003) are read-only and are therefore not listed.
+_SETTINGS: Dict[str, _Setting] = {
+    "system_voltage_setting": _Setting(0xE003, shift=8, mask=0xFF),
+    "battery_type": _Setting(0xE004),
+    "over_voltage_threshold": _Setting(0xE005, scale=10),
+    "charging_voltage_limit": _Setting(0xE006, scale=10),
+    "equalizing_charging_voltage": _Setting(0xE007, scale=10),
+    "boost_charging_voltage": _Setting(0xE008, scale=10),
+    "floating_voltage": _Setting(0xE009, scale=10),
+    "boost_charging_recovery_voltage": _Setting(0xE00A, scale=10),
+    "over_discharge_recovery_voltage": _Setting(0xE00B, scale=10),
+    "under_voltage_warning_level": _Setting(0xE00C, scale=10),
+    "over_discharge_voltage": _Setting(0xE00D, scale=10),
+    "discharging_limit_voltage": _Setting(0xE00E, scale=10),
+    "end_of_charge_soc": _Setting(0xE00F, shift=8, mask=0xFF),
+    "end_of_discharge_soc": _Setting(0xE00F, mask=0xFF),
+    "over_discharge_time_delay": _Setting(0xE010),
+    "equalizing_charging_time": _Setting(0xE011),
+    "boost_charging_time": _Setting(0xE012),
+    "equalizing_charging_interval": _Setting(0xE013),
+    "temperature_compensation_factor": _Setting(0xE014),
+    "first_stage_operating_duration": _Setting(0xE015),
+    "first_stage_operating_power": _Setting(0xE016),
+    "second_stage_operating_duration": _Setting(0xE017),
+    "second_stage_operating_power": _Setting(0xE018),
+    "third_stage_operating_duration": _Setting(0xE019),
+    "third_stage_operating_power": _Setting(0xE01A),
+    "morning_on_operating_duration": _Setting(0xE01B),
+    "morning_on_operating_power": _Setting(0xE01C),
+    "load_working_mode": _Setting(0xE01D),
+    "light_control_delay": _Setting(0xE01E),
+    "light_control_voltage": _Setting(0xE01F),
+    "led_load_current_setting": _Setting(0xE020, scale=100),  # value is N * 10 mA
+    "charging_mode_controlled_by": _Setting(0xE021, shift=10, mask=0x01),
+    "special_power_control_state": _Setting(0xE021, shift=9, mask=0x01),
+    "each_night_on_function_state": _Setting(0xE021, shift=8, mask=0x01),
+    "no_charging_below_freezing": _Setting(0xE021, shift=2, mask=0x01),
+    "charging_method": _Setting(0xE021, mask=0x01),
+}
+
+
+class Device(NamedTuple):
+    """
+    Location of a controller on a serial bus
+    """
+
+    port: str
+    address: int = 1
+
+
+class SettingChange(NamedTuple):
+    name: str
+    current: Any
+    target: Any
+
+
+class RolloutResult(NamedTuple):
+    device: Device
+    changes: List[SettingChange]
+    applied: bool = False
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class RolloutReport(NamedTuple):
+    results: List[RolloutResult]
+    dry_run: bool = False
+
+    @property
+    def succeeded(self) -> List[RolloutResult]:
+        return [result for result in self.results if result.ok]
+
+    @property
+    def failed(self) -> List[RolloutResult]:
+        return [result for result in self.results if not result.ok]
+
+    def summary(self) -> str:
+        """
+        Human readable report, one line per device followed by its pending/applied changes
+        """
+        lines = []
+        for result in self.results:
+            device = f"{result.device.port}@{result.device.address}"
+            if not result.ok:
+                status = f"FAILED ({result.error})"
+            elif not result.changes:
+                status = "up to date"
+            elif result.applied:
+                status = f"applied {len(result.changes)} change(s)"
+            else:
+                status = f"{len(result.changes)} pending change(s)"
+            lines.append(f"{device}: {status}")
+            lines.extend(f"    {c.name}: {c.current} -> {c.target}" for c in result.changes)
+        lines.append(
+            f"{len(self.succeeded)} succeeded, {len(self.failed)} failed{' (dry run)' if self.dry_run else ''}"
+        )
+        return "\n".join(lines)
+
+
+def validate_profile(profile: Dict[str, Any]) -> None:
+    """
+    Raise a ValueError if the profile contains unknown, read-only or out of range settings
+    """
+    for name, value in profile.items():
+        if name not in _SETTINGS:
+            if name in FIELD_REGISTERS:
+                raise ValueError(f"setting ({name}) is read-only")
+            raise ValueError(f"unknown setting ({name})")
+        _SETTINGS[name].encode(value)
+
+
+def diff_settings(controller: RenogyRoverController, profile: Dict[str, Any]) -> List[SettingChange]:
+    """
+    Compare the settings of a controller to a profile using a single block read
+
+    :param controller: Controller to compare
+    :param profile: Setting values keyed by setting name
+    :return: The settings that differ from the profile
+    """
+    validate_profile(profile)
+    with controller.prefetch(SETTINGS_BLOCK) as registers:
+        return _diff(controller, registers, profile)
+
+
+def apply_settings(
+    controller: RenogyRoverController, profile: Dict[str, Any], dry_run: bool = False
+) -> List[SettingChange]:
+    """
+    Write the settings of a profile that differ from the controller's current settings
+
+    Settings packed in the same register are merged so each register is written at most once.
+    The settings block is read again after writing and an IOError is raised if any of the
+    changes did not take effect.
+
+    :param controller: Controller to update
+    :param profile: Setting values keyed by setting name
+    :param dry_run: Only compute the changes, do not write anything
+    :return: The settings that differed from the profile
+    """
+    validate_profile(profile)
+    with controller.prefetch(SETTINGS_BLOCK) as registers:
+        changes = _diff(controller, registers, profile)
+        current = dict(registers)
+    if dry_run or not changes:
+        return changes
+
+    targets = dict(current)
+    for change in changes:
+        setting = _SETTINGS[change.name]
+        targets[setting.address] = setting.merge(targets[setting.address], setting.encode(change.target))
+
+    for address in sorted(targets):
+        if targets[address] != current[address]:
+            controller._write_register(address, targets[address])
+
+    with controller.prefetch(SETTINGS_BLOCK) as registers:
+        remaining = _diff(controller, registers, profile)
+    if remaining:
+        raise IOError(f"settings not applied: {', '.join(change.name for change in remaining)}")
+    return changes
+
+
+def rollout(
+    devices: Sequence[Device],
+    profile: Dict[str, Any],
+    max_concurrency: int = 4,
+    dry_run: bool = False,
+    baudrate: int = 9600,
+    timeout: float = 0.5,
+) -> RolloutReport:
+    """
+    Apply a settings profile to many controllers
+
+    Devices on the same port are updated one at a time (they share the bus) while up to
+    `max_concurrency` ports are updated in parallel. A failure on one device is recorded in
+    the report and does not stop the rollout.
+
+    :param devices: Controllers to update
+    :param profile: Setting values keyed by setting name
+    :param max_concurrency: Maximum number of ports updated in parallel
+    :param dry_run: Only report the changes, do not write anything
+    :param baudrate: Baud rate for serial communication
+    :param timeout: Timeout for serial communication in seconds
+    :return: One result per device, in the same order as `devices`
+    """
+    if max_concurrency < 1:
+        raise ValueError(f"max_concurrency ({max_concurrency}) must be at least 1")
+    validate_profile(profile)
+
+    by_port: Dict[str, List[Device]] = {}
+    for device in devices:
+        by_port.setdefault(device.port, []).append(device)
+
+    def rollout_port(port_devices: List[Device]) -> List[RolloutResult]:
+        return [_rollout_device(device, profile, dry_run, baudrate, timeout) for device in port_devices]
+
+    results: Dict[Device, RolloutResult] = {}
+    if by_port:
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(by_port))) as executor:
+            for port_results in executor.map(rollout_port, by_port.values()):
+                results.update((result.device, result) for result in port_results)
+    return RolloutReport(results=[results[device] for device in devices], dry_run=dry_run)
+
+
+def _rollout_device(
+    device: Device, profile: Dict[str, Any], dry_run: bool, baudrate: int, timeout: float
+) -> RolloutResult:
+    changes: List[SettingChange] = []
+    try:
+        controller = RenogyRoverController(port=device.port, address=device.address, baudrate=baudrate, timeout=timeout)
+        changes = apply_settings(controller, profile, dry_run=dry_run)
+    except Exception as e:
+        logger.warning(f"settings rollout failed for {device.port}@{device.address}: {e}")
+        return RolloutResult(device=device, changes=changes, error=str(e) or type(e).__name__)
+    return RolloutResult(device=device, changes=changes, applied=bool(changes) and not dry_run)
+
+
+def _diff(controller: RenogyRoverController, registers: Dict[int, int], profile: Dict[str, Any]) -> List[SettingChange]:
+    changes = []
+    for name, target in profile.items():
+        setting = _SETTINGS[name]
+        if setting.extract(registers[setting.address]) != setting.encode(target):
+            changes.append(SettingChange(name=name, current=getattr(controller, name)(), target=target))
+    return changes
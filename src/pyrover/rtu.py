@@ -0,0 +1,225 @@
+"""
+Lightweight Modbus RTU transport
+
+A drop-in replacement for the subset of `minimalmodbus.Instrument` used by
+`RenogyRoverController`, with less work per transaction:
+
+- the CRC is computed from a precomputed table instead of bit by bit
+- read requests are built once and reused (the controller reads the same spans on every poll)
+- the 3.5 character silence between frames is derived from the baud rate and
+  only the part of it that has not already elapsed is waited
+- responses are read up to their expected length instead of until the timeout
+
+Select it with:
+
+    rover = RenogyRoverController(port="/dev/ttyUSB0", transport="rtu")
+
+Errors are reported with the minimalmodbus exceptions so callers handle both
+transports the same way.
+"""
+
+from typing import Any, Dict, List, Tuple
+import logging
+import struct
+import threading
+import time
+
+import minimalmodbus
+import serial
+
+logger = logging.getLogger(__name__)
+
+READ_HOLDING_REGISTERS = 0x03
+READ_INPUT_REGISTERS = 0x04
+WRITE_MULTIPLE_REGISTERS = 0x10
+
+# Bits per character: start, 8 data bits, parity (or a second stop bit) and stop
+_BITS_PER_CHARACTER = 11
+# Fixed silence above 19200 bauds (Modbus over serial line specification, 2.5.1.1)
+_MIN_SILENCE = 0.00175
+
+_EXCEPTIONS = {
+    1: (minimalmodbus.IllegalRequestError, "Slave reported illegal function"),
+    2: (minimalmodbus.IllegalRequestError, "Slave reported illegal data address"),
+    3: (minimalmodbus.IllegalRequestError, "Slave reported illegal data value"),
+    4: (minimalmodbus.SlaveReportedException, "Slave reported device failure"),
+    6: (minimalmodbus.SlaveDeviceBusyError, "Slave reported device busy"),
+    7: (minimalmodbus.NegativeAcknowledgeError, "Slave reported negative acknowledge"),
+}
+
+
+def _crc_table() -> Tuple[int, ...]:
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return tuple(table)
+
+
+_CRC_TABLE = _crc_table()
+
+
+def crc16(data: bytes) -> int:
+    """
+    Modbus CRC of a frame, sent low byte first
+    """
+    crc = 0xFFFF
+    table = _CRC_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def silence_time(baudrate: int) -> float:
+    """
+    Minimum silence between two frames (seconds)
+    """
+    if baudrate > 19200:
+        return _MIN_SILENCE
+    return 3.5 * _BITS_PER_CHARACTER / baudrate
+
+
+def _frame(pdu: bytes) -> bytes:
+    return pdu + struct.pack("<H", crc16(pdu))
+
+
+# One serial port per device path, shared by the instruments of the devices on the bus
+_ports: Dict[str, serial.Serial] = {}
+# End of the last frame on each port (time.monotonic())
+_last_frame: Dict[str, float] = {}
+_ports_lock = threading.Lock()
+
+
+def _open(port: str) -> serial.Serial:
+    with _ports_lock:
+        connection = _ports.get(port)
+        if connection is None:
+            connection = _ports[port] = serial.Serial(
+                port=port,
+                baudrate=9600,
+                parity=serial.PARITY_NONE,
+                bytesize=8,
+                stopbits=1,
+                timeout=0.05,
+                write_timeout=2.0,
+            )
+        elif not connection.is_open:
+            connection.open()
+        return connection
+
+
+class RtuInstrument:
+    """
+    Modbus RTU master for one slave, with the `minimalmodbus.Instrument` methods used by the controller
+    """
+
+    def __init__(self, port: str, slaveaddress: int, connection: Any = None):
+        """
+        :param port: Serial port
+        :param slaveaddress: Modbus slave address
+        :param connection: Open serial connection to use instead of opening `port`
+        """
+        self.port = port
+        self.address = slaveaddress
+        self.serial = connection if connection is not None else _open(port)
+        # Read requests by (slave address, function code, register address, number of registers)
+        self._requests: Dict[Tuple[int, int, int, int], bytes] = {}
+
+    def read_register(
+        self, registeraddress: int, number_of_decimals: int = 0, functioncode: int = 3, signed: bool = False
+    ) -> Any:
+        value = self._read(registeraddress, 1, functioncode)[0]
+        if signed and value & 0x8000:
+            value -= 0x10000
+        return value / 10**number_of_decimals if number_of_decimals else value
+
+    def read_registers(self, registeraddress: int, number_of_registers: int, functioncode: int = 3) -> List[int]:
+        return list(self._read(registeraddress, number_of_registers, functioncode))
+
+    def read_registers_into(
+        self, registeraddress: int, buffer: Any, offset: int, number_of_registers: int, functioncode: int = 3
+    ) -> None:
+        """
+        Read registers into a caller supplied buffer (see `RenogyRoverController.read_into()`)
+        """
+        for i, value in enumerate(self._read(registeraddress, number_of_registers, functioncode)):
+            buffer[offset + i] = value
+
+    def read_string(self, registeraddress: int, number_of_registers: int = 16, functioncode: int = 3) -> str:
+        values = self._read(registeraddress, number_of_registers, functioncode)
+        return struct.pack(f">{number_of_registers}H", *values).decode("latin1")
+
+    def write_register(
+        self,
+        registeraddress: int,
+        value: Any,
+        number_of_decimals: int = 0,
+        functioncode: int = 16,
+        signed: bool = False,
+    ) -> None:
+        if functioncode != WRITE_MULTIPLE_REGISTERS:
+            raise ValueError(f"unsupported function code ({functioncode})")
+        value = int(round(value * 10**number_of_decimals))
+        if signed and value < 0:
+            value += 0x10000
+        request = _frame(struct.pack(">BBHHBH", self.address, WRITE_MULTIPLE_REGISTERS, registeraddress, 1, 2, value))
+        response = self._exchange(request, WRITE_MULTIPLE_REGISTERS, 8)
+        if response[:6] != request[:6]:
+            raise minimalmodbus.InvalidResponseError(f"write response does not match the request: {response.hex()}")
+
+    def _read(self, registeraddress: int, number_of_registers: int, functioncode: int) -> Tuple[int, ...]:
+        if functioncode not in (READ_HOLDING_REGISTERS, READ_INPUT_REGISTERS):
+            raise ValueError(f"unsupported function code ({functioncode})")
+        key = (self.address, functioncode, registeraddress, number_of_registers)
+        request = self._requests.get(key)
+        if request is None:
+            request = self._requests[key] = _frame(
+                struct.pack(">BBHH", self.address, functioncode, registeraddress, number_of_registers)
+            )
+        response = self._exchange(request, functioncode, 5 + 2 * number_of_registers)
+        if response[2] != 2 * number_of_registers:
+            raise minimalmodbus.InvalidResponseError(f"wrong byte count in response: {response.hex()}")
+        return struct.unpack_from(f">{number_of_registers}H", response, 3)
+
+    def _exchange(self, request: bytes, functioncode: int, length: int) -> bytes:
+        # Send a request and read its response, `length` bytes when successful
+        connection = self.serial
+        silence = silence_time(connection.baudrate)
+        remaining = _last_frame.get(self.port, 0.0) + silence - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        try:
+            connection.write(request)
+            # Address, function code and either the byte count or the exception code
+            response = connection.read(3)
+            if len(response) == 3:
+                response += connection.read((5 if response[1] & 0x80 else length) - 3)
+        finally:
+            _last_frame[self.port] = time.monotonic()
+        try:
+            return self._check(response, functioncode, length)
+        except minimalmodbus.InvalidResponseError as e:
+            logger.debug(f"{self.port}@{self.address}: {e}")
+            # Drop what is left of a garbled response so it is not read as the next one
+            connection.reset_input_buffer()
+            raise
+
+    def _check(self, response: bytes, functioncode: int, length: int) -> bytes:
+        if not response:
+            raise minimalmodbus.NoResponseError("No communication with the instrument (no answer)")
+        if len(response) < 5:
+            raise minimalmodbus.InvalidResponseError(f"response too short: {response.hex()}")
+        if struct.unpack_from("<H", response, len(response) - 2)[0] != crc16(response[:-2]):
+            raise minimalmodbus.InvalidResponseError(f"wrong CRC in response: {response.hex()}")
+        if response[0] != self.address:
+            raise minimalmodbus.InvalidResponseError(f"response from slave {response[0]}, expected {self.address}")
+        if response[1] == functioncode | 0x80:
+            error, message = _EXCEPTIONS.get(
+                response[2], (minimalmodbus.SlaveReportedException, f"Slave reported error code {response[2]}")
+            )
+            raise error(message)
+        if response[1] != functioncode or len(response) != length:
+            raise minimalmodbus.InvalidResponseError(f"unexpected response: {response.hex()}")
+        return response
@@ -0,0 +1,256 @@
+"""
+Poll schedule with a separate rate for each group of registers
+
+Each `PollGroup` is read at its own interval. Groups are prioritised by rate
+(the fastest group wins when several are due) and slow groups are read in
+chunks, one chunk per transaction, so a fast group is never delayed by more
+than one slow chunk, e.g.:
+
+    scheduler = PollScheduler(RenogyRoverController(port="/dev/ttyUSB0"))
+    scheduler.subscribe(lambda snapshot: print(snapshot.values["solar_voltage"]), group="telemetry")
+    scheduler.start()
+    ...
+    for stats in scheduler.stats():
+        print(stats)
+"""
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+import logging
+import threading
+import time
+
+from .poller import Snapshot, Subscriber
+from .profiles import DeviceProfile
+from .registers import FIELD_REGISTERS, SETTINGS_BLOCK, SYSTEM_INFO_BLOCK, RegisterSpan
+from .renogy_rover import RenogyRoverController
+
+logger = logging.getLogger(__name__)
+
+
+class PollGroup(NamedTuple):
+    """
+    Registers read together at a given interval
+    """
+
+    name: str
+    span: RegisterSpan
+    interval: float
+    # Maximum registers read per transaction, None reads the whole span at once
+    chunk_size: Optional[int] = None
+
+    @property
+    def fields(self) -> List[str]:
+        """
+        Names of the getters whose registers are all in the group
+        """
+        return [name for name, span in FIELD_REGISTERS.items() if self.span.contains(span)]
+
+    def chunks(self) -> List[RegisterSpan]:
+        """
+        Split the span in transactions of at most `chunk_size` registers without splitting a field
+        """
+        if self.chunk_size is None or self.chunk_size >= self.span.number_of_registers:
+            return [self.span]
+        # Boundaries falling inside a multi-register field (e.g. a 32-bit counter) are not allowed
+        inner = {a for span in FIELD_REGISTERS.values() for a in range(span.address + 1, span.end)}
+        chunks = []
+        start = self.span.address
+        while start < self.span.end:
+            end = min(start + self.chunk_size, self.span.end)
+            while end in inner and end > start + 1:
+                end -= 1
+            while end in inner and end < self.span.end:
+                end += 1
+            chunks.append(RegisterSpan(start, end - start))
+            start = end
+        return chunks
+
+
+DEFAULT_GROUPS = (
+    PollGroup("telemetry", RegisterSpan(0x0100, 10), interval=0.2),  # 0x0100-0x0109
+    PollGroup("status", RegisterSpan(0x010B, 24), interval=5.0, chunk_size=12),  # 0x010B-0x0122
+    PollGroup("settings", SETTINGS_BLOCK, interval=300.0, chunk_size=8),
+    PollGroup("system_info", SYSTEM_INFO_BLOCK, interval=3600.0, chunk_size=8),
+)
+
+
+class GroupStats(NamedTuple):
+    name: str
+    interval: float
+    samples: int
+    errors: int
+    # Completed samples per second
+    achieved_rate: Optional[float]
+    # Delay between a sample's scheduled time and its first read (seconds)
+    jitter_mean: Optional[float]
+    jitter_max: Optional[float]
+
+
+class _GroupState:
+    def __init__(self, group: PollGroup, deadline: float, profile: Optional[DeviceProfile] = None):
+        self.group = group
+        self.fields = group.fields
+        self.chunks = group.chunks()
+        if profile is not None:
+            self.fields = [name for name in self.fields if profile.supports(FIELD_REGISTERS[name])]
+            self.chunks = [part for chunk in self.chunks for part in profile.trim(chunk)]
+        self.deadline = deadline
+        self.next_chunk = 0
+        self.registers: Dict[int, int] = {}
+        self.lateness = 0.0
+
+        self.samples = 0
+        self.errors = 0
+        self.first_completed: Optional[float] = None
+        self.last_completed: Optional[float] = None
+        self.lateness_sum = 0.0
+        self.lateness_max = 0.0
+
+    @property
+    def in_progress(self) -> bool:
+        return self.next_chunk > 0
+
+    def reschedule(self, now: float) -> None:
+        self.next_chunk = 0
+        self.registers = {}
+        self.deadline += self.group.interval
+        if self.deadline <= now:
+            # Fell behind, skip the missed samples instead of bursting to catch up
+            missed = int((now - self.deadline) // self.group.interval) + 1
+            self.deadline += missed * self.group.interval
+
+    def stats(self) -> GroupStats:
+        achieved_rate = None
+        if self.samples > 1 and self.first_completed is not None and self.last_completed is not None:
+            elapsed = self.last_completed - self.first_completed
+            achieved_rate = (self.samples - 1) / elapsed if elapsed > 0 else None
+        return GroupStats(
+            name=self.group.name,
+            interval=self.group.interval,
+            samples=self.samples,
+            errors=self.errors,
+            achieved_rate=achieved_rate,
+            jitter_mean=self.lateness_sum / self.samples if self.samples else None,
+            jitter_max=self.lateness_max if self.samples else None,
+        )
+
+
+class PollScheduler:
+    def __init__(
+        self,
+        controller: RenogyRoverController,
+        groups: Sequence[PollGroup] = DEFAULT_GROUPS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        :param controller: Controller to poll
+        :param groups: Register groups and their intervals, the registers the controller's profile
+            doesn't support are skipped
+        :param clock: Monotonic clock used for scheduling (seconds)
+        """
+        if len({group.name for group in groups}) != len(groups):
+            raise ValueError("poll group names must be unique")
+        self.controller = controller
+        self.clock = clock
+        self.latest: Optional[Snapshot] = None
+
+        now = clock()
+        # Sorted by rate so the fastest due group is always picked first
+        states = [_GroupState(group, now, controller.profile) for group in sorted(groups, key=lambda g: g.interval)]
+        self._states = [state for state in states if state.chunks]
+        self._subscribers: List[Tuple[Subscriber, Optional[str]]] = []
+        self._values: Dict[str, Any] = {}
+        self._registers: Dict[int, int] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, subscriber: Subscriber, group: Optional[str] = None) -> None:
+        """
+        Call `subscriber` with the merged snapshot of all groups each time a group completes
+
+        :param subscriber: Callback receiving the snapshot
+        :param group: Only call the subscriber when this group completes
+        """
+        self._subscribers.append((subscriber, group))
+
+    def stats(self) -> List[GroupStats]:
+        """
+        Achieved rate and jitter of each group
+        """
+        return [state.stats() for state in self._states]
+
+    def step(self) -> float:
+        """
+        Perform the next transaction, if any is due
+
+        :return: Seconds until the next transaction is due (0 if a transaction was performed)
+        """
+        now = self.clock()
+        state = next((s for s in self._states if s.in_progress or s.deadline <= now), None)
+        if state is None:
+            return max(0.0, min(s.deadline for s in self._states) - now)
+
+        if not state.in_progress:
+            state.lateness = now - state.deadline
+
+        chunk = state.chunks[state.next_chunk]
+        try:
+            with self.controller.prefetch(chunk) as registers:
+                state.registers.update((a, registers[a]) for a in range(chunk.address, chunk.end))
+            state.next_chunk += 1
+            if state.next_chunk == len(state.chunks):
+                # Decoding can fail too (e.g. a getter raising on an unexpected value)
+                self._complete(state)
+        except Exception as e:
+            logger.warning(f"poll group {state.group.name} failed: {e}")
+            state.errors += 1
+            state.reschedule(self.clock())
+        return 0.0
+
+    def start(self) -> None:
+        """
+        Poll in a background thread until `stop()` is called
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="pyrover-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            delay = self.step()
+            if delay > 0:
+                self._stop.wait(delay)
+
+    def _complete(self, state: _GroupState) -> None:
+        timestamp = time.time()
+        with self.controller.prefetch(registers=state.registers):
+            values = {name: getattr(self.controller, name)() for name in state.fields}
+        self._values.update(values)
+        self._registers.update(state.registers)
+
+        now = self.clock()
+        state.samples += 1
+        state.lateness_sum += state.lateness
+        state.lateness_max = max(state.lateness_max, state.lateness)
+        if state.first_completed is None:
+            state.first_completed = now
+        state.last_completed = now
+        state.reschedule(now)
+
+        snapshot = Snapshot(timestamp=timestamp, values=dict(self._values), registers=dict(self._registers))
+        self.latest = snapshot
+        for subscriber, group in list(self._subscribers):
+            if group is not None and group != state.group.name:
+                continue
+            try:
+                subscriber(snapshot)
+            except Exception:
+                logger.exception(f"scheduler subscriber failed ({subscriber})")
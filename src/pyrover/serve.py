@@ -0,0 +1,239 @@
+"""
+HTTP/JSON API serving the poller's latest snapshots
+
+Clients never touch the serial port: every request is answered from the
+snapshots the poller already read, so any number of clients cost no extra
+Modbus transactions. Run it with:
+
+    python -m pyrover.serve /dev/ttyUSB0 --address 1 --interval 1 --http-port 8080
+
+Endpoints:
+
+    GET /snapshot         latest values of every field
+    GET /fields/<name>    latest value of one field, with its unit
+    GET /history          recent snapshots (`?field=<name>` for a single field, `?limit=<n>`)
+
+Responses carry an ETag that changes with each new sample. A request with a
+matching If-None-Match header gets a 304, or with `?wait=<seconds>` is held
+until the next sample arrives (long-poll).
+"""
+
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import json
+import logging
+import os
+import threading
+
+from .fields import FIELDS, encode_value
+from .poller import Poller, Snapshot
+from .renogy_rover import RenogyRoverController
+
+logger = logging.getLogger(__name__)
+
+# Upper bound of the long-poll wait (seconds)
+MAX_WAIT = 60.0
+
+
+class SnapshotCache:
+    """
+    Latest snapshot and recent history, subscribe `update` to a poller
+    """
+
+    def __init__(self, history: int = 600):
+        """
+        :param history: Number of snapshots kept for `/history`
+        """
+        self.sequence = 0
+        self.latest: Optional[Snapshot] = None
+        self.history: Deque[Tuple[int, Snapshot]] = deque(maxlen=history)
+
+        self._condition = threading.Condition()
+        # Differs between runs so ETags from a previous run never match
+        self._token = os.urandom(4).hex()
+        self._body: Optional[bytes] = None
+
+    def update(self, snapshot: Snapshot) -> None:
+        with self._condition:
+            self.sequence += 1
+            self.latest = snapshot
+            self.history.append((self.sequence, snapshot))
+            self._body = None
+            self._condition.notify_all()
+
+    def etag(self, sequence: Optional[int] = None) -> str:
+        return f'"{self._token}-{self.sequence if sequence is None else sequence}"'
+
+    def current(self) -> Tuple[int, Optional[Snapshot]]:
+        """
+        Sequence number and latest snapshot, read together
+        """
+        with self._condition:
+            return self.sequence, self.latest
+
+    def wait(self, etag: Optional[str], timeout: float) -> None:
+        """
+        Wait up to `timeout` seconds for a sample newer than the one identified by `etag`
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.latest is not None and self.etag() != etag, timeout)
+
+    def snapshot_body(self) -> Tuple[int, bytes]:
+        """
+        Sequence number and JSON of the latest snapshot, encoded once per sample however many clients ask for it
+        """
+        with self._condition:
+            if self._body is None:
+                self._body = _dumps(_snapshot_json(self.sequence, self.latest))
+            return self.sequence, self._body
+
+
+def _snapshot_json(sequence: int, snapshot: Optional[Snapshot]) -> Dict[str, Any]:
+    if snapshot is None:
+        return {"seq": sequence, "ts": None, "values": {}}
+    values = {name: encode_value(value) for name, value in snapshot.values.items()}
+    return {"seq": sequence, "ts": snapshot.timestamp, "values": values}
+
+
+def _dumps(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+class Handler(BaseHTTPRequestHandler):
+    # Set by `create_server()`
+    cache: SnapshotCache
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        path = url.path.rstrip("/")
+        if path == "/snapshot":
+            self._conditional(query, self.cache.snapshot_body)
+        elif path.startswith("/fields/"):
+            name = path[len("/fields/") :]
+            if name not in FIELDS:
+                self._send(404, _dumps({"error": f"unknown field ({name})"}))
+                return
+            self._conditional(query, lambda: self._field_body(name))
+        elif path == "/history":
+            field = query.get("field", [None])[0]
+            if field is not None and field not in FIELDS:
+                self._send(404, _dumps({"error": f"unknown field ({field})"}))
+                return
+            try:
+                limit = int(query.get("limit", ["0"])[0])
+            except ValueError:
+                self._send(400, _dumps({"error": "limit must be an integer"}))
+                return
+            self._conditional(query, lambda: self._history_body(field, limit))
+        else:
+            self._send(404, _dumps({"error": f"not found ({url.path})"}))
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"{self.address_string()} {format % args}")
+
+    def _conditional(self, query: Dict[str, List[str]], body: Callable[[], Tuple[int, bytes]]) -> None:
+        etag = self.headers.get("If-None-Match")
+        try:
+            wait = min(float(query.get("wait", ["0"])[0]), MAX_WAIT)
+        except ValueError:
+            self._send(400, _dumps({"error": "wait must be a number"}))
+            return
+        if wait > 0 and (etag is not None or self.cache.latest is None):
+            self.cache.wait(etag, wait)
+        sequence, content = body()
+        current = self.cache.etag(sequence)
+        if etag is not None and etag == current:
+            self._send(304, b"", current)
+            return
+        self._send(200, content, current)
+
+    def _field_body(self, name: str) -> Tuple[int, bytes]:
+        sequence, snapshot = self.cache.current()
+        return sequence, _dumps(
+            {
+                "seq": sequence,
+                "ts": snapshot.timestamp if snapshot else None,
+                "name": name,
+                "value": encode_value(snapshot.values.get(name)) if snapshot else None,
+                "unit": FIELDS[name].unit,
+            }
+        )
+
+    def _history_body(self, field: Optional[str], limit: int) -> Tuple[int, bytes]:
+        sequence, _ = self.cache.current()
+        history = [(s, snapshot) for s, snapshot in list(self.cache.history) if s <= sequence]
+        if limit > 0:
+            history = history[-limit:]
+        if field is None:
+            return sequence, _dumps([_snapshot_json(s, snapshot) for s, snapshot in history])
+        return sequence, _dumps(
+            [
+                {"seq": s, "ts": snapshot.timestamp, "value": encode_value(snapshot.values.get(field))}
+                for s, snapshot in history
+            ]
+        )
+
+    def _send(self, status: int, body: bytes, etag: Optional[str] = None) -> None:
+        self.send_response(status)
+        if etag is not None:
+            self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        if status != 304:
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+
+def create_server(cache: SnapshotCache, host: str = "127.0.0.1", port: int = 8080) -> ThreadingHTTPServer:
+    """
+    HTTP server answering from `cache`, call `serve_forever()` on it
+    """
+    handler = type("Handler", (Handler,), {"cache": cache})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def _parse_args(argv: Optional[Sequence[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m pyrover.serve", description="Serve the snapshots of a controller over HTTP"
+    )
+    parser.add_argument("port", help="serial port of the controller, e.g. /dev/ttyUSB0")
+    parser.add_argument("--address", type=int, default=1, help="Modbus slave address (default: 1)")
+    parser.add_argument("--baudrate", type=int, default=9600, help="baud rate (default: 9600)")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between two polls (default: 1)")
+    parser.add_argument("--history", type=int, default=600, help="snapshots kept for /history (default: 600)")
+    parser.add_argument("--host", default="127.0.0.1", help="HTTP listen address (default: 127.0.0.1)")
+    parser.add_argument("--http-port", type=int, default=8080, help="HTTP listen port (default: 8080)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    args = _parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    cache = SnapshotCache(history=args.history)
+    poller = Poller(RenogyRoverController(port=args.port, address=args.address, baudrate=args.baudrate), args.interval)
+    poller.subscribe(cache.update)
+    poller.start()
+    server = create_server(cache, args.host, args.http_port)
+    logger.info(f"serving {args.port}@{args.address} on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        poller.stop()
+
+
+if __name__ == "__main__":
+    main()
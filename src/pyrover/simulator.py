@@ -0,0 +1,220 @@
+"""
+Simulated Renogy Rover for tests, demos and soak runs
+
+`SimulatedInstrument` answers the `minimalmodbus.Instrument` methods used by
+`RenogyRoverController` from an in-memory register map that follows a solar
+day: the panel produces along a half sine between 6:00 and 18:00, the battery
+charges during the day and the load runs at night. Counters accumulate and the
+daily values reset at midnight. The clock can be sped up to go through days
+in minutes, e.g.:
+
+    rover = RenogyRoverController(port="sim0", transport="simulated")
+    rover.device.clock = SimulatedClock(speed=3600.0)  # an hour per second
+
+Registers outside the controller's map raise `minimalmodbus.IllegalRequestError`
+like a real controller.
+"""
+
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+import math
+import random
+import struct
+import threading
+import time
+
+import minimalmodbus
+
+from .registers import BLOCKS
+
+_MODEL = 0x000C
+# Longest simulated time integrated at once (seconds)
+_MAX_STEP = 60.0
+
+
+class SimulatedClock:
+    """
+    Wall clock running `speed` times faster than real time from `start`
+    """
+
+    def __init__(self, speed: float = 1.0, start: Optional[float] = None):
+        self.speed = speed
+        self.start = time.time() if start is None else start
+        self._origin = time.monotonic()
+
+    def __call__(self) -> float:
+        return self.start + (time.monotonic() - self._origin) * self.speed
+
+
+class SimulatedInstrument:
+    """
+    In-memory controller with the `minimalmodbus.Instrument` methods used by the controller
+    """
+
+    def __init__(
+        self,
+        port: str,
+        slaveaddress: int,
+        clock: Callable[[], float] = time.time,
+        panel_power: float = 400.0,
+        load_power: float = 60.0,
+        capacity: float = 200.0,
+        seed: Optional[int] = None,
+    ):
+        """
+        :param port: Name of the simulated port
+        :param slaveaddress: Modbus slave address, also used as the serial number's low word
+        :param clock: Simulated wall clock (seconds since the epoch)
+        :param panel_power: Charging power at noon (watts)
+        :param load_power: Load power at night (watts)
+        :param capacity: Battery capacity (amp hours)
+        :param seed: Seed of the measurement noise
+        """
+        self.port = port
+        self.address = slaveaddress
+        self.clock = clock
+        self.panel_power = panel_power
+        self.load_power = load_power
+        self.capacity = capacity
+        self.serial = SimpleNamespace(baudrate=9600, timeout=0.5, port=port)
+        self.reads = 0
+
+        self._random = random.Random(seed if seed is not None else slaveaddress)
+        self._lock = threading.Lock()
+        self._registers = {address: 0 for block in BLOCKS for address in range(block.address, block.end)}
+        self._static(slaveaddress)
+        self._charge = 0.6 * capacity
+        # Accumulated counters: amp hours and watt hours, in total and today
+        self._totals = [0.0, 0.0, 0.0, 0.0]
+        self._today = [0.0, 0.0, 0.0, 0.0]
+        self._extremes: Dict[str, float] = {}
+        self._operating_days = 1
+        self._updated = self.clock()
+        self._day = datetime.fromtimestamp(self._updated).date()
+        self._update()
+
+    def read_register(
+        self, registeraddress: int, number_of_decimals: int = 0, functioncode: int = 3, signed: bool = False
+    ) -> Any:
+        value = self._read(registeraddress, 1)[0]
+        if signed and value & 0x8000:
+            value -= 0x10000
+        return value / 10**number_of_decimals if number_of_decimals else value
+
+    def read_registers(self, registeraddress: int, number_of_registers: int, functioncode: int = 3) -> List[int]:
+        return self._read(registeraddress, number_of_registers)
+
+    def read_registers_into(
+        self, registeraddress: int, buffer: Any, offset: int, number_of_registers: int, functioncode: int = 3
+    ) -> None:
+        for i, value in enumerate(self._read(registeraddress, number_of_registers)):
+            buffer[offset + i] = value
+
+    def read_string(self, registeraddress: int, number_of_registers: int = 16, functioncode: int = 3) -> str:
+        values = self._read(registeraddress, number_of_registers)
+        return struct.pack(f">{number_of_registers}H", *values).decode("latin1")
+
+    def write_register(
+        self,
+        registeraddress: int,
+        value: Any,
+        number_of_decimals: int = 0,
+        functioncode: int = 16,
+        signed: bool = False,
+    ) -> None:
+        with self._lock:
+            if registeraddress not in self._registers:
+                raise minimalmodbus.IllegalRequestError("Slave reported illegal data address")
+            self._registers[registeraddress] = int(round(value * 10**number_of_decimals)) & 0xFFFF
+
+    def _read(self, registeraddress: int, number_of_registers: int) -> List[int]:
+        with self._lock:
+            self.reads += 1
+            self._update()
+            try:
+                return [self._registers[a] for a in range(registeraddress, registeraddress + number_of_registers)]
+            except KeyError:
+                raise minimalmodbus.IllegalRequestError("Slave reported illegal data address") from None
+
+    def _static(self, slaveaddress: int) -> None:
+        registers = self._registers
+        registers[0x000A] = 0x0C14  # 12 V, 20 A
+        registers[0x000B] = 0x1400  # 20 A, controller
+        model = "  RNG-CTRL-RVR20".encode("latin1")
+        for i in range(8):
+            registers[_MODEL + i] = model[2 * i] << 8 | model[2 * i + 1]
+        registers[0x0014], registers[0x0015] = 0x0001, 0x0203
+        registers[0x0016], registers[0x0017] = 0x0001, 0x0100
+        registers[0x0018], registers[0x0019] = 0x5349, slaveaddress & 0xFFFF
+        registers[0x001A] = slaveaddress
+        # Settings: 200 Ah lithium battery at 12 V
+        settings = [200, 0x0C0C, 4, 160, 155, 146, 144, 136, 132, 126, 120, 111, 106, 0x6432, 5]
+        for i, value in enumerate(settings):
+            registers[0xE002 + i] = value
+
+    def _update(self) -> None:
+        # Advance the model to the current simulated time, in steps so long gaps follow the solar day
+        now = self.clock()
+        while True:
+            elapsed = min(_MAX_STEP, max(0.0, now - self._updated))
+            self._updated += elapsed
+            self._advance(elapsed)
+            if self._updated >= now:
+                break
+
+    def _advance(self, elapsed: float) -> None:
+        moment = datetime.fromtimestamp(self._updated)
+        if moment.date() != self._day:
+            self._day = moment.date()
+            self._operating_days += 1
+            self._today = [0.0, 0.0, 0.0, 0.0]
+            self._extremes = {}
+
+        hour = moment.hour + moment.minute / 60 + moment.second / 3600
+        sun = max(0.0, math.sin(math.pi * (hour - 6) / 12))
+        noise = self._random.uniform(0.95, 1.05)
+        load_on = sun == 0.0
+        charging = self.panel_power * sun * noise if self._charge < self.capacity else 0.0
+        load = self.load_power * noise if load_on else 0.0
+        state_of_charge = self._charge / self.capacity
+        battery_voltage = 12.0 + 1.6 * state_of_charge + (0.4 if charging else 0.0)
+        charging_current = charging / battery_voltage
+        load_current = load / battery_voltage
+
+        hours = elapsed / 3600
+        self._charge = min(self.capacity, max(0.0, self._charge + (charging_current - load_current) * hours))
+        for i, rate in enumerate((charging_current, load_current, charging, load)):
+            self._totals[i] += rate * hours
+            self._today[i] += rate * hours
+        for name, value in (("battery", battery_voltage), ("charging", charging_current), ("power", charging)):
+            self._extremes[f"{name}_min"] = min(self._extremes.get(f"{name}_min", value), value)
+            self._extremes[f"{name}_max"] = max(self._extremes.get(f"{name}_max", value), value)
+
+        registers = self._registers
+        registers[0x0100] = int(state_of_charge * 100)
+        registers[0x0101] = int(battery_voltage * 10)
+        registers[0x0102] = int(charging_current * 100)
+        registers[0x0103] = 25 << 8 | 20
+        registers[0x0104] = int(battery_voltage * 10) if load_on else 0
+        registers[0x0105] = int(load_current * 100)
+        registers[0x0106] = int(load)
+        registers[0x0107] = int((18.0 + 2.0 * sun) * 10) if sun else 3
+        registers[0x0108] = int(charging / 19.0 * 100)
+        registers[0x0109] = int(charging)
+        registers[0x010B] = int(self._extremes["battery_min"] * 10)
+        registers[0x010C] = int(self._extremes["battery_max"] * 10)
+        registers[0x010D] = int(self._extremes["charging_max"] * 100)
+        registers[0x010E] = int(load_current * 100)
+        registers[0x010F] = int(self._extremes["power_max"])
+        registers[0x0110] = int(self._extremes["power_min"])
+        registers[0x0111] = int(self._today[0]) & 0xFFFF
+        registers[0x0112] = int(self._today[1]) & 0xFFFF
+        registers[0x0113] = int(self._today[2]) & 0xFFFF
+        registers[0x0114] = int(self._today[3]) & 0xFFFF
+        registers[0x0115] = self._operating_days & 0xFFFF
+        for address, total in zip((0x0118, 0x011A, 0x011C, 0x011E), self._totals):
+            value = int(total) & 0xFFFFFFFF
+            registers[address], registers[address + 1] = value >> 16, value & 0xFFFF
+        state = 2 if charging else 5 if sun else 0  # MPPT, floating or deactivated
+        registers[0x0120] = (0x80 | 100 if load_on else 0) << 8 | state
@@ -0,0 +1,292 @@
+"""
+Site totals of controllers sharing a battery bank
+
+Several controllers charging one bank are one system to the rest of the
+installation. `SiteAggregator` keeps the site totals (total charging power,
+energy and amp hours of the day, faults of any controller) as running sums:
+each device snapshot replaces that device's contribution instead of summing
+every device again, e.g.:
+
+    site = SiteAggregator(["rover1", "rover2", "rover3"], max_age=10.0)
+    for name, poller in pollers.items():
+        poller.subscribe(site.subscriber(name))
+    site.subscribe(Publisher(client, device_id="site1", fields=site.fields).update)
+    site.subscribe(cache.update)
+
+Site snapshots are `pyrover.poller.Snapshot`s, published once every fresh
+device has reported since the previous one. A device that stops reporting
+is left out of the instantaneous totals after `max_age` seconds and out of
+the daily counters after `counter_max_age`, so a short outage does not make
+the energy of the day drop. `reporting_devices` and `stale_devices` in the
+values tell how complete the totals are.
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, NamedTuple, Optional, Sequence, Set, Tuple
+import logging
+import threading
+import time
+
+from .fields import FIELDS
+from .fleet import FleetSnapshot
+from .poller import Snapshot, Subscriber
+from .types import Fault
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOTALS = ("charging_power", "power_generation_today", "charging_amphours_today")
+
+FAULTS = "controller_fault_information"
+
+# Running sums are recomputed from the contributions after this many updates, so float rounding
+# errors of the additions and subtractions do not accumulate
+_RESYNC_INTERVAL = 1000
+
+
+class SiteStatus(NamedTuple):
+    # Devices whose latest snapshot is in the instantaneous totals
+    reporting: List[Hashable]
+    # Devices that reported before but are older than `max_age`
+    stale: List[Hashable]
+    # Devices that never reported
+    missing: List[Hashable]
+
+
+class _Window:
+    # Contributions of the devices to some of the totals, dropped once older than `max_age`
+    def __init__(self, fields: Sequence[str], max_age: Optional[float], faults: bool):
+        self.fields = list(fields)
+        self.max_age = max_age
+        self.faults = faults
+        self.totals = [0.0] * len(self.fields)
+        # Number of devices reporting each fault
+        self.fault_counts: Dict[Fault, int] = {}
+        # Time, values and faults of each device, in the order they were updated (oldest first)
+        self.entries: "OrderedDict[Hashable, Tuple[float, List[float], List[Fault]]]" = OrderedDict()
+        self._updates = 0
+
+    def update(
+        self, device: Hashable, timestamp: float, values: List[Optional[float]], faults: Optional[List[Fault]]
+    ) -> None:
+        # Values and faults missing from the snapshot (None) keep their previous value
+        previous = self.entries.get(device)
+        if previous is not None:
+            values = [previous[1][i] if value is None else value for i, value in enumerate(values)]
+            faults = previous[2] if faults is None else faults
+        numbers = [0.0 if value is None else value for value in values]
+        faults = faults if self.faults and faults is not None else []
+        self._remove(device)
+        self.entries[device] = (timestamp, numbers, faults)
+        for i, value in enumerate(numbers):
+            self.totals[i] += value
+        for fault in faults:
+            self.fault_counts[fault] = self.fault_counts.get(fault, 0) + 1
+        self._updates += 1
+        if self._updates % _RESYNC_INTERVAL == 0:
+            self.totals = [sum(entry[1][i] for entry in self.entries.values()) for i in range(len(self.fields))]
+
+    def expire(self, now: float) -> List[Hashable]:
+        # Entries are in update order, only the oldest ones are looked at
+        expired = []
+        if self.max_age is None:
+            return expired
+        while self.entries:
+            device, (timestamp, _, _) = next(iter(self.entries.items()))
+            if now - timestamp <= self.max_age:
+                break
+            self._remove(device)
+            expired.append(device)
+        return expired
+
+    def _remove(self, device: Hashable) -> None:
+        entry = self.entries.pop(device, None)
+        if entry is None:
+            return
+        for i, value in enumerate(entry[1]):
+            self.totals[i] -= value
+        for fault in entry[2]:
+            self.fault_counts[fault] -= 1
+            if not self.fault_counts[fault]:
+                del self.fault_counts[fault]
+
+
+class SiteAggregator:
+    def __init__(
+        self,
+        devices: Sequence[Hashable],
+        totals: Sequence[str] = DEFAULT_TOTALS,
+        max_age: Optional[float] = 30.0,
+        counter_max_age: Optional[float] = 3600.0,
+    ):
+        """
+        :param devices: Devices of the site
+        :param totals: Numeric fields summed over the devices
+        :param max_age: Time after which a device is left out of the instantaneous totals and faults
+            (seconds), None keeps its latest values
+        :param counter_max_age: Same for the counters (e.g. `power_generation_today`)
+        """
+        if len(set(devices)) != len(devices):
+            raise ValueError("devices must be unique")
+        unknown = [name for name in totals if name not in FIELDS or not FIELDS[name].numeric]
+        if unknown:
+            raise ValueError(f"unknown or non numeric fields {unknown}")
+        self.devices = list(devices)
+        self._devices = set(devices)
+        self.totals = list(totals)
+        self.latest: Optional[Snapshot] = None
+
+        counters = [name for name in totals if FIELDS[name].state_class == "total_increasing"]
+        measurements = [name for name in totals if name not in counters]
+        self._measurements = _Window(measurements, max_age, faults=True)
+        self._counters = _Window(counters, counter_max_age, faults=False)
+        self._lock = threading.Lock()
+        self._subscribers: List[Subscriber] = []
+        # Devices that reported since the latest site snapshot
+        self._pending: Set[Hashable] = set()
+        self._seen: Set[Hashable] = set()
+        self._started = False
+
+    @property
+    def fields(self) -> List[str]:
+        """
+        Fields of the site snapshots described in `pyrover.fields`, e.g. for `Publisher(fields=...)`
+        """
+        return self.totals + [FAULTS]
+
+    def subscribe(self, subscriber: Subscriber) -> None:
+        """
+        Call `subscriber` with every site snapshot
+        """
+        self._subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.remove(subscriber)
+
+    def subscriber(self, device: Hashable) -> Subscriber:
+        """
+        Poller subscriber updating the contribution of `device`
+        """
+        return lambda snapshot: self.update(device, snapshot)
+
+    def update(self, device: Hashable, snapshot: Snapshot) -> Optional[Snapshot]:
+        """
+        Replace the contribution of a device with its latest snapshot
+
+        :return: The site snapshot, if the snapshot completed a cycle
+        """
+        with self._lock:
+            if device in self._pending:
+                # A device reported twice, the others missed the cycle
+                site = self._snapshot(self._last_timestamp())
+                self._pending.clear()
+                self._started = True
+            else:
+                site = None
+            self._update(device, snapshot.timestamp, snapshot.values)
+            completed = self._complete(snapshot.timestamp)
+        if site is not None:
+            self.publish(site)
+        if completed is not None:
+            self.publish(completed)
+        return completed
+
+    def update_fleet(self, snapshot: FleetSnapshot) -> Snapshot:
+        """
+        Update the contributions from a `pyrover.fleet.FleetSnapshot` and publish the site snapshot
+        """
+        with self._lock:
+            for device, sample in snapshot.samples.items():
+                if sample.error is None and device in self._devices:
+                    self._update(device, sample.timestamp, sample.values)
+            self._expire(snapshot.trigger)
+            site = self._snapshot(snapshot.trigger)
+            self._pending.clear()
+            self._started = True
+        self.publish(site)
+        return site
+
+    def snapshot(self, now: Optional[float] = None) -> Snapshot:
+        """
+        Current site totals, leaving out the devices that are stale at `now` (default is the current time)
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._expire(now)
+            return self._snapshot(now)
+
+    def status(self, now: Optional[float] = None) -> SiteStatus:
+        """
+        Devices in the instantaneous totals, stale and missing at `now` (default is the current time)
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._expire(now)
+            return self._status()
+
+    def publish(self, snapshot: Snapshot) -> None:
+        self.latest = snapshot
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber(snapshot)
+            except Exception:
+                logger.exception(f"site subscriber failed ({subscriber})")
+
+    def _update(self, device: Hashable, timestamp: float, values: Dict[str, Any]) -> None:
+        if device not in self._devices:
+            raise KeyError(f"unknown device {device}")
+        faults = values.get(FAULTS)
+        for window in (self._measurements, self._counters):
+            numbers = [_number(values.get(name)) for name in window.fields]
+            # A snapshot without any of the window's values (e.g. only the telemetry block) does not refresh it
+            if any(number is not None for number in numbers) or (window.faults and faults is not None):
+                window.update(device, timestamp, numbers, faults)
+        self._seen.add(device)
+        self._pending.add(device)
+        self._expire(timestamp)
+
+    def _expire(self, now: float) -> None:
+        self._counters.expire(now)
+        for device in self._measurements.expire(now):
+            logger.info(f"{device} stale, left out of the site totals")
+            self._pending.discard(device)
+
+    def _complete(self, timestamp: float) -> Optional[Snapshot]:
+        # Every device still in the instantaneous totals reported since the previous site snapshot,
+        # and until the first site snapshot, every device that never reported
+        expected = len(self._measurements.entries)
+        if not self._started:
+            expected += len(self._devices - self._seen)
+        if len(self._pending) < expected:
+            return None
+        self._pending.clear()
+        self._started = True
+        return self._snapshot(timestamp)
+
+    def _last_timestamp(self) -> float:
+        entries = self._measurements.entries
+        return max(timestamp for timestamp, _, _ in entries.values()) if entries else time.time()
+
+    def _status(self) -> SiteStatus:
+        reporting = [device for device in self.devices if device in self._measurements.entries]
+        stale = [device for device in self.devices if device in self._seen and device not in reporting]
+        missing = [device for device in self.devices if device not in self._seen]
+        return SiteStatus(reporting, stale, missing)
+
+    def _snapshot(self, timestamp: float) -> Snapshot:
+        values: Dict[str, Any] = {}
+        for window in (self._measurements, self._counters):
+            for name, total in zip(window.fields, window.totals):
+                values[name] = int(round(total)) if FIELDS[name].kind == "int" else round(total, 6)
+        values = {name: values[name] for name in self.totals}
+        values[FAULTS] = sorted(self._measurements.fault_counts, key=lambda fault: fault.value)
+        status = self._status()
+        values["reporting_devices"] = len(status.reporting)
+        values["stale_devices"] = len(status.stale) + len(status.missing)
+        return Snapshot(timestamp=timestamp, values=values, registers={})
+
+
+def _number(value: Any) -> Optional[float]:
+    # Missing and non numeric values (e.g. a field the controller does not support)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return float(value)
@@ -0,0 +1,465 @@
+"""
+Soak test of the polling pipeline against simulated controllers
+
+Runs pollers against `pyrover.simulator` devices, with the clock sped up so a
+run of minutes goes through days of solar cycles, and feeds every snapshot to
+the cache layer and the exporters (`SnapshotCache` and its JSON body, the
+controller's `cached_data()`, `Publisher`, `EnergyMetrics`, `AlarmEngine`).
+Memory (RSS and tracemalloc), live objects and per-cycle latency percentiles
+are sampled along the way. The run fails when they grow past the thresholds
+after the warmup, e.g.:
+
+    python -m pyrover.soak --duration 3600 --devices 4 --report soak-0.9.1.json --baseline soak-0.9.0.json
+
+With `--cycles` (and `--sample-every`) the run is a fixed number of cycles
+instead, so it does the same work on a slow machine.
+
+Reports are JSON files; with `--baseline` the run also fails when the latency
+or the growth regressed compared with a previous report.
+"""
+
+from collections import Counter
+from importlib import metadata
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+import argparse
+import bisect
+import gc
+import json
+import logging
+import math
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from .alarms import AlarmEngine
+from .metrics import EnergyMetrics
+from .poller import Poller, Snapshot
+from .publisher import Publisher
+from .renogy_rover import RenogyRoverController
+from .serve import SnapshotCache
+from .simulator import SimulatedClock, SimulatedInstrument
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets: 20 per decade from 1 µs to 10 s (seconds)
+_BOUNDS = [10 ** (exponent / 20) for exponent in range(-120, 21)]
+# Growth under these is noise whatever the baseline (bytes, bytes, objects)
+_NOISE = {"rss": 1 << 20, "traced": 256 << 10, "objects": 1000}
+
+
+class SoakThresholds(NamedTuple):
+    # Maximum growth after the warmup
+    rss: int = 16 << 20
+    traced: int = 4 << 20
+    objects: int = 10000
+    # Maximum ratio of the p99 latency at the end of the run to the p99 after the warmup
+    latency_drift: float = 3.0
+
+
+class SoakSample(NamedTuple):
+    # Time since the start of the run (seconds)
+    elapsed: float
+    cycles: int
+    # Resident set size, None where it cannot be measured (bytes)
+    rss: Optional[int]
+    # Memory allocated by Python code and its peak since the previous sample (bytes)
+    traced: int
+    traced_peak: int
+    objects: int
+    # Cycle latency percentiles since the previous sample (seconds)
+    p50: float
+    p95: float
+    p99: float
+    max: float
+
+
+class SoakReport(NamedTuple):
+    version: str
+    python: str
+    platform: str
+    started: float
+    config: Dict[str, Any]
+    cycles: int
+    duration: float
+    samples: List[SoakSample]
+    # Percentiles of every cycle after the warmup (seconds)
+    latency: Dict[str, float]
+    # Growth after the warmup: rss and traced (bytes), objects, latency_drift (ratio)
+    growth: Dict[str, Optional[float]]
+    # Object types whose count grew the most after the warmup
+    object_growth: Dict[str, int]
+    failures: List[str]
+
+    @property
+    def passed(self) -> bool:
+        return not self.failures
+
+    def to_json(self) -> Dict[str, Any]:
+        report = self._asdict()
+        report["samples"] = [sample._asdict() for sample in self.samples]
+        return report
+
+    @classmethod
+    def from_json(cls, report: Dict[str, Any]) -> "SoakReport":
+        return cls(**{**report, "samples": [SoakSample(**sample) for sample in report["samples"]]})
+
+    def format(self) -> str:
+        lines = [f"pyrover {self.version}, {self.cycles} cycles in {self.duration:.0f}s ({self.config})"]
+        lines.append("latency  " + "  ".join(f"{name} {value * 1e3:.3f} ms" for name, value in self.latency.items()))
+        growth = self.growth
+        lines.append(
+            f"growth   rss {_format_bytes(growth['rss'])}  traced {_format_bytes(growth['traced'])}  "
+            f"objects {growth['objects']:+.0f}  p99 drift x{growth['latency_drift'] or 0:.2f}"
+        )
+        if self.object_growth:
+            lines.append("objects  " + ", ".join(f"{name} {count:+d}" for name, count in self.object_growth.items()))
+        lines.extend(f"FAILED   {failure}" for failure in self.failures)
+        return "\n".join(lines)
+
+
+class _Histogram:
+    # Fixed size latency histogram, so measuring adds no memory growth of its own
+    def __init__(self):
+        self.counts = [0] * (len(_BOUNDS) + 1)
+        self.total = 0
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        self.counts[bisect.bisect_left(_BOUNDS, value)] += 1
+        self.total += 1
+        self.max = max(self.max, value)
+
+    def merge(self, other: "_Histogram") -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q: float) -> float:
+        # Upper bound of the bucket holding the q-th percentile
+        if not self.total:
+            return 0.0
+        rank = max(1, math.ceil(q / 100 * self.total))
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(_BOUNDS[i], self.max) if i < len(_BOUNDS) else self.max
+        return self.max
+
+
+class _NullClient:
+    # Message bus client dropping the messages, so the exporters run without a broker
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+
+    def publish(self, topic: str, payload: bytes, retain: bool = False) -> None:
+        self.messages += 1
+        self.bytes += len(payload)
+
+
+def run_soak(
+    duration: Optional[float],
+    devices: int = 1,
+    rate: Optional[float] = None,
+    speed: float = 3600.0,
+    sample_interval: float = 10.0,
+    warmup: float = 0.1,
+    warmup_cycles: int = 1000,
+    thresholds: SoakThresholds = SoakThresholds(),
+    subscribers: Sequence[Callable[[Snapshot], Any]] = (),
+    trace_frames: int = 1,
+    max_cycles: Optional[int] = None,
+    sample_every: Optional[int] = None,
+) -> SoakReport:
+    """
+    Poll simulated controllers for `duration` seconds and report the memory and latency trends
+
+    :param duration: Length of the run (seconds), None to stop after `max_cycles` only
+    :param devices: Number of simulated controllers, polled in turn
+    :param rate: Poll cycles per second of each controller, None polls as fast as possible
+    :param speed: Simulated seconds per second, 3600 goes through a day in 24 seconds
+    :param sample_interval: Time between two memory samples (seconds)
+    :param warmup: Part of the run (its duration, or its cycles without one) before the baselines are taken,
+        while caches and histories fill up
+    :param warmup_cycles: Minimum number of cycles before the baselines are taken (more than the
+        longest bounded history, e.g. `SnapshotCache`'s 600 snapshots), the run fails if it ends before
+        two samples are taken after the warmup
+    :param thresholds: Growth over which the run fails
+    :param subscribers: Other consumers of the snapshots to include in the run
+    :param trace_frames: Frames kept by tracemalloc for each allocation
+    :param max_cycles: Stop after this many cycles, whatever the time it takes
+    :param sample_every: Take the memory samples every N cycles instead of every `sample_interval`,
+        so the run does not depend on the speed of the machine
+    """
+    if duration is None and max_cycles is None:
+        raise ValueError("duration or max_cycles is required")
+    started = time.time()
+    clock = SimulatedClock(speed=speed)
+    pipelines = [_pipeline(device, clock, subscribers) for device in range(1, devices + 1)]
+
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start(trace_frames)
+    samples: List[SoakSample] = []
+    window = _Histogram()
+    measured = _Histogram()
+    baseline_types: Optional[Counter] = None
+    warmup_end = duration * warmup if duration is not None else 0.0
+    warmup_cycles = max(warmup_cycles, int(max_cycles * warmup) if duration is None and max_cycles else 0)
+    cycles = 0
+    try:
+        origin = time.monotonic()
+        next_sample = origin + sample_interval
+        next_sample_cycle = sample_every or 0
+        next_cycle = origin
+        while True:
+            now = time.monotonic()
+            finished = (duration is not None and now - origin >= duration) or (
+                max_cycles is not None and cycles >= max_cycles
+            )
+            due = cycles >= next_sample_cycle if sample_every else now >= next_sample
+            if due or finished:
+                samples.append(_sample(now - origin, cycles, window))
+                if baseline_types is None and now - origin >= warmup_end and cycles >= warmup_cycles:
+                    baseline_types = _type_counts()
+                    measured = _Histogram()
+                else:
+                    measured.merge(window)
+                window = _Histogram()
+                if sample_every:
+                    next_sample_cycle += sample_every
+                else:
+                    next_sample += sample_interval
+                if finished:
+                    break
+            if rate is not None:
+                delay = next_cycle - time.monotonic()
+                if delay > 0:
+                    if not sample_every:
+                        delay = min(delay, max(0.0, next_sample - time.monotonic()))
+                    time.sleep(delay)
+                    continue
+                next_cycle += 1 / rate
+            for run in pipelines:
+                begin = time.perf_counter()
+                run()
+                window.add(time.perf_counter() - begin)
+            cycles += 1
+        final_types = _type_counts()
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+
+    after_warmup = [sample for sample in samples if sample.elapsed >= warmup_end and sample.cycles >= warmup_cycles]
+    failures = []
+    if len(after_warmup) < 2:
+        # Growth from a single sample is always 0: the run cannot pass without any measurement
+        failures.append(
+            f"run ended before the end of the warmup ({cycles} cycles, warmup {warmup_cycles} cycles), "
+            "no growth measured"
+        )
+    growth = _growth(after_warmup if len(after_warmup) >= 2 else samples)
+    object_growth: Dict[str, int] = {}
+    if baseline_types is not None:
+        deltas = final_types - baseline_types
+        object_growth = dict(deltas.most_common(10))
+    failures.extend(
+        f"{name} grew by {growth[name]:.0f} (threshold {limit})"
+        for name, limit in (("rss", thresholds.rss), ("traced", thresholds.traced), ("objects", thresholds.objects))
+        if (growth[name] or 0) > limit
+    )
+    drift = growth["latency_drift"]
+    if drift is not None and drift > thresholds.latency_drift:
+        failures.append(f"p99 latency drifted by x{drift:.2f} (threshold x{thresholds.latency_drift})")
+    return SoakReport(
+        version=_version(),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        started=started,
+        config={
+            "devices": devices,
+            "rate": rate,
+            "speed": speed,
+            "warmup": warmup,
+            "warmup_cycles": warmup_cycles,
+            "max_cycles": max_cycles,
+            **thresholds._asdict(),
+        },
+        cycles=cycles,
+        duration=samples[-1].elapsed,
+        samples=samples,
+        latency={**{f"p{q}": measured.percentile(q) for q in (50, 95, 99)}, "max": measured.max},
+        growth=growth,
+        object_growth=object_growth,
+        failures=failures,
+    )
+
+
+def compare(report: SoakReport, baseline: SoakReport, tolerance: float = 0.25) -> List[str]:
+    """
+    Regressions of `report` compared with the report of a previous release
+
+    :param tolerance: Relative increase of a latency percentile or of a growth tolerated
+    :return: One description per regression, empty when there are none
+    """
+    regressions = []
+    for name, value in report.latency.items():
+        previous = baseline.latency.get(name)
+        if previous and value > previous * (1 + tolerance):
+            regressions.append(f"latency {name} {value * 1e3:.3f} ms, was {previous * 1e3:.3f} ms")
+    for name, noise in _NOISE.items():
+        value, previous = report.growth.get(name), baseline.growth.get(name)
+        if value is None or previous is None:
+            continue
+        if value > max(previous, 0) * (1 + tolerance) + noise:
+            regressions.append(f"{name} growth {value:.0f}, was {previous:.0f}")
+    return regressions
+
+
+def _pipeline(
+    address: int, clock: SimulatedClock, subscribers: Sequence[Callable[[Snapshot], Any]]
+) -> Callable[[], None]:
+    # One poll cycle of a simulated controller through the cache layer and the exporters
+    controller = RenogyRoverController(port=f"soak{address}", address=address, transport="simulated")
+    device = controller.device
+    assert isinstance(device, SimulatedInstrument)
+    device.clock = clock
+    poller = Poller(controller)
+    cache = SnapshotCache()
+    publisher = Publisher(_NullClient(), device_id=f"soak{address}", delta=True)
+    for subscriber in (cache.update, publisher.update, EnergyMetrics().update, AlarmEngine().update, *subscribers):
+        poller.subscribe(subscriber)
+
+    def run() -> None:
+        poller.poll()
+        cache.snapshot_body()
+        controller.cached_data()
+
+    return run
+
+
+def _sample(elapsed: float, cycles: int, window: _Histogram) -> SoakSample:
+    gc.collect()
+    traced, peak = tracemalloc.get_traced_memory()
+    if hasattr(tracemalloc, "reset_peak"):  # Python 3.9+
+        tracemalloc.reset_peak()
+    return SoakSample(
+        elapsed=elapsed,
+        cycles=cycles,
+        rss=_rss(),
+        traced=traced,
+        traced_peak=peak,
+        objects=len(gc.get_objects()),
+        p50=window.percentile(50),
+        p95=window.percentile(95),
+        p99=window.percentile(99),
+        max=window.max,
+    )
+
+
+def _growth(samples: List[SoakSample]) -> Dict[str, Optional[float]]:
+    first, last = samples[0], samples[-1]
+    rss = last.rss - first.rss if first.rss is not None and last.rss is not None else None
+    # p99 of the last windows compared with the first ones, medians to ignore isolated hiccups
+    third = max(1, len(samples) // 3)
+    early = sorted(sample.p99 for sample in samples[:third] if sample.p99)
+    late = sorted(sample.p99 for sample in samples[-third:] if sample.p99)
+    drift = late[len(late) // 2] / early[len(early) // 2] if early and late and len(samples) > 2 else None
+    return {
+        "rss": rss,
+        "traced": last.traced - first.traced,
+        "objects": last.objects - first.objects,
+        "latency_drift": drift,
+    }
+
+
+def _type_counts() -> Counter:
+    gc.collect()
+    return Counter(type(o).__name__ for o in gc.get_objects())
+
+
+def _rss() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _version() -> str:
+    try:
+        return metadata.version("pyrover")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def _format_bytes(value: Optional[float]) -> str:
+    return "n/a" if value is None else f"{value / 1024:+.0f} KiB"
+
+
+def _parse_args(argv: Optional[Sequence[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m pyrover.soak", description="Soak test the polling pipeline against simulated controllers"
+    )
+    parser.add_argument(
+        "--duration", type=float, help="length of the run in seconds (default: 3600, no limit with --cycles)"
+    )
+    parser.add_argument("--cycles", type=int, help="stop after this many poll cycles (default: no limit)")
+    parser.add_argument("--devices", type=int, default=1, help="number of simulated controllers (default: 1)")
+    parser.add_argument("--rate", type=float, help="poll cycles per second per controller (default: unthrottled)")
+    parser.add_argument("--speed", type=float, default=3600.0, help="simulated seconds per second (default: 3600)")
+    parser.add_argument("--sample-interval", type=float, default=10.0, help="seconds between samples (default: 10)")
+    parser.add_argument("--sample-every", type=int, help="cycles between samples, instead of --sample-interval")
+    parser.add_argument("--warmup", type=float, default=0.1, help="part of the run ignored (default: 0.1)")
+    parser.add_argument("--warmup-cycles", type=int, default=1000, help="cycles ignored at least (default: 1000)")
+    parser.add_argument("--max-rss-growth", type=int, default=SoakThresholds().rss, help="bytes")
+    parser.add_argument("--max-traced-growth", type=int, default=SoakThresholds().traced, help="bytes")
+    parser.add_argument("--max-object-growth", type=int, default=SoakThresholds().objects, help="objects")
+    parser.add_argument("--max-latency-drift", type=float, default=SoakThresholds().latency_drift, help="p99 ratio")
+    parser.add_argument("--report", help="write the report to this JSON file")
+    parser.add_argument("--baseline", help="report of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="tolerated regression (default: 0.25)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = _parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    thresholds = SoakThresholds(
+        rss=args.max_rss_growth,
+        traced=args.max_traced_growth,
+        objects=args.max_object_growth,
+        latency_drift=args.max_latency_drift,
+    )
+    duration = args.duration
+    if duration is None and args.cycles is None:
+        duration = 3600.0
+    report = run_soak(
+        duration,
+        devices=args.devices,
+        rate=args.rate,
+        speed=args.speed,
+        sample_interval=args.sample_interval,
+        warmup=args.warmup,
+        warmup_cycles=args.warmup_cycles,
+        thresholds=thresholds,
+        max_cycles=args.cycles,
+        sample_every=args.sample_every,
+    )
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = SoakReport.from_json(json.load(f))
+        regressions = compare(report, baseline, args.tolerance)
+        report = report._replace(failures=report.failures + [f"regression: {r}" for r in regressions])
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report.to_json(), f, indent=2)
+    print(report.format())
+    return 0 if report.passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""
+Store-and-forward spool keeping snapshots on disk while the uplink is down
+
+Records are appended to segment files in a directory. Writes are buffered and
+synced to disk every `sync_every` records or `sync_interval` seconds so an SD
+card is not hit on every sample. When the spool grows past `max_size` the
+oldest segments are deleted. Once the uplink is back, `drain()` sends the
+backlog in large zlib compressed batches, e.g.:
+
+    spool = Spool("/var/lib/pyrover/spool")
+    poller.subscribe(spool.update)
+    ...
+    spool.drain(lambda batch: upload(batch.key, batch.data))
+
+The read position is persisted after each batch is sent, so after a crash the
+drain resumes where it stopped. A batch that failed to send is sent again with
+the same records, even if more were appended since. `batch.key` is made of the
+positions of the first and last records, so the receiver can ignore a batch
+sent again (e.g. the process died between the send and the position update). `decode_batch()` turns a batch
+back into records.
+"""
+
+from typing import Any, BinaryIO, Callable, List, NamedTuple, Optional, Tuple
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+from .fields import encode_value
+from .poller import Snapshot
+
+logger = logging.getLogger(__name__)
+
+# Length and CRC32 of the payload
+_HEADER = struct.Struct("<II")
+# Length of each record in a batch
+_LENGTH = struct.Struct("<I")
+
+_SEGMENT_SUFFIX = ".seg"
+_CURSOR_FILE = "cursor"
+
+
+class Batch(NamedTuple):
+    # Positions of the first record and following the last one, identical if the batch is sent again
+    key: str
+    # Number of records
+    records: int
+    # Compressed records, see `decode_batch()`
+    data: bytes
+    # Position following the last record
+    end: Tuple[int, int]
+
+
+def decode_batch(data: bytes) -> List[bytes]:
+    """
+    Records of a batch produced by `Spool.drain()`
+    """
+    raw = zlib.decompress(data)
+    records = []
+    offset = 0
+    while offset < len(raw):
+        (length,) = _LENGTH.unpack_from(raw, offset)
+        offset += _LENGTH.size
+        records.append(raw[offset : offset + length])
+        offset += length
+    return records
+
+
+def _json_snapshot(snapshot: Snapshot) -> bytes:
+    values = {name: encode_value(value) for name, value in snapshot.values.items()}
+    return json.dumps({"ts": round(snapshot.timestamp, 3), "v": values}, separators=(",", ":")).encode()
+
+
+class Spool:
+    def __init__(
+        self,
+        directory: str,
+        segment_size: int = 1_000_000,
+        max_size: int = 64_000_000,
+        sync_every: int = 100,
+        sync_interval: float = 30.0,
+        batch_size: int = 256_000,
+        compression_level: int = 6,
+        encode: Callable[[Snapshot], bytes] = _json_snapshot,
+    ):
+        """
+        :param directory: Directory holding the segment files, created if needed
+        :param segment_size: Size after which a new segment file is started (bytes)
+        :param max_size: Size of the spool after which the oldest segments are deleted (bytes)
+        :param sync_every: Number of records appended between two fsync
+        :param sync_interval: Maximum time between two fsync (seconds)
+        :param batch_size: Maximum uncompressed size of a drained batch (bytes)
+        :param compression_level: zlib compression level of the batches
+        :param encode: Converts the snapshots received by `update()` to records
+        """
+        if max_size < 2 * segment_size:
+            raise ValueError(f"max_size ({max_size}) must be at least twice the segment_size ({segment_size})")
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_size = max_size
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.batch_size = batch_size
+        self.compression_level = compression_level
+        self.encode = encode
+
+        self.evicted = 0
+
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+        os.makedirs(directory, exist_ok=True)
+        self._segments = sorted(
+            int(name[: -len(_SEGMENT_SUFFIX)]) for name in os.listdir(directory) if name.endswith(_SEGMENT_SUFFIX)
+        )
+        if not self._segments:
+            self._segments.append(0)
+        self._sizes = {segment: os.path.getsize(self._path(segment)) for segment in self._segments[:-1]}
+        self._current = self._segments[-1]
+        self._sizes[self._current] = self._recover(self._current)
+        self._file: BinaryIO = open(self._path(self._current), "ab")
+        self._cursor = self._load_cursor()
+        # Read position and batch that failed to send, sent again as is by the next drain
+        self._unsent: Optional[Tuple[Tuple[int, int], Batch]] = None
+
+    @property
+    def size(self) -> int:
+        """
+        Bytes on disk, including records already sent but not deleted yet
+        """
+        return sum(self._sizes.values())
+
+    @property
+    def pending(self) -> bool:
+        """
+        Whether there are records left to drain
+        """
+        segment, offset = self._cursor
+        return segment < self._current or offset < self._sizes[self._current]
+
+    def update(self, snapshot: Snapshot) -> None:
+        """
+        Append a poller snapshot
+        """
+        self.append(self.encode(snapshot))
+
+    def append(self, record: bytes) -> None:
+        with self._lock:
+            if self._sizes[self._current] >= self.segment_size:
+                self._roll()
+            self._file.write(_HEADER.pack(len(record), zlib.crc32(record)))
+            self._file.write(record)
+            self._sizes[self._current] += _HEADER.size + len(record)
+            self._unsynced += 1
+            if self._unsynced >= self.sync_every or time.monotonic() - self._synced_at >= self.sync_interval:
+                self._sync()
+
+    def sync(self) -> None:
+        """
+        Write the appended records to disk
+        """
+        with self._lock:
+            self._sync()
+
+    def close(self) -> None:
+        with self._lock:
+            self._sync()
+            self._file.close()
+
+    def drain(self, send: Callable[[Batch], Any], max_batches: Optional[int] = None) -> int:
+        """
+        Send the pending records in compressed batches, oldest first
+
+        Stops at the first batch `send` fails on (the exception is raised), that
+        batch and the following ones stay in the spool.
+
+        :param send: Called with each batch, must raise if the batch was not delivered
+        :param max_batches: Maximum number of batches sent by this call
+        :return: Number of records sent
+        """
+        sent = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            with self._lock:
+                # Make the buffered records visible to the reader
+                self._file.flush()
+                batch = self._next_batch()
+            if batch is None:
+                break
+            send(batch)
+            with self._lock:
+                self._commit(batch.end)
+            sent += batch.records
+            batches += 1
+        return sent
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:012d}{_SEGMENT_SUFFIX}")
+
+    def _sync(self) -> None:
+        if self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def _roll(self) -> None:
+        self._sync()
+        self._file.close()
+        self._current += 1
+        self._segments.append(self._current)
+        self._sizes[self._current] = 0
+        self._file = open(self._path(self._current), "ab")
+        self._evict()
+
+    def _evict(self) -> None:
+        while self.size > self.max_size and len(self._segments) > 1:
+            segment = self._segments.pop(0)
+            if segment >= self._cursor[0]:
+                records = self._count_records(segment, self._cursor[1] if segment == self._cursor[0] else 0)
+                self.evicted += records
+                logger.warning(f"spool full, dropped {records} unsent record(s)")
+                self._cursor = (self._segments[0], 0)
+            del self._sizes[segment]
+            os.remove(self._path(segment))
+
+    def _recover(self, segment: int) -> int:
+        # Drop a record torn by a crash at the end of the last segment
+        path = self._path(segment)
+        valid = 0
+        with open(path, "a+b") as file:
+            file.seek(0)
+            while True:
+                header = file.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+                length, crc = _HEADER.unpack(header)
+                record = file.read(length)
+                if len(record) < length or zlib.crc32(record) != crc:
+                    break
+                valid += _HEADER.size + length
+            if file.tell() != valid or os.path.getsize(path) != valid:
+                logger.warning(f"spool segment {path} truncated to {valid} bytes")
+                file.truncate(valid)
+        return valid
+
+    def _count_records(self, segment: int, offset: int) -> int:
+        count = 0
+        with open(self._path(segment), "rb") as file:
+            file.seek(offset)
+            while True:
+                header = file.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    return count
+                length, _ = _HEADER.unpack(header)
+                file.seek(length, os.SEEK_CUR)
+                count += 1
+
+    def _load_cursor(self) -> Tuple[int, int]:
+        try:
+            with open(os.path.join(self.directory, _CURSOR_FILE)) as file:
+                cursor = json.load(file)
+            segment, offset = int(cursor["segment"]), int(cursor["offset"])
+        except FileNotFoundError:
+            return (self._segments[0], 0)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"ignoring invalid spool cursor: {e}")
+            return (self._segments[0], 0)
+        if segment < self._segments[0]:
+            return (self._segments[0], 0)
+        if segment > self._current or offset > self._sizes[segment]:
+            # The records after the last sync were lost, everything left was sent
+            return (self._current, self._sizes[self._current])
+        return (segment, offset)
+
+    def _commit(self, end: Tuple[int, int]) -> None:
+        if end[0] < self._segments[0]:
+            # Evicted while the batch was being sent
+            end = (self._segments[0], 0)
+        if end < self._cursor:
+            return
+        self._cursor = end
+        self._unsent = None
+        path = os.path.join(self.directory, _CURSOR_FILE)
+        with open(path + ".tmp", "w") as file:
+            json.dump({"segment": end[0], "offset": end[1]}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + ".tmp", path)
+        while self._segments[0] < end[0]:
+            segment = self._segments.pop(0)
+            del self._sizes[segment]
+            os.remove(self._path(segment))
+
+    def _next_batch(self) -> Optional[Batch]:
+        if self._unsent is not None and self._unsent[0] == self._cursor and self._unsent[1].end[0] in self._sizes:
+            return self._unsent[1]
+        start = segment, offset = self._cursor
+        if segment == self._current and offset >= self._sizes[segment]:
+            return None
+        chunks: List[bytes] = []
+        size = 0
+        while size < self.batch_size:
+            if offset >= self._sizes[segment]:
+                if segment == self._current:
+                    break
+                segment, offset = self._segments[self._segments.index(segment) + 1], 0
+                continue
+            with open(self._path(segment), "rb") as file:
+                file.seek(offset)
+                end = self._sizes[segment]
+                while size < self.batch_size and offset < end:
+                    length, _ = _HEADER.unpack(file.read(_HEADER.size))
+                    chunks.append(_LENGTH.pack(length))
+                    chunks.append(file.read(length))
+                    offset += _HEADER.size + length
+                    size += _LENGTH.size + length
+        if not chunks:
+            return None
+        data = zlib.compress(b"".join(chunks), self.compression_level)
+        key = f"{start[0]:012d}:{start[1]}-{segment:012d}:{offset}"
+        batch = Batch(key=key, records=len(chunks) // 2, data=data, end=(segment, offset))
+        self._unsent = (start, batch)
+        return batch
@@ -0,0 +1,459 @@
+"""
+Local history in a SQLite database
+
+Snapshots are buffered in memory and written by a background thread in one
+transaction every few seconds, in WAL mode, so SD cards see a handful of
+writes per flush instead of one per sample. Each sample is a single row with
+a numeric column per field (derived from `pyrover.fields`), e.g.:
+
+    sink = SqliteSink("/var/lib/pyrover/history.db")
+    poller.subscribe(sink.subscriber("rover-1"))
+    sink.start()
+
+Samples are rolled up per minute, hour and day (count, min, max, sum and
+number of values of each field, by charging state) as their buckets complete. Every level is
+partitioned by time, one table per day (samples, minute), month (hour) or
+year (day), and retention drops whole tables instead of deleting rows.
+
+Samples arriving after their bucket was rolled up (e.g. from a device that
+reconnects) roll up that device's buckets again, at every level, in the
+transaction that writes them.
+"""
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+import calendar
+import logging
+import sqlite3
+import threading
+import time
+
+from .fields import FIELDS
+from .poller import Snapshot, Subscriber
+
+logger = logging.getLogger(__name__)
+
+
+class Level(NamedTuple):
+    # Table name prefix
+    name: str
+    # Bucket length (seconds), 0 for the raw samples
+    bucket: int
+    # Period covered by each table: "day", "month" or "year"
+    partition: str
+
+
+SAMPLES = Level("samples", 0, "day")
+MINUTE = Level("minute", 60, "day")
+HOUR = Level("hour", 3600, "month")
+DAY = Level("day", 86400, "year")
+
+LEVELS = (SAMPLES, MINUTE, HOUR, DAY)
+ROLLUPS = (MINUTE, HOUR, DAY)
+
+DEFAULT_FIELDS = tuple(name for name, field in FIELDS.items() if field.numeric and field.state_class is not None)
+DEFAULT_RETENTION: Dict[str, Optional[float]] = {
+    "samples": 7 * 86400.0,
+    "minute": 90 * 86400.0,
+    "hour": 2 * 366 * 86400.0,
+    "day": None,
+}
+
+# Rollup state of the samples without a state field
+NO_STATE = -1
+
+_PARTITION_FORMATS = {"day": "%Y%m%d", "month": "%Y%m", "year": "%Y"}
+
+
+def partition_key(level: Level, timestamp: float) -> str:
+    """
+    Suffix of the table of `level` holding `timestamp` (UTC)
+    """
+    return time.strftime(_PARTITION_FORMATS[level.partition], time.gmtime(timestamp))
+
+
+def partition_range(level: Level, key: str) -> Tuple[float, float]:
+    """
+    Start and end (excluded) of the period covered by a partition (seconds since the epoch)
+    """
+    year = int(key[:4])
+    month = int(key[4:6]) if level.partition in ("day", "month") else 1
+    day = int(key[6:8]) if level.partition == "day" else 1
+    start = calendar.timegm((year, month, day, 0, 0, 0))
+    if level.partition == "day":
+        return start, start + 86400
+    if level.partition == "month":
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return start, calendar.timegm((year, month, 1, 0, 0, 0))
+    return start, calendar.timegm((year + 1, 1, 1, 0, 0, 0))
+
+
+def table_name(level: Level, key: str) -> str:
+    return f"{level.name}_{key}"
+
+
+def _column_type(name: str) -> str:
+    return "REAL" if FIELDS[name].kind == "float" else "INTEGER"
+
+
+class SqliteSink:
+    def __init__(
+        self,
+        path: str,
+        fields: Optional[Sequence[str]] = None,
+        state_field: Optional[str] = "charging_state",
+        flush_interval: float = 5.0,
+        max_pending: int = 100_000,
+        retention: Optional[Dict[str, Optional[float]]] = None,
+        grace: float = 5.0,
+    ):
+        """
+        :param path: Database file
+        :param fields: Numeric fields stored (default is the measurements and counters)
+        :param state_field: Field the rollups are grouped by, None to not group them
+        :param flush_interval: Time between two writes of the background thread (seconds)
+        :param max_pending: Samples kept in memory while the database is unavailable, the oldest are dropped
+        :param retention: Age of the partitions to drop, by level name (seconds, None keeps them forever)
+        :param grace: Delay before a bucket is rolled up, for the samples arriving late (seconds)
+        """
+        fields = list(fields) if fields is not None else list(DEFAULT_FIELDS)
+        if state_field is not None and state_field not in fields:
+            fields.append(state_field)
+        for name in fields:
+            if name not in FIELDS or not FIELDS[name].numeric:
+                raise ValueError(f"not a numeric field ({name})")
+        self.path = path
+        self.fields = fields
+        self.state_field = state_field
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.retention = {**DEFAULT_RETENTION, **(retention or {})}
+        self.grace = grace
+
+        self.written = 0
+        self.dropped = 0
+
+        self._pending: List[Tuple[Any, ...]] = []
+        self._pending_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._devices: Dict[str, int] = {}
+        self._partitions: Dict[str, Set[str]] = {level.name: set() for level in LEVELS}
+        # Partitions created by the transaction in progress, known once it commits
+        self._created: Optional[List[Tuple[str, str]]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._setup()
+
+    def subscriber(self, device: str) -> Subscriber:
+        """
+        Poller subscriber recording the snapshots of `device`
+        """
+        return lambda snapshot: self.record(device, snapshot)
+
+    def record(self, device: str, snapshot: Snapshot) -> None:
+        """
+        Queue a sample, written by the next flush
+        """
+        values = snapshot.values
+        row = (device, int(snapshot.timestamp * 1000)) + tuple(
+            None if values.get(name) is None else int(values[name]) if FIELDS[name].kind == "enum" else values[name]
+            for name in self.fields
+        )
+        with self._pending_lock:
+            if len(self._pending) >= self.max_pending:
+                del self._pending[0]
+                self.dropped += 1
+            self._pending.append(row)
+
+    def flush(self) -> int:
+        """
+        Write the queued samples in one transaction, then update the rollups and drop the expired partitions
+
+        :return: Number of samples written
+        """
+        with self._pending_lock:
+            rows, self._pending = self._pending, []
+        with self._lock:
+            if rows:
+                try:
+                    self._insert(rows)
+                except sqlite3.Error:
+                    with self._pending_lock:
+                        self._pending[:0] = rows[-self.max_pending :]
+                    raise
+                self.written += len(rows)
+            self.rollup()
+            self.enforce_retention()
+        return len(rows)
+
+    def rollup(self) -> None:
+        """
+        Aggregate the complete buckets of each rollup level from the level below
+        """
+        latest = self._meta("latest")
+        if latest is None:
+            return
+        watermark = latest - int(self.grace * 1000)
+        source = SAMPLES
+        for level in ROLLUPS:
+            bucket = level.bucket * 1000
+            done = self._meta(level.name)
+            if done is None:
+                first = self._meta("first")
+                assert first is not None
+                done = first // bucket * bucket
+            end = watermark // bucket * bucket
+            if end > done:
+                self._transaction(self._aggregate, source, level, done, end)
+            source = level
+
+    def enforce_retention(self) -> List[str]:
+        """
+        Drop the partitions older than the retention of their level
+
+        :return: Names of the dropped tables
+        """
+        latest = self._meta("latest")
+        if latest is None:
+            return []
+        dropped = []
+        for i, level in enumerate(LEVELS):
+            retention = self.retention.get(level.name)
+            if retention is None:
+                continue
+            limit = latest / 1000 - retention
+            # Never drop data that is not rolled up yet
+            if i + 1 < len(LEVELS):
+                rolled_up = self._meta(LEVELS[i + 1].name)
+                limit = min(limit, rolled_up / 1000 if rolled_up is not None else 0)
+            for key in sorted(self._partitions[level.name]):
+                if partition_range(level, key)[1] > limit:
+                    break
+                self._connection.execute(f"DROP TABLE IF EXISTS {table_name(level, key)}")
+                self._partitions[level.name].discard(key)
+                dropped.append(table_name(level, key))
+        if dropped:
+            logger.info(f"dropped expired partitions {dropped}")
+        return dropped
+
+    def partitions(self, level: Level) -> List[str]:
+        """
+        Table names of a level, oldest first
+        """
+        with self._lock:
+            return [table_name(level, key) for key in sorted(self._partitions[level.name])]
+
+    def start(self) -> None:
+        """
+        Flush every `flush_interval` in a background thread until `stop()` is called
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="pyrover-sqlite", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self.stop()
+        self._connection.close()
+        self._closed = True
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"sqlite flush failed: {e}")
+
+    def _setup(self) -> None:
+        connection = self._connection
+        connection.execute("PRAGMA journal_mode=WAL")
+        # WAL commits are durable across application crashes, only a power loss can lose the last ones
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS devices (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)")
+        connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+        connection.execute("CREATE TABLE IF NOT EXISTS fields (name TEXT PRIMARY KEY, unit TEXT, state INTEGER)")
+        connection.executemany(
+            "INSERT OR REPLACE INTO fields VALUES (?, ?, ?)",
+            [(name, FIELDS[name].unit, int(name == self.state_field)) for name in self.fields],
+        )
+        self._devices = {name: id for id, name in connection.execute("SELECT id, name FROM devices")}
+        for (name,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+            prefix, _, key = name.partition("_")
+            if prefix in self._partitions and key.isdigit():
+                self._partitions[prefix].add(key)
+                # Fields added since the table was created
+                existing = {row[1] for row in connection.execute(f"PRAGMA table_info({name})")}
+                for column, type in self._columns(prefix == SAMPLES.name):
+                    if column not in existing:
+                        connection.execute(f"ALTER TABLE {name} ADD COLUMN {column} {type}")
+
+    def _transaction(self, body: Callable[..., Any], *args: Any) -> None:
+        connection = self._connection
+        connection.execute("BEGIN")
+        self._created = []
+        try:
+            body(*args)
+            connection.execute("COMMIT")
+        except BaseException:
+            # The rollback drops the tables created by the transaction
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        else:
+            for level_name, key in self._created:
+                self._partitions[level_name].add(key)
+        finally:
+            self._created = None
+
+    def _insert(self, rows: List[Tuple[Any, ...]]) -> None:
+        # Committed before the samples so the ids never point to a rolled back device
+        partitions: Dict[str, List[Tuple[Any, ...]]] = {}
+        for row in rows:
+            partitions.setdefault(partition_key(SAMPLES, row[1] / 1000), []).append(
+                (self._device_id(row[0]),) + row[1:]
+            )
+        columns = ", ".join(["device", "ts"] + self.fields)
+        placeholders = ", ".join("?" * (len(self.fields) + 2))
+
+        def insert() -> None:
+            for key, partition_rows in partitions.items():
+                table = self._table(SAMPLES, key)
+                self._connection.executemany(
+                    f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({placeholders})",
+                    partition_rows,
+                )
+            timestamps = [row[1] for row in rows]
+            if self._meta("first") is None:
+                self._set_meta("first", min(timestamps))
+            latest = max(max(timestamps), self._meta("latest") or 0)
+            self._set_meta("latest", latest)
+            self._reroll({(row[0], row[1]) for rows in partitions.values() for row in rows}, latest)
+
+        self._transaction(insert)
+
+    def _reroll(self, samples: Set[Tuple[int, int]], latest: int) -> None:
+        # Roll up again the buckets of the (device id, time) samples that were already rolled up, level by level
+        retention = self.retention.get(SAMPLES.name)
+        if retention is not None:
+            # The samples around them may be dropped already, rolling up again would lose them
+            samples = {(device, ts) for device, ts in samples if ts >= latest - retention * 1000}
+        source = SAMPLES
+        for level in ROLLUPS:
+            done = self._meta(level.name)
+            bucket = level.bucket * 1000
+            buckets = {(device, ts // bucket * bucket) for device, ts in samples if done is not None and ts < done}
+            if not buckets:
+                return
+            logger.debug(f"rolling up {len(buckets)} {level.name} bucket(s) again for late samples")
+            for device, start in sorted(buckets):
+                self._aggregate(source, level, start, start + bucket, device)
+            samples = buckets
+            source = level
+
+    def _aggregate(self, source: Level, level: Level, start: int, end: int, device: Optional[int] = None) -> None:
+        # Roll up [start, end) (milliseconds) of `source` into `level`, or again only for `device`
+        bucket = level.bucket * 1000
+        if source == SAMPLES:
+            state = self.state_field if self.state_field is not None else str(NO_STATE)
+            count = "COUNT(*)"
+            aggregates = [f"MIN({name}), MAX({name}), SUM({name}), COUNT({name})" for name in self.fields]
+        else:
+            state = "state"
+            count = "SUM(count)"
+            aggregates = [
+                f"MIN({name}_min), MAX({name}_max), SUM({name}_sum), SUM({name}_count)" for name in self.fields
+            ]
+        columns = ", ".join(
+            ["device", "ts", "state", "count"]
+            + [f"{name}_{s}" for name in self.fields for s in ("min", "max", "sum", "count")]
+        )
+        for key in sorted(self._keys(source)):
+            first, last = partition_range(source, key)
+            if last * 1000 <= start or first * 1000 >= end:
+                continue
+            # The partitions of the level below are contained in the partitions of the level
+            table = self._table(level, partition_key(level, first))
+            where, parameters = "ts >= ? AND ts < ?", (start, end)
+            if device is not None:
+                where, parameters = f"device = ? AND {where}", (device, start, end)
+                # The samples replaced may have had another state
+                self._connection.execute(f"DELETE FROM {table} WHERE {where}", parameters)
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO {table} ({columns}) "
+                f"SELECT device, ts / {bucket} * {bucket}, COALESCE({state}, {NO_STATE}), {count}, "
+                f"{', '.join(aggregates)} FROM {table_name(source, key)} "
+                f"WHERE {where} GROUP BY 1, 2, 3",
+                parameters,
+            )
+        if device is None:
+            self._set_meta(level.name, end)
+
+    def _table(self, level: Level, key: str) -> str:
+        # Table of a partition, created on first use
+        table = table_name(level, key)
+        if key in self._keys(level):
+            return table
+        if level == SAMPLES:
+            columns = ["device INTEGER NOT NULL", "ts INTEGER NOT NULL"]
+            key_columns = "device, ts"
+        else:
+            columns = [
+                "device INTEGER NOT NULL",
+                "ts INTEGER NOT NULL",
+                "state INTEGER NOT NULL",
+                "count INTEGER NOT NULL",
+            ]
+            key_columns = "device, ts, state"
+        columns += [f"{column} {type}" for column, type in self._columns(level == SAMPLES)]
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(columns)}, PRIMARY KEY ({key_columns})) WITHOUT ROWID"
+        )
+        if self._created is not None:
+            self._created.append((level.name, key))
+        else:
+            self._partitions[level.name].add(key)
+        return table
+
+    def _keys(self, level: Level) -> Set[str]:
+        # Partitions of a level, including the ones created by the transaction in progress
+        created = {key for name, key in self._created or () if name == level.name}
+        return self._partitions[level.name] | created
+
+    def _columns(self, samples: bool) -> List[Tuple[str, str]]:
+        # Name and type of the field columns of the samples or of a rollup
+        if samples:
+            return [(name, _column_type(name)) for name in self.fields]
+        # `count` is the number of samples with a value for the field, the sum's divisor
+        types = {"sum": "REAL", "count": "INTEGER"}
+        return [
+            (f"{name}_{s}", types.get(s) or _column_type(name))
+            for name in self.fields
+            for s in ("min", "max", "sum", "count")
+        ]
+
+    def _device_id(self, name: str) -> int:
+        id = self._devices.get(name)
+        if id is None:
+            cursor = self._connection.execute("INSERT INTO devices (name) VALUES (?)", (name,))
+            assert cursor.lastrowid is not None
+            id = self._devices[name] = cursor.lastrowid
+        return id
+
+    def _meta(self, key: str) -> Optional[int]:
+        row = self._connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _set_meta(self, key: str, value: int) -> None:
+        self._connection.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
@@ -0,0 +1,229 @@
+"""
+Compact binary encoding of poller snapshots
+
+A frame carries the raw registers of a snapshot rather than the decoded
+values, the values are decoded again on the receiving side with the same
+decoders as `RenogyRoverController`. Frame layout (little endian):
+
+    version: u8 | flags: u8 | sequence: u8 | body (raw deflate if FLAG_COMPRESSED)
+
+    keyframe body: timestamp ms: u64 | runs: u8 | runs x (address: u16 | count: u8 | count x u16)
+    delta body:    timestamp ms delta: zigzag varint | changed bitmap | changed registers x u16
+
+A delta frame only holds the registers that changed since the previous frame
+of the same encoder (the bitmap has one bit per register of the previous
+frame's layout) and is only valid for a decoder that received that frame,
+e.g.:
+
+    encoder = WireEncoder(delta=True)
+    poller.subscribe(lambda snapshot: send(encoder.encode(snapshot)))
+    ...
+    decoder = WireDecoder()
+    snapshot = decoder.decode(frame)
+
+Frames are compressed only when that makes them smaller. A keyframe of every
+block is about 160 bytes (against 2.5 KB for the values as JSON), a delta
+frame where a couple of registers changed about 20 bytes.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import struct
+import zlib
+
+from .decoders import BufferDecoder
+from .poller import Snapshot
+from .registers import RegisterSpan
+
+# Bumped whenever the frame layout or the register map changes
+SCHEMA_VERSION = 1
+
+FLAG_DELTA = 0x01
+FLAG_COMPRESSED = 0x02
+
+_HEADER = struct.Struct("<BBB")
+_TIMESTAMP = struct.Struct("<Q")
+_RUN = struct.Struct("<HB")
+
+# Runs are limited by the u8 register count
+_MAX_RUN = 255
+
+Layout = Tuple[RegisterSpan, ...]
+
+
+def _layout(registers: Dict[int, int]) -> Layout:
+    runs: List[RegisterSpan] = []
+    start = previous = None
+    for address in sorted(registers):
+        if start is None or previous is None or address != previous + 1 or address - start == _MAX_RUN:
+            if start is not None and previous is not None:
+                runs.append(RegisterSpan(start, previous - start + 1))
+            start = address
+        previous = address
+    if start is not None and previous is not None:
+        runs.append(RegisterSpan(start, previous - start + 1))
+    return tuple(runs)
+
+
+def _values(layout: Layout, registers: Dict[int, int]) -> List[int]:
+    return [registers[address] for run in layout for address in range(run.address, run.end)]
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    value = value << 1 if value >= 0 else (-value << 1) - 1
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, offset: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            break
+    return (value >> 1 if not value & 1 else -((value + 1) >> 1)), offset
+
+
+def _compress(data: bytes, level: int) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+class WireEncoder:
+    def __init__(self, delta: bool = False, keyframe_interval: int = 60, compression_level: Optional[int] = 6):
+        """
+        :param delta: Encode the registers that changed since the previous frame only
+        :param keyframe_interval: In delta mode, encode every register every N frames
+        :param compression_level: zlib compression level, None to never compress
+        """
+        self.delta = delta
+        self.keyframe_interval = keyframe_interval
+        self.compression_level = compression_level
+
+        self._sequence = -1
+        self._layout: Optional[Layout] = None
+        self._values: List[int] = []
+        self._timestamp = 0
+        self._frames = 0
+
+    def reset(self) -> None:
+        """
+        Make the next frame a keyframe, e.g. after a receiver lost frames
+        """
+        self._layout = None
+
+    def encode(self, snapshot: Snapshot) -> bytes:
+        layout = _layout(snapshot.registers)
+        values = _values(layout, snapshot.registers)
+        timestamp = round(snapshot.timestamp * 1_000)
+        keyframe = not self.delta or layout != self._layout or self._frames % self.keyframe_interval == 0
+
+        body = bytearray()
+        if keyframe:
+            body += _TIMESTAMP.pack(timestamp)
+            body.append(len(layout))
+            for run in layout:
+                body += _RUN.pack(run.address, run.number_of_registers)
+            body += struct.pack(f"<{len(values)}H", *values)
+        else:
+            _write_varint(body, timestamp - self._timestamp)
+            bitmap = bytearray((len(values) + 7) // 8)
+            changed = []
+            for i, (value, previous) in enumerate(zip(values, self._values)):
+                if value != previous:
+                    bitmap[i >> 3] |= 1 << (i & 7)
+                    changed.append(value)
+            body += bitmap
+            body += struct.pack(f"<{len(changed)}H", *changed)
+
+        flags = 0 if keyframe else FLAG_DELTA
+        if self.compression_level is not None:
+            compressed = _compress(bytes(body), self.compression_level)
+            if len(compressed) < len(body):
+                body = compressed
+                flags |= FLAG_COMPRESSED
+
+        self._sequence = (self._sequence + 1) & 0xFF
+        self._layout = layout
+        self._values = values
+        self._timestamp = timestamp
+        self._frames = 1 if keyframe else self._frames + 1
+        return _HEADER.pack(SCHEMA_VERSION, flags, self._sequence) + bytes(body)
+
+
+class WireDecoder:
+    def __init__(self, decode_values: bool = True):
+        """
+        :param decode_values: Decode the field values of the snapshots, otherwise only the registers are returned
+        """
+        self.decode_values = decode_values
+
+        self._sequence: Optional[int] = None
+        self._layout: Optional[Layout] = None
+        self._values: List[int] = []
+        self._timestamp = 0
+        self._decoders: Dict[Layout, List[Tuple[int, BufferDecoder]]] = {}
+
+    def decode(self, frame: bytes) -> Snapshot:
+        """
+        :raise ValueError: Unknown schema version, or a delta frame not following the previously decoded frame
+        """
+        version, flags, sequence = _HEADER.unpack_from(frame)
+        if version != SCHEMA_VERSION:
+            raise ValueError(f"unsupported schema version ({version})")
+        body = frame[_HEADER.size :]
+        if flags & FLAG_COMPRESSED:
+            body = zlib.decompress(body, -15)
+
+        if flags & FLAG_DELTA:
+            if self._layout is None or self._sequence is None or sequence != (self._sequence + 1) & 0xFF:
+                raise ValueError(f"delta frame {sequence} does not follow the previous frame")
+            delta, offset = _read_varint(body, 0)
+            timestamp = self._timestamp + delta
+            values = list(self._values)
+            bitmap = body[offset : offset + (len(values) + 7) // 8]
+            offset += len(bitmap)
+            for i in range(len(values)):
+                if bitmap[i >> 3] >> (i & 7) & 1:
+                    (values[i],) = struct.unpack_from("<H", body, offset)
+                    offset += 2
+            layout = self._layout
+        else:
+            (timestamp,) = _TIMESTAMP.unpack_from(body)
+            offset = _TIMESTAMP.size
+            runs = body[offset]
+            offset += 1
+            layout = tuple(RegisterSpan(*_RUN.unpack_from(body, offset + i * _RUN.size)) for i in range(runs))
+            offset += runs * _RUN.size
+            count = sum(run.number_of_registers for run in layout)
+            values = list(struct.unpack_from(f"<{count}H", body, offset))
+
+        self._sequence = sequence
+        self._layout = layout
+        self._values = values
+        self._timestamp = timestamp
+
+        registers = dict(zip((a for run in layout for a in range(run.address, run.end)), values))
+        return Snapshot(
+            timestamp=timestamp / 1_000,
+            values=self._decode_values(layout, values) if self.decode_values else {},
+            registers=registers,
+        )
+
+    def _decode_values(self, layout: Layout, values: List[int]) -> Dict[str, Any]:
+        decoders = self._decoders.get(layout)
+        if decoders is None:
+            decoders = []
+            offset = 0
+            for run in layout:
+                decoders.append((offset, BufferDecoder(run)))
+                offset += run.number_of_registers
+            self._decoders[layout] = decoders
+        decoded: Dict[str, Any] = {}
+        for offset, decoder in decoders:
+            decoder.decode(values, decoded, offset)
+        return decoded
@@ -0,0 +1,18 @@
+from unittest import mock
+
+import pytest
+
+from pyrover.renogy_rover import RenogyRoverController
+from tests.fakes.fake_modbus import create_fake_modbus
+
+
+@pytest.fixture
+def fake_modbus():
+    return create_fake_modbus()
+
+
+@pytest.fixture()
+def controller(fake_modbus):
+    with mock.patch("pyrover.renogy_rover._create_controller") as mock_create_controller:
+        mock_create_controller.return_value = fake_modbus
+        yield RenogyRoverController(port="/dev/ttyUSB0", address=123)
@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, Dict, List
 from unittest import mock
 
 import minimalmodbus
@@ -79,13 +79,22 @@ def create_fake_modbus() -> minimalmodbus.Instrument:
         0xE021: 0x5,
     }
 
-    fake_controller = mock.Mock(spec=minimalmodbus.Instrument)
+    fake_controller = mock.NonCallableMock(spec=minimalmodbus.Instrument)
     fake_controller.serial = mock.Mock()
     fake_controller.address = "/dev/ttyUSB0"
     fake_controller.port = 123
 
     fake_controller.read_register.side_effect = lambda x, *args, **kwargs: data.get(x)
-    fake_controller.read_registers.side_effect = lambda x, *args, **kwargs: data.get(x)
+
+    def read_registers(addr: int, number_of_registers: int = 1, **kwargs) -> List[int]:
+        value = data.get(addr)
+        if isinstance(value, list) and len(value) == number_of_registers:
+            return value
+        # Block read spanning several entries
+        registers = _flatten(data)
+        return [registers.get(a, 0) for a in range(addr, addr + number_of_registers)]
+
+    fake_controller.read_registers.side_effect = read_registers
     fake_controller.read_string.side_effect = lambda x, *args, **kwargs: data.get(x)
 
     def set_value(addr: int, value: Any) -> None:
@@ -96,4 +105,22 @@ def create_fake_modbus() -> minimalmodbus.Instrument:
 
     fake_controller.set_value = set_value
 
+    def write_register(addr: int, value: int, *args, **kwargs) -> None:
+        data[addr] = value
+
+    fake_controller.write_register.side_effect = write_register
+
     return fake_controller
+
+
+def _flatten(data: Dict[int, Any]) -> Dict[int, int]:
+    registers: Dict[int, int] = {}
+    for addr, value in data.items():
+        if isinstance(value, str):
+            encoded = value.encode("latin1")
+            value = [encoded[i] << 8 | encoded[i + 1] for i in range(0, len(encoded), 2)]
+        if isinstance(value, list):
+            registers.update(zip(range(addr, addr + len(value)), value))
+        else:
+            registers[addr] = value
+    return registers
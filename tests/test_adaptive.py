@@ -0,0 +1,103 @@
+import pytest
+
+from pyrover.adaptive import AdaptivePollRate
+from pyrover.poller import Poller, Snapshot
+from pyrover.types import ChargingState, Fault, Toggle
+
+
+def _snapshot(timestamp: float, **values) -> Snapshot:
+    defaults = {
+        "charging_state": ChargingState.DEACTIVATED,
+        "solar_voltage": 0.0,
+        "battery_voltage": 12.6,
+        "load_power": 0,
+        "charging_power": 0,
+        "street_light_status": Toggle.OFF,
+        "controller_fault_information": [],
+    }
+    return Snapshot(timestamp=timestamp, values={**defaults, **values}, registers={})
+
+
+def test_night_backs_off_to_max_interval():
+    rate = AdaptivePollRate(min_interval=1, max_interval=10, backoff=2)
+
+    intervals = [rate.update(_snapshot(t)) for t in range(6)]
+    assert intervals == [1, 2, 4, 8, 10, 10]
+    assert rate.reason == "idle"
+    assert rate.rate == 0.1
+
+
+def test_floating_with_stable_voltage_is_idle():
+    rate = AdaptivePollRate(min_interval=1, max_interval=10, voltage_tolerance=0.1)
+    floating = {"charging_state": ChargingState.FLOATING, "solar_voltage": 18.0}
+
+    rate.update(_snapshot(0, **floating))
+    assert rate.update(_snapshot(1, battery_voltage=12.65, **floating)) == 2
+    assert rate.update(_snapshot(3, battery_voltage=12.9, **floating)) == 1
+    assert rate.reason == "active"
+
+
+def test_charging_stays_at_min_interval():
+    rate = AdaptivePollRate(min_interval=0.5)
+    charging = {"charging_state": ChargingState.MPPT, "solar_voltage": 18.0, "charging_power": 120}
+
+    assert [rate.update(_snapshot(t, **charging)) for t in range(3)] == [0.5, 0.5, 0.5]
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        {"charging_state": ChargingState.MPPT},
+        {"street_light_status": Toggle.ON},
+        {"load_power": 60},
+        {"controller_fault_information": [Fault.BATTERY_OVER_DISCHARGE]},
+    ],
+)
+def test_events_reset_to_min_interval(change):
+    rate = AdaptivePollRate(min_interval=1, max_interval=60)
+    for t in range(5):
+        rate.update(_snapshot(t))
+    assert rate.interval == 16
+
+    assert rate.update(_snapshot(5, **change)) == 1
+    assert rate.reason == "event"
+
+
+def test_small_changes_are_not_events():
+    rate = AdaptivePollRate(min_interval=1, power_tolerance=10)
+    rate.update(_snapshot(0))
+    assert rate.update(_snapshot(1, load_power=5)) == 2
+
+
+def test_achieved_rate():
+    rate = AdaptivePollRate(window=3)
+    assert rate.stats().achieved_rate is None
+    for t in (0, 1, 3, 5):
+        rate.update(_snapshot(t))
+
+    stats = rate.stats()
+    assert stats.achieved_rate == 0.5
+    assert stats.samples == 4
+
+
+def test_invalid_configuration():
+    with pytest.raises(ValueError):
+        AdaptivePollRate(min_interval=10, max_interval=1)
+    with pytest.raises(ValueError):
+        AdaptivePollRate(backoff=1)
+
+
+def test_poller_uses_the_policy(controller, fake_modbus):
+    # Night: charging deactivated, no solar voltage
+    fake_modbus.set_value(0x0120, 0x0000)
+    fake_modbus.set_value(0x0107, 0)
+    rate = AdaptivePollRate(min_interval=1, max_interval=30)
+    poller = Poller(controller, interval=rate.interval, policy=rate)
+
+    poller.poll()
+    poller.poll()
+    assert poller.interval == 2
+
+    fake_modbus.set_value(0x0120, 0x0002)
+    poller.poll()
+    assert poller.interval == 1
@@ -0,0 +1,113 @@
+from unittest import mock
+
+import pytest
+
+from pyrover.alarms import DEFAULT_RULES, AlarmEngine, AlarmEvent, ThresholdRule
+from pyrover.poller import Poller, Snapshot
+from pyrover.profiles import DeviceProfile
+from pyrover.registers import FIELD_REGISTERS
+from pyrover.types import Fault
+
+
+def _snapshot(timestamp, fault_high=0x0000, **values):
+    defaults = {"battery_voltage": 12.6, "under_voltage_warning_level": 12.0, "over_voltage_threshold": 16.0}
+    defaults.update(values)
+    return Snapshot(timestamp=timestamp, values=defaults, registers={0x0121: fault_high, 0x0122: 0xFFFF})
+
+
+def _engine(**kwargs):
+    engine = AlarmEngine(**kwargs)
+    events = []
+    engine.subscribe(events.append)
+    return engine, events
+
+
+def test_alarm_engine_emits_fault_transitions():
+    engine, events = _engine()
+    engine.update(_snapshot(1.0))
+    engine.update(_snapshot(2.0, fault_high=0x0005))
+    engine.update(_snapshot(3.0, fault_high=0x0005))
+    engine.update(_snapshot(4.0, fault_high=0x0004))
+
+    assert events == [
+        AlarmEvent("BATTERY_OVER_DISCHARGE", True, 2.0, fault=Fault.BATTERY_OVER_DISCHARGE),
+        AlarmEvent("BATTERY_UNDER_VOLTAGE", True, 2.0, fault=Fault.BATTERY_UNDER_VOLTAGE),
+        AlarmEvent("BATTERY_OVER_DISCHARGE", False, 4.0, fault=Fault.BATTERY_OVER_DISCHARGE),
+    ]
+    assert engine.fault_word == Fault.BATTERY_UNDER_VOLTAGE.value
+    assert engine.active() == ["BATTERY_UNDER_VOLTAGE"]
+
+
+def test_alarm_engine_debounces_faults():
+    engine, events = _engine(debounce=3)
+    engine.update(_snapshot(1.0, fault_high=0x0001))
+    engine.update(_snapshot(2.0, fault_high=0x0001))
+    engine.update(_snapshot(3.0))  # glitch cleared before the debounce expired
+    engine.update(_snapshot(4.0, fault_high=0x0001))
+    engine.update(_snapshot(5.0, fault_high=0x0001))
+    assert events == []
+
+    engine.update(_snapshot(6.0, fault_high=0x0001))
+    assert [(event.name, event.raised, event.timestamp) for event in events] == [("BATTERY_OVER_DISCHARGE", True, 6.0)]
+
+
+def test_alarm_engine_threshold_rule_against_another_field_with_hysteresis():
+    engine, events = _engine(rules=DEFAULT_RULES, faults=False)
+    engine.update(_snapshot(1.0, battery_voltage=11.9))
+    engine.update(_snapshot(2.0, battery_voltage=12.1))  # within hysteresis, still active
+    engine.update(_snapshot(3.0, battery_voltage=12.3))
+
+    assert events == [
+        AlarmEvent("battery_under_voltage_warning", True, 1.0, 11.9),
+        AlarmEvent("battery_under_voltage_warning", False, 3.0, 12.3),
+    ]
+
+
+def test_alarm_engine_rule_debounce_and_missing_values():
+    rule = ThresholdRule("hot", "controller_temperature", ">=", 60, debounce=2)
+    engine, events = _engine(rules=[rule], faults=False)
+    engine.update(_snapshot(1.0, controller_temperature=65))
+    engine.update(_snapshot(2.0, controller_temperature=None))
+    engine.update(_snapshot(3.0, controller_temperature=65))
+    assert events == []
+
+    engine.update(_snapshot(4.0, controller_temperature=61))
+    assert events == [AlarmEvent("hot", True, 4.0, 61)]
+    assert engine.active() == ["hot"]
+
+
+def test_alarm_engine_skips_rules_against_unsupported_settings(controller):
+    controller.profile = DeviceProfile("limited", unsupported=(FIELD_REGISTERS["under_voltage_warning_level"],))
+    snapshot = Poller(controller).poll()
+    assert "under_voltage_warning_level" not in snapshot.values
+    engine, events = _engine(rules=DEFAULT_RULES, faults=False)
+
+    engine.update(snapshot._replace(values={**snapshot.values, "battery_voltage": 10.0}))
+    assert events == []
+    # The other rules still run
+    engine.update(_snapshot(1.0, battery_voltage=16.5))
+    assert [event.name for event in events] == ["battery_over_voltage"]
+
+
+def test_alarm_engine_survives_failing_subscriber():
+    engine, events = _engine()
+    engine.subscribe(mock.Mock(side_effect=RuntimeError("boom")))
+    engine.update(_snapshot(1.0, fault_high=0x0002))
+    assert len(events) == 1
+
+
+def test_alarm_engine_validation():
+    with pytest.raises(ValueError):
+        ThresholdRule("bad", "battery_voltage", "=<", 12)
+    with pytest.raises(ValueError):
+        AlarmEngine(debounce=0)
+
+
+def test_alarm_engine_on_poller(controller):
+    poller = Poller(controller)
+    engine, events = _engine(rules=DEFAULT_RULES)
+    poller.subscribe(engine.update)
+    poller.poll()
+
+    # The fake device reports 0x0101 in the fault high word
+    assert [event.fault for event in events] == [Fault.BATTERY_OVER_DISCHARGE, Fault.PHOTOVOLTAIC_INPUT_SHORT_CIRCUIT]
@@ -0,0 +1,148 @@
+from typing import List, Sequence
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from pyrover.analytics import Anomaly, FleetAnalytics  # noqa: E402
+from pyrover.fleet import AlignedSample, FleetSnapshot  # noqa: E402
+from pyrover.rollout import Device  # noqa: E402
+
+NOW = 1_700_000_000.0
+
+
+def _update(analytics: FleetAnalytics, field: str, values: Sequence[float], timestamp: float = NOW) -> None:
+    for device, value in zip(analytics.devices, values):
+        analytics.update(device, {field: value}, timestamp)
+
+
+def test_peer_anomalies():
+    analytics = FleetAnalytics(list(range(6)), fields=["charging_power", "controller_temperature"])
+    for device, (power, temperature) in enumerate(zip([300, 305, 295, 310, 290, 120], [30, 31, 29, 30, 60, 30])):
+        analytics.update(device, {"charging_power": power, "controller_temperature": temperature}, NOW)
+
+    anomalies = analytics.evaluate(NOW)
+
+    assert [(a.device, a.field, a.kind) for a in anomalies] == [
+        (4, "controller_temperature", "peer"),
+        (5, "charging_power", "peer"),
+    ]
+    low = anomalies[1]
+    assert (low.value, low.expected, low.timestamp) == (120.0, 297.5, NOW)
+    assert low.score < -3.5
+    assert anomalies[0].score > 3.5
+    assert abs(analytics.score(0, "charging_power") or 0) < 1
+    assert analytics.matrix.shape == (6, 2)
+
+
+def test_peer_groups_and_identical_values():
+    groups = {device: "sunny" if device < 4 else "cloudy" for device in range(8)}
+    analytics = FleetAnalytics(list(range(8)), fields=["charging_power"], groups=groups)
+
+    _update(analytics, "charging_power", [300, 305, 295, 302, 100, 102, 98, 101])
+    assert analytics.evaluate(NOW) == []
+
+    # At night every value is 0, the minimum spread keeps a few watts from being an outlier
+    _update(analytics, "charging_power", [0, 0, 0, 3, 0, 0, 0, 0])
+    assert analytics.evaluate(NOW) == []
+
+    _update(analytics, "charging_power", [300, 305, 295, 100, 100, 102, 98, 101])
+    assert [(a.device, a.expected) for a in analytics.evaluate(NOW)] == [(3, 297.5)]
+
+
+def test_stale_and_missing_values_are_not_scored():
+    analytics = FleetAnalytics(list(range(4)), fields=["charging_power", "solar_voltage"], max_age=60)
+    _update(analytics, "charging_power", [300, 305, 295, 0])
+    analytics.update(3, {"charging_power": 0, "solar_voltage": "n/a"}, NOW - 120)
+
+    assert analytics.evaluate(NOW) == []
+    assert analytics.score(3, "charging_power") is None
+    assert analytics.score(0, "charging_power") is not None
+    # Fewer than `min_peers` values
+    assert analytics.score(0, "solar_voltage") is None
+
+
+def test_rolling_baselines_learn_persistent_offsets():
+    analytics = FleetAnalytics(list(range(6)), fields=["charging_power"], threshold=100, min_history=10)
+    peers = [300, 305, 295, 310, 290]
+    for cycle in range(30):
+        _update(analytics, "charging_power", [270] + peers, NOW + cycle)
+        assert analytics.evaluate(NOW + cycle) == []
+
+    _update(analytics, "charging_power", [200] + peers, NOW + 30)
+    (anomaly,) = analytics.evaluate(NOW + 30)
+
+    assert (anomaly.device, anomaly.kind, anomaly.value) == (0, "baseline", 200.0)
+    assert anomaly.score < -4
+    # Between the peers' median and the device's usual value
+    assert 270 <= anomaly.expected < 297.5
+
+
+def test_persistent_outliers_are_flagged_until_they_have_a_baseline():
+    analytics = FleetAnalytics(list(range(6)), fields=["charging_power"], min_history=10)
+    peers = [300, 305, 295, 310, 290]
+    kinds = []
+    for cycle in range(200):
+        _update(analytics, "charging_power", [150] + peers, NOW + cycle)
+        kinds.append([anomaly.kind for anomaly in analytics.evaluate(NOW + cycle)])
+
+    assert kinds == [["peer"]] * 10 + [[]] * 190
+
+    # Further below the peers than usual
+    _update(analytics, "charging_power", [100] + peers, NOW + 200)
+    (anomaly,) = analytics.evaluate(NOW + 200)
+    assert (anomaly.device, anomaly.kind) == (0, "peer")
+    assert anomaly.expected == pytest.approx(150, abs=5)
+
+
+def test_lasting_failures_stay_flagged():
+    analytics = FleetAnalytics(list(range(6)), fields=["charging_power"], min_history=10)
+    peers = [300, 305, 295, 310, 290]
+    for cycle in range(50):
+        _update(analytics, "charging_power", [300 + cycle % 3] + peers, NOW + cycle)
+        assert analytics.evaluate(NOW + cycle) == []
+
+    # A quarter of its peers for good, e.g. a broken string of panels
+    for cycle in range(50, 400):
+        _update(analytics, "charging_power", [75] + peers, NOW + cycle)
+        (anomaly,) = analytics.evaluate(NOW + cycle)
+        assert (anomaly.device, anomaly.kind) == (0, "peer")
+        assert anomaly.score < -20
+        assert anomaly.expected == pytest.approx(300, abs=5)
+
+    _update(analytics, "charging_power", [300] + peers, NOW + 400)
+    assert analytics.evaluate(NOW + 400) == []
+
+
+def test_baselines_need_history():
+    analytics = FleetAnalytics(list(range(6)), fields=["charging_power"], threshold=100, min_history=10)
+    _update(analytics, "charging_power", [270, 300, 305, 295, 310, 290])
+    analytics.evaluate(NOW)
+    _update(analytics, "charging_power", [100, 300, 305, 295, 310, 290])
+    assert analytics.evaluate(NOW) == []
+
+
+def test_update_fleet_and_subscribers():
+    devices = [Device("/dev/ttyUSB0", address) for address in range(1, 5)]
+    analytics = FleetAnalytics(devices, fields=["charging_power"])
+    received: List[List[Anomaly]] = []
+    analytics.subscribe(received.append)
+
+    def sample(device: Device, power: float, error=None) -> AlignedSample:
+        return AlignedSample(device, NOW, 0.01, 0.0, {"charging_power": power}, {}, error)
+
+    powers = [300, 305, 295, 50]
+    snapshot = FleetSnapshot(NOW, {device: sample(device, power) for device, power in zip(devices, powers)}, 0.0)
+    anomalies = analytics.update_fleet(snapshot)
+
+    assert [a.device for a in anomalies] == [devices[3]]
+    assert received == [anomalies]
+
+    failed = snapshot._replace(samples={**snapshot.samples, devices[3]: sample(devices[3], 0, "no answer")})
+    analytics.update_fleet(failed._replace(trigger=NOW + 120))
+    assert analytics.matrix[3, 0] == 50
+
+
+def test_devices_must_be_unique():
+    with pytest.raises(ValueError):
+        FleetAnalytics([1, 1])
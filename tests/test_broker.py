@@ -0,0 +1,162 @@
+import threading
+from typing import Any, Dict, List
+from unittest import mock
+
+import minimalmodbus
+import pytest
+
+from pyrover.broker import Broker, BudgetExceeded
+from pyrover.registers import RegisterSpan
+from pyrover.renogy_rover import RenogyRoverController
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    fake_clock = FakeClock()
+    with mock.patch("pyrover.broker.time.monotonic", fake_clock):
+        yield fake_clock
+
+
+def _slow_reads(fake_modbus: Any, clock: FakeClock, seconds: float) -> None:
+    # Each read takes `seconds` of the fake clock
+    read_registers = fake_modbus.read_registers.side_effect
+
+    def slow_read(*args, **kwargs):
+        clock.now += seconds
+        return read_registers(*args, **kwargs)
+
+    fake_modbus.read_registers.side_effect = slow_read
+
+
+def test_consumers_share_the_cache_within_their_tolerance(controller: RenogyRoverController, fake_modbus, clock):
+    broker = Broker(controller)
+    exporter = broker.consumer("exporter", max_age=1.0)
+    dashboard = broker.consumer("dashboard", max_age=5.0)
+
+    assert exporter.charging_power() == controller.charging_power()
+    fake_modbus.reset_mock()
+    clock.now += 2
+    assert dashboard.charging_power() == 305
+    fake_modbus.read_registers.assert_not_called()
+
+    # Too old for the exporter
+    assert exporter.charging_power() == 305
+    fake_modbus.read_registers.assert_called_once_with(0x0109, number_of_registers=1)
+
+    stats = broker.stats()
+    assert (stats["dashboard"].requests, stats["dashboard"].hits, stats["dashboard"].hit_ratio) == (1, 1, 1.0)
+    assert (stats["exporter"].requests, stats["exporter"].transactions, stats["exporter"].hits) == (2, 2, 0)
+
+
+def test_fields_of_a_block_are_read_together(controller: RenogyRoverController, fake_modbus, clock):
+    consumer = Broker(controller).consumer("alarms")
+    values = consumer.get("battery_voltage", "charging_state", "charging_power", "battery_type")
+
+    assert values == {
+        "battery_voltage": controller.battery_voltage(),
+        "charging_state": controller.charging_state(),
+        "charging_power": controller.charging_power(),
+        "battery_type": controller.battery_type(),
+    }
+    assert fake_modbus.read_registers.call_args_list[:2] == [
+        mock.call(0x0101, number_of_registers=0x0120 - 0x0101 + 1),
+        mock.call(0xE004, number_of_registers=1),
+    ]
+    # Every field within the cached span is a hit
+    assert consumer.load_power() == 460
+    assert consumer.stats().hits == 1
+    with pytest.raises(ValueError):
+        consumer.get("not_a_field")
+    with pytest.raises(AttributeError):
+        consumer.not_a_field()
+
+
+def test_identical_requests_in_flight_are_coalesced(controller: RenogyRoverController, fake_modbus):
+    broker = Broker(controller)
+    first, second = broker.consumer("first"), broker.consumer("second")
+    entered, release = threading.Event(), threading.Event()
+    read_registers = fake_modbus.read_registers.side_effect
+
+    def blocking_read(*args, **kwargs):
+        entered.set()
+        release.wait(5)
+        return read_registers(*args, **kwargs)
+
+    fake_modbus.read_registers.side_effect = blocking_read
+    results: Dict[str, List[int]] = {}
+    span = RegisterSpan(0x0100, 10)
+    threads = [
+        threading.Thread(target=lambda: results.update(first=first.read(span))),
+        threading.Thread(target=lambda: results.update(second=second.read(RegisterSpan(0x0102, 2)))),
+    ]
+    threads[0].start()
+    assert entered.wait(5)
+    threads[1].start()
+    while second.coalesced == 0:
+        threads[1].join(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert fake_modbus.read_registers.call_count == 1
+    assert results["second"] == results["first"][2:4] == [3112, 0x8514]
+    stats = broker.stats()
+    assert (stats["first"].transactions, stats["second"].coalesced, stats["second"].coalesce_ratio) == (1, 1, 1.0)
+    # Both share the cost of the transaction
+    assert stats["first"].bus_time == pytest.approx(stats["second"].bus_time)
+
+
+def test_failed_transaction_is_not_cached(controller: RenogyRoverController, fake_modbus, clock):
+    consumer = Broker(controller).consumer("script")
+    read_registers = fake_modbus.read_registers.side_effect
+    fake_modbus.read_registers.side_effect = minimalmodbus.NoResponseError("no answer")
+    with pytest.raises(minimalmodbus.NoResponseError):
+        consumer.battery_percentage()
+
+    fake_modbus.read_registers.side_effect = read_registers
+    assert consumer.battery_percentage() == 98
+    assert consumer.stats().transactions == 2
+
+
+def test_bus_time_budget(controller: RenogyRoverController, fake_modbus, clock):
+    broker = Broker(controller, window=10.0)
+    script = broker.consumer("script", max_age=1.0, budget=0.01)
+    _slow_reads(fake_modbus, clock, 0.2)
+
+    assert script.charging_power() == 305
+    stats = script.stats()
+    assert stats.bus_time == pytest.approx(0.2)
+    assert stats.utilisation == pytest.approx(0.02)
+    assert broker.utilisation() == pytest.approx(0.02)
+
+    # Over budget: outdated values rather than another transaction
+    clock.now += 2
+    fake_modbus.reset_mock()
+    assert script.charging_power() == 305
+    fake_modbus.read_registers.assert_not_called()
+    with pytest.raises(BudgetExceeded):
+        script.battery_type()
+    assert (script.stats().stale, script.stats().rejected) == (1, 1)
+
+    # Other consumers are not limited, and the budget comes back with the window
+    assert broker.consumer("alarms").battery_type() is not None
+    clock.now += 10
+    assert script.battery_type() is not None
+    assert script.stats().transactions == 2
+
+
+def test_consumer_registration(controller: RenogyRoverController):
+    broker = Broker(controller)
+    broker.consumer("dashboard")
+    with pytest.raises(ValueError):
+        broker.consumer("dashboard")
+    with pytest.raises(ValueError):
+        broker.consumer("greedy", budget=2.0)
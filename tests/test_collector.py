@@ -0,0 +1,153 @@
+import functools
+import os
+import time
+from unittest import mock
+
+import pytest
+
+from pyrover.collector import _REGISTERS, _ROW_HEADER, Collector, ResultTable, shard_devices
+from pyrover.registers import BLOCKS
+from pyrover.renogy_rover import RenogyRoverController
+from pyrover.rollout import Device
+from pyrover.types import ChargingState
+from tests.fakes.fake_modbus import create_fake_modbus
+
+
+def _fake_controller(device):
+    with mock.patch("pyrover.renogy_rover._create_controller", return_value=create_fake_modbus()):
+        return RenogyRoverController(port=device.port, address=device.address)
+
+
+def _crash_once(marker, device):
+    # Kills the worker the first time, works after the restart
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return _fake_controller(device)
+
+
+def _failing_controller(device):
+    raise IOError("no response")
+
+
+def _wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def table():
+    table = ResultTable(2)
+    yield table
+    table.close()
+    table.unlink()
+
+
+def test_shard_devices_keeps_ports_together():
+    devices = [Device("/dev/ttyUSB0", 1), Device("/dev/ttyUSB1", 1), Device("/dev/ttyUSB0", 2), Device("tcp", 1)]
+    shards = shard_devices(devices, workers=2)
+
+    assert len(shards) == 2
+    assert sorted(index for shard in shards for index, _ in shard) == [0, 1, 2, 3]
+    usb0 = [i for i, shard in enumerate(shards) for _, device in shard if device.port == "/dev/ttyUSB0"]
+    assert len(usb0) == 2 and usb0[0] == usb0[1]
+    assert len(shard_devices(devices, workers=8)) == 3
+
+
+def test_result_table_roundtrip(table, controller):
+    assert table.read(0) is None
+    with controller.prefetch(*BLOCKS) as registers:
+        table.write(1, 123.5, registers)
+
+    snapshot = table.read(1)
+    assert snapshot is not None
+    assert snapshot.timestamp == 123.5
+    assert snapshot.registers == registers
+    assert snapshot.values == controller.all_data()
+    assert table.read(0) is None
+
+
+def test_result_table_shared_between_attachments(table):
+    reader = ResultTable.attach(table.name, 2, tracked=True)
+    table.write(0, 1.0, {0x0109: 305})
+    table.record_error(0)
+
+    snapshot = reader.read(0)
+    assert snapshot is not None
+    assert snapshot.values["charging_power"] == 305
+    assert reader.errors(0) == 1
+    reader.close()
+
+
+def test_row_left_half_written_by_a_dead_worker(table):
+    table.write(0, 1.0, {0x0109: 305})
+    # The worker died between the two header writes of the next reading
+    sequence, errors, _ = _ROW_HEADER.unpack_from(table._buffer, 0)
+    _ROW_HEADER.pack_into(table._buffer, 0, sequence + 1, errors, 0.0)
+
+    started = time.monotonic()
+    assert table.read(0) is None
+    assert time.monotonic() - started < 1.0
+
+    # The restarted worker marks the row as being written (odd) while writing it, and as written (even) after
+    marks = []
+    registers = _REGISTERS
+
+    class Registers:
+        def pack_into(self, *args):
+            marks.append(_ROW_HEADER.unpack_from(table._buffer, 0)[0])
+            registers.pack_into(*args)
+
+        def __getattr__(self, name):
+            return getattr(registers, name)
+
+    with mock.patch("pyrover.collector._REGISTERS", Registers()):
+        table.write(0, 2.0, {0x0109: 306})
+    assert marks[0] % 2 == 1
+    snapshot = table.read(0)
+    assert snapshot is not None and snapshot.values["charging_power"] == 306
+    table.record_error(0)
+    assert _ROW_HEADER.unpack_from(table._buffer, 0)[0] % 2 == 0
+    assert table.errors(0) == 1
+
+
+def test_collector_fills_the_table():
+    devices = [Device("/dev/ttyUSB0", 1), Device("/dev/ttyUSB0", 2), Device("/dev/ttyUSB1", 1)]
+    collector = Collector(devices, workers=2, interval=0.05, controller_factory=_fake_controller)
+    collector.start()
+    try:
+        _wait_for(lambda: all(collector.fleet().values()))
+        snapshot = collector.snapshot(devices[2])
+        assert snapshot is not None
+        assert snapshot.values["charging_state"] == ChargingState.MPPT
+        assert snapshot.values["product_model"] == "RNG-CTRL-RVR40"
+        assert len(collector.shards) == 2
+    finally:
+        collector.stop()
+    with pytest.raises(RuntimeError):
+        collector.snapshot(devices[0])
+
+
+def test_collector_records_errors():
+    device = Device("/dev/ttyUSB0", 1)
+    collector = Collector([device], interval=0.01, controller_factory=_failing_controller)
+    collector.start()
+    try:
+        _wait_for(lambda: collector.errors(device) >= 2)
+        assert collector.snapshot(device) is None
+    finally:
+        collector.stop()
+
+
+def test_collector_restarts_crashed_workers(tmp_path):
+    device = Device("/dev/ttyUSB0", 1)
+    factory = functools.partial(_crash_once, str(tmp_path / "crashed"))
+    collector = Collector([device], interval=0.05, check_interval=0.01, controller_factory=factory)
+    collector.start()
+    try:
+        _wait_for(lambda: collector.snapshot(device) is not None)
+        assert collector.restarts == [1]
+    finally:
+        collector.stop()
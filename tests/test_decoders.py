@@ -0,0 +1,80 @@
+from array import array
+from typing import Any
+from unittest import mock
+
+import pytest
+
+from pyrover.decoders import FIELD_DECODERS, BufferDecoder
+from pyrover.registers import BLOCKS, DYNAMIC_DATA_BLOCK, FIELD_REGISTERS, SETTINGS_BLOCK, RegisterSpan
+
+
+def _buffer(span):
+    return array("H", bytes(2 * span.number_of_registers))
+
+
+def test_field_decoders_cover_all_fields():
+    assert sorted(FIELD_DECODERS) == sorted(FIELD_REGISTERS)
+
+
+@pytest.mark.parametrize("block", BLOCKS)
+def test_buffer_decoder_matches_getters(block, controller):
+    buffer = _buffer(block)
+    controller.read_into(block, buffer)
+    decoded = BufferDecoder(block).decode(buffer)
+
+    assert decoded == {name: getattr(controller, name)() for name in decoded}
+
+
+@pytest.mark.parametrize(
+    "addr,value,field,expected",
+    [
+        (0x0120, 0x00FF, "charging_state", 0xFF),
+        (0x0120, 0x0007, "charging_state", 7),
+        (0x0120, 0x80FF, "street_light_status", 1),
+        (0x0103, 0x0585, "battery_temperature", -5),
+    ],
+)
+def test_buffer_decoder_unknown_and_signed_values(addr, value, field, expected, controller, fake_modbus):
+    fake_modbus.set_value(addr, value)
+    buffer = _buffer(DYNAMIC_DATA_BLOCK)
+    controller.read_into(DYNAMIC_DATA_BLOCK, buffer)
+    decoded = BufferDecoder(DYNAMIC_DATA_BLOCK).value(buffer, field)
+
+    assert decoded == expected
+    assert type(decoded) is type(getattr(controller, field)())
+    assert decoded == getattr(controller, field)()
+
+
+def test_buffer_decoder_unknown_settings_match_getters(controller, fake_modbus):
+    fake_modbus.set_value(0xE004, 0x99)
+    buffer = _buffer(SETTINGS_BLOCK)
+    controller.read_into(SETTINGS_BLOCK, buffer)
+
+    assert BufferDecoder(SETTINGS_BLOCK).value(buffer, "battery_type") == controller.battery_type() == 0x99
+
+
+def test_buffer_decoder_reuses_values_and_supports_offsets(controller):
+    span = RegisterSpan(0x0107, 3)
+    buffer = memoryview(array("H", bytes(2 * 8)))
+    controller.read_into(span, buffer, offset=5)
+
+    values = {"other": 1}
+    result = BufferDecoder(span).decode(buffer, values, offset=5)
+    assert result is values
+    assert values == {"other": 1, "solar_voltage": 12.5, "solar_current": 24.4, "charging_power": 305}
+
+
+def test_buffer_decoder_rejects_fields_outside_the_span():
+    with pytest.raises(ValueError):
+        BufferDecoder(RegisterSpan(0x0107, 3), fields=["battery_voltage"])
+
+
+def test_read_into_uses_the_device_buffer_api_when_available(controller):
+    device: Any = mock.Mock()
+    controller.device = device
+    span = RegisterSpan(0x0100, 10)
+    buffer = _buffer(span)
+    controller.read_into(span, buffer)
+
+    device.read_registers_into.assert_called_once_with(0x0100, buffer, 0, 10)
+    device.read_registers.assert_not_called()
@@ -0,0 +1,101 @@
+from typing import Any
+from unittest import mock
+
+import minimalmodbus
+import pytest
+
+from pyrover.discovery import BAUDRATES, DiscoveredDevice, scan, scan_ports, scan_time
+from pyrover.types import ProductType
+from tests.fakes.fake_modbus import create_fake_modbus
+
+
+def _bus(addresses, baudrate=19200):
+    fake_modbus: Any = create_fake_modbus()
+    probes = []
+
+    def only_present(read):
+        def wrapper(*args, **kwargs):
+            probes.append((fake_modbus.address, fake_modbus.serial.baudrate, fake_modbus.serial.timeout))
+            if fake_modbus.address not in addresses or fake_modbus.serial.baudrate != baudrate:
+                raise minimalmodbus.NoResponseError("No communication with the instrument (no answer)")
+            return read(*args, **kwargs)
+
+        return wrapper
+
+    fake_modbus.read_register.side_effect = only_present(fake_modbus.read_register.side_effect)
+    fake_modbus.read_registers.side_effect = only_present(fake_modbus.read_registers.side_effect)
+    return fake_modbus, probes
+
+
+@pytest.fixture
+def bus():
+    fake_modbus, probes = _bus({3, 17})
+    with mock.patch("pyrover.renogy_rover._create_controller", return_value=fake_modbus):
+        yield fake_modbus, probes
+
+
+def test_scan_finds_devices(bus):
+    _, probes = bus
+    found = scan("/dev/ttyUSB0", baudrates=BAUDRATES, probe_timeout=0.02)
+
+    assert found == [
+        DiscoveredDevice(
+            port="/dev/ttyUSB0",
+            address=address,
+            baudrate=19200,
+            model="RNG-CTRL-RVR40",
+            serial_number=0x12345678,
+            product_type=ProductType.CHARGE_CONTROLLER,
+            software_version="16.34.52",
+        )
+        for address in (3, 17)
+    ]
+    # Every address at 9600 then 19200 bauds, plus one block read per device found
+    assert len(probes) == 2 * 247 + 2
+    # The frames of a probe take 17 ms at 9600 bauds, 138 ms at 1200
+    assert {round(timeout, 4) for _, _, timeout in probes[:-2]} == {0.0372, 0.0286}
+    assert {round(timeout, 4) for _, _, timeout in probes[-2:]} == {0.5269}
+
+
+def test_scan_defaults_to_the_factory_baud_rate(bus):
+    _, probes = bus
+    assert scan("/dev/ttyUSB0") == []
+    assert {baudrate for _, baudrate, _ in probes} == {9600}
+    assert len(probes) == 247
+
+    # Seconds on a silent bus with the defaults, minutes with every baud rate
+    assert 15 < scan_time() < 20
+    assert 120 < scan_time(baudrates=BAUDRATES) < 180
+
+
+def test_scan_probe_timeout_grows_at_low_baud_rates():
+    fake_modbus, probes = _bus({3}, baudrate=1200)
+    with mock.patch("pyrover.renogy_rover._create_controller", return_value=fake_modbus):
+        found = scan("/dev/ttyUSB0", addresses=range(1, 5), baudrates=(1200,))
+
+    assert [device.address for device in found] == [3]
+    # A probe's request and response frames alone take 125 ms at 1200 bauds (8N1)
+    assert min(timeout for _, _, timeout in probes[:-1]) > 0.125 + 0.05
+
+
+def test_scan_all_baudrates(bus):
+    _, probes = bus
+    found = scan("/dev/ttyUSB0", addresses=range(1, 20), baudrates=(19200, 9600), all_baudrates=True)
+
+    assert [device.address for device in found] == [3, 17]
+    assert {baudrate for _, baudrate, _ in probes} == {19200, 9600}
+
+
+def test_scan_nothing_found(bus):
+    assert scan("/dev/ttyUSB0", addresses=range(20, 30), baudrates=(9600, 19200)) == []
+
+
+def test_scan_ports():
+    buses = {"/dev/ttyUSB0": _bus({1})[0], "/dev/ttyUSB1": _bus({2, 5})[0]}
+    with mock.patch("pyrover.renogy_rover._create_controller", side_effect=lambda port, address: buses[port]):
+        found = scan_ports(["/dev/ttyUSB0", "/dev/ttyUSB1"], addresses=range(1, 10), baudrates=(19200,))
+
+    assert {port: [d.address for d in devices] for port, devices in found.items()} == {
+        "/dev/ttyUSB0": [1],
+        "/dev/ttyUSB1": [2, 5],
+    }
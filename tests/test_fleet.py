@@ -0,0 +1,118 @@
+from typing import Any, Dict, List
+from unittest import mock
+import time
+
+import minimalmodbus
+import pytest
+
+from pyrover.fleet import TELEMETRY_BLOCK, FleetSampler, FleetSnapshot
+from pyrover.renogy_rover import RenogyRoverController
+from pyrover.rollout import Device
+from tests.fakes.fake_modbus import create_fake_modbus
+
+READ_TIME = 0.05
+
+
+def _fakes(*devices: Device) -> Dict[Device, Any]:
+    # Devices whose block reads take READ_TIME, like a few registers at 9600 bauds
+    fakes = {}
+    for device in devices:
+        fake: Any = create_fake_modbus()
+        read_registers = fake.read_registers.side_effect
+
+        def slow_read(*args, read_registers=read_registers, **kwargs):
+            time.sleep(READ_TIME)
+            return read_registers(*args, **kwargs)
+
+        fake.read_registers.side_effect = slow_read
+        fakes[device] = fake
+    return fakes
+
+
+def _sampler(fakes: Dict[Device, Any]) -> FleetSampler:
+    def create_controller(device: Device) -> RenogyRoverController:
+        with mock.patch("pyrover.renogy_rover._create_controller", return_value=fakes[device]):
+            return RenogyRoverController(port=device.port, address=device.address)
+
+    return FleetSampler(list(fakes), controller_factory=create_controller)
+
+
+def test_sample_reads_telemetry_block_of_every_device():
+    devices = [Device("/dev/fleet0", 1), Device("/dev/fleet0", 2), Device("/dev/fleet1", 1)]
+    fakes = _fakes(*devices)
+    sampler = _sampler(fakes)
+    try:
+        snapshot = sampler.sample()
+    finally:
+        sampler.close()
+
+    assert list(snapshot.samples) == devices
+    assert snapshot.errors == {}
+    for fake in fakes.values():
+        fake.read_registers.assert_called_once_with(
+            TELEMETRY_BLOCK.address, number_of_registers=TELEMETRY_BLOCK.number_of_registers
+        )
+    sample = snapshot.samples[devices[2]]
+    assert sample.device == devices[2]
+    assert sample.values["battery_percentage"] == 98
+    assert sample.values["solar_voltage"] == 12.5
+    assert sample.registers[0x0100] == 98
+    assert len(sample.registers) == 10
+    assert sampler.latest is snapshot
+
+
+def test_ports_are_read_in_parallel_and_buses_back_to_back():
+    devices = [Device("/dev/fleet0", 1), Device("/dev/fleet0", 2), Device("/dev/fleet1", 1)]
+    sampler = _sampler(_fakes(*devices))
+    before = time.time()
+    try:
+        snapshot = sampler.sample()
+    finally:
+        sampler.close()
+
+    first, second, other_port = (snapshot.samples[device] for device in devices)
+    # The first device of each port is read at the same time
+    assert abs(first.timestamp - other_port.timestamp) < READ_TIME / 2
+    assert min(first.skew, other_port.skew) == 0.0
+    # The second device on the bus right after the first one
+    assert READ_TIME <= second.timestamp - first.timestamp < 2 * READ_TIME
+    assert snapshot.skew == pytest.approx(max(sample.skew for sample in snapshot.samples.values()))
+    assert before <= snapshot.trigger <= first.timestamp
+    assert all(sample.duration >= READ_TIME for sample in snapshot.samples.values())
+
+
+def test_failed_device_is_reported_without_failing_the_snapshot():
+    devices = [Device("/dev/fleet0", 1), Device("/dev/fleet0", 2)]
+    fakes = _fakes(*devices)
+    fakes[devices[0]].read_registers.side_effect = minimalmodbus.NoResponseError("no answer")
+    sampler = _sampler(fakes)
+    try:
+        snapshot = sampler.sample()
+    finally:
+        sampler.close()
+
+    assert snapshot.errors == {devices[0]: "no answer"}
+    assert snapshot.samples[devices[0]].values == {}
+    assert snapshot.samples[devices[1]].values["battery_percentage"] == 98
+    assert snapshot.skew == 0.0
+
+
+def test_subscribers_get_periodic_snapshots():
+    sampler = _sampler(_fakes(Device("/dev/fleet0", 1)))
+    snapshots: List[FleetSnapshot] = []
+    sampler.subscribe(snapshots.append)
+    sampler.start(interval=0.01)
+    try:
+        deadline = time.monotonic() + 5
+        while len(snapshots) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        sampler.close()
+
+    assert len(snapshots) >= 3
+    assert snapshots[0].trigger < snapshots[1].trigger < snapshots[2].trigger
+
+
+def test_devices_must_be_unique():
+    with pytest.raises(ValueError):
+        FleetSampler([Device("/dev/fleet0", 1), Device("/dev/fleet0", 1)], controller_factory=mock.Mock())
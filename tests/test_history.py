@@ -0,0 +1,154 @@
+import json
+from datetime import date
+from typing import Any
+
+import minimalmodbus
+import pytest
+
+from pyrover.history import DAY_REGISTERS, HISTORY_ADDRESS, HistorySync, decode_day, read_history
+from pyrover.renogy_rover import RenogyRoverController
+
+
+@pytest.fixture
+def history(fake_modbus):
+    # Day n days ago: [n * 100, n * 100 + 1, ...], 40 days stored
+    stored = 40
+    reads = []
+    read_registers = fake_modbus.read_registers.side_effect
+
+    def read_history_registers(addr: int, number_of_registers: int = 1, **kwargs):
+        if addr < HISTORY_ADDRESS:
+            return read_registers(addr, number_of_registers, **kwargs)
+        reads.append((addr - HISTORY_ADDRESS, number_of_registers // DAY_REGISTERS))
+        first = addr - HISTORY_ADDRESS
+        days = range(first, first + number_of_registers // DAY_REGISTERS)
+        if days[-1] >= stored:
+            raise minimalmodbus.IllegalRequestError("illegal data address")
+        return [day * 100 + i for day in days for i in range(DAY_REGISTERS)]
+
+    fake_modbus.read_registers.side_effect = read_history_registers
+    fake_modbus.set_value(0x0115, 100)
+    return reads
+
+
+def test_decode_day():
+    values = decode_day([128, 142, 3011, 205, 385, 105, 170, 12, 13450, 123])
+    assert values == {
+        "battery_min_voltage": 12.8,
+        "battery_max_voltage": 14.2,
+        "max_charging_current": 30.11,
+        "max_discharging_current": 2.05,
+        "max_charging_power": 385,
+        "min_charging_power": 105,
+        "charging_amphours": 170,
+        "discharging_amphours": 12,
+        "power_generation": 13.45,
+        "power_consumption": 0.123,
+    }
+
+
+def test_read_history_in_blocks(controller: RenogyRoverController, history):
+    records = read_history(controller, first=1, days=20)
+
+    assert history == [(1, 12), (13, 8)]
+    assert [record["charging_amphours"] for record in records] == [day * 100 + 6 for day in range(1, 21)]
+    with pytest.raises(ValueError):
+        read_history(controller, first=1, days=2, days_per_read=13)
+
+
+def test_read_history_with_larger_records(controller: RenogyRoverController, fake_modbus):
+    # 20 registers per day: the 10 decoded ones then 10 others
+    reads = []
+
+    def read_registers(addr: int, number_of_registers: int = 1, **kwargs):
+        reads.append((addr - HISTORY_ADDRESS, number_of_registers))
+        days = range(addr - HISTORY_ADDRESS, addr - HISTORY_ADDRESS + number_of_registers // 20)
+        return [day * 100 + i if i < DAY_REGISTERS else 0xFFFF for day in days for i in range(20)]
+
+    fake_modbus.read_registers.side_effect = read_registers
+    records = read_history(controller, first=1, days=8, day_registers=20)
+
+    assert reads == [(1, 120), (7, 40)]
+    assert [record["charging_amphours"] for record in records] == [day * 100 + 6 for day in range(1, 9)]
+    with pytest.raises(ValueError):
+        read_history(controller, first=1, days=2, days_per_read=7, day_registers=20)
+    with pytest.raises(ValueError):
+        read_history(controller, first=1, days=2, day_registers=8)
+
+
+def test_history_sync_is_incremental(controller: RenogyRoverController, history, fake_modbus, tmp_path):
+    path = str(tmp_path / "history.json")
+    sync = HistorySync(controller, path, max_days=30)
+
+    records = sync.sync(today=date(2024, 6, 30))
+    assert [record.days_ago for record in records] == list(range(30, 0, -1))
+    assert (records[0].day, records[0].date) == (70, date(2024, 5, 31))
+    assert (records[-1].day, records[-1].date) == (99, date(2024, 6, 29))
+    assert history == [(1, 12), (13, 12), (25, 6)]
+    assert json.loads(open(path).read()) == {str(0x12345678): 99}
+
+    # Nothing new on the same day
+    history.clear()
+    assert sync.sync() == []
+    assert history == []
+
+    # Three days later, from a new process
+    fake_modbus.set_value(0x0115, 103)
+    sent = []
+    records = HistorySync(controller, path).sync(sent.append)
+    assert [record.day for record in records] == [100, 101, 102]
+    assert sent == [records]
+    assert history == [(1, 3)]
+    assert HistorySync(controller, path).cursor == 102
+
+
+def test_history_sync_keeps_cursor_when_send_fails(controller: RenogyRoverController, history, tmp_path):
+    sync = HistorySync(controller, str(tmp_path / "history.json"), key="rover", max_days=2)
+
+    def fail(records: Any) -> None:
+        raise OSError("upload failed")
+
+    with pytest.raises(OSError):
+        sync.sync(fail)
+    assert sync.cursor is None
+    assert [record.day for record in sync.sync()] == [98, 99]
+    assert sync.cursor == 99
+
+
+def test_history_sync_today(controller: RenogyRoverController, history, tmp_path):
+    sync = HistorySync(controller, str(tmp_path / "history.json"), key="rover", max_days=1, include_today=True)
+
+    assert [record.days_ago for record in sync.sync()] == [1, 0]
+    # The current day is returned again until it is complete
+    assert [record.days_ago for record in sync.sync()] == [0]
+    assert sync.cursor == 99
+
+
+def test_history_sync_after_clear(controller: RenogyRoverController, history, fake_modbus, tmp_path):
+    path = tmp_path / "history.json"
+    path.write_text(json.dumps({"rover": 500}))
+    fake_modbus.set_value(0x0115, 4)
+
+    records = HistorySync(controller, str(path), key="rover").sync()
+    assert [record.day for record in records] == [1, 2, 3]
+
+
+def test_history_sync_warns_about_skipped_days(
+    controller: RenogyRoverController, history, fake_modbus, tmp_path, caplog
+):
+    path = tmp_path / "history.json"
+    path.write_text(json.dumps({"rover": 60}))
+
+    records = HistorySync(controller, str(path), key="rover", max_days=30).sync()
+    assert [record.day for record in records] == list(range(70, 100))
+    assert "9 day(s) of history before the last 30 days skipped" in caplog.text
+
+
+def test_history_sync_falls_back_to_single_day_reads(controller: RenogyRoverController, history, tmp_path):
+    sync = HistorySync(controller, str(tmp_path / "history.json"), key="rover", max_days=60)
+
+    records = sync.sync()
+    # The block read past the stored history fails, the stored days are read one by one
+    assert [record.days_ago for record in records] == list(range(39, 0, -1))
+    assert sync.days_per_read == 1
+    assert sync.cursor == 99
@@ -0,0 +1,85 @@
+from datetime import datetime
+
+import pytest
+
+from pyrover.metrics import EnergyMetrics
+from pyrover.poller import Snapshot
+
+
+def _snapshot(timestamp, **overrides):
+    values = {
+        "solar_voltage": 20.0,
+        "solar_current": 5.0,
+        "charging_power": 90,
+        "charging_current": 6.0,
+        "load_power": 30,
+        "load_current": 2.0,
+        "power_generation_today": 0.09,
+        "charging_amphours_today": 6,
+        "cumulative_power_generation": 100.0,
+    }
+    values.update(overrides)
+    return Snapshot(timestamp=timestamp, values=values, registers={})
+
+
+def test_metrics_instantaneous_values():
+    metrics = EnergyMetrics()
+    metrics.update(_snapshot(1_000.0))
+
+    assert metrics.efficiency == pytest.approx(0.9)
+    assert metrics.net_power == 60
+    assert metrics.net_current == pytest.approx(4.0)
+    assert metrics.charging_power_ewma == 90
+
+
+def test_metrics_integrate_between_samples():
+    metrics = EnergyMetrics(max_gap=3_600)
+    start = datetime(2024, 6, 1, 10).timestamp()
+    metrics.update(_snapshot(start))
+    metrics.update(_snapshot(start + 1_800, charging_power=110, charging_current=8.0))
+
+    # Trapezoid over half an hour
+    assert metrics.charging_wh == pytest.approx(50.0)
+    assert metrics.load_wh == pytest.approx(15.0)
+    assert metrics.solar_wh == pytest.approx(50.0)
+    assert metrics.charging_ah == pytest.approx(3.5)
+    assert metrics.charging_wh_today == pytest.approx(50.0)
+    assert metrics.peak_charging_power_today == 110
+
+
+def test_metrics_skip_gaps_and_reset_daily_counters():
+    metrics = EnergyMetrics(max_gap=60)
+    start = datetime(2024, 6, 1, 23, 59).timestamp()
+    metrics.update(_snapshot(start))
+    metrics.update(_snapshot(start + 30))
+    assert metrics.charging_wh_today == pytest.approx(0.75)
+
+    # Past midnight and beyond max_gap: counters reset and the interval is not integrated
+    metrics.update(_snapshot(start + 600))
+    assert metrics.day == datetime(2024, 6, 2).date()
+    assert metrics.charging_wh_today == 0
+    assert metrics.charging_wh == pytest.approx(0.75)
+
+
+def test_metrics_ewma_converges():
+    metrics = EnergyMetrics(time_constant=10)
+    metrics.update(_snapshot(0.0, charging_power=0))
+    for t in range(1, 200):
+        metrics.update(_snapshot(float(t), charging_power=100))
+
+    assert metrics.charging_power_ewma == pytest.approx(100, abs=0.01)
+
+
+def test_metrics_reconcile_with_device_counters():
+    metrics = EnergyMetrics(max_gap=3_600)
+    start = datetime(2024, 6, 1, 10).timestamp()
+    metrics.update(_snapshot(start))
+    metrics.update(_snapshot(start + 3_600, power_generation_today=0.18, cumulative_power_generation=100.09))
+
+    reconciliation = metrics.reconciliation()
+    assert reconciliation["power_generation_today"].device == pytest.approx(180.0)
+    assert reconciliation["power_generation_today"].integrated == pytest.approx(90.0)
+    assert reconciliation["power_generation_today"].ratio == pytest.approx(0.5)
+    assert reconciliation["charging_amphours_today"].error == pytest.approx(0.0)
+    assert reconciliation["cumulative_power_generation"].device == pytest.approx(90.0)
+    assert reconciliation["cumulative_power_generation"].error == pytest.approx(0.0, abs=1e-6)
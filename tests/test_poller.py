@@ -0,0 +1,54 @@
+import time
+from unittest import mock
+
+from pyrover.poller import Poller
+from pyrover.registers import BLOCKS, DYNAMIC_DATA_BLOCK
+
+
+def test_poller_poll_reads_each_block_once(controller, fake_modbus):
+    poller = Poller(controller)
+    snapshot = poller.poll()
+
+    assert fake_modbus.read_registers.call_count == len(BLOCKS)
+    fake_modbus.read_register.assert_not_called()
+    assert snapshot.values["charging_power"] == 305
+    assert snapshot.values["product_model"] == "RNG-CTRL-RVR40"
+    assert snapshot.registers[0x0109] == 305
+    assert poller.latest is snapshot
+
+
+def test_poller_publishes_to_subscribers(controller):
+    poller = Poller(controller)
+    subscriber = mock.Mock()
+    failing_subscriber = mock.Mock(side_effect=RuntimeError("boom"))
+    poller.subscribe(failing_subscriber)
+    poller.subscribe(subscriber)
+
+    snapshot = poller.poll()
+    subscriber.assert_called_once_with(snapshot)
+
+    poller.unsubscribe(subscriber)
+    poller.poll()
+    subscriber.assert_called_once()
+
+
+def test_poller_spans_limit_the_registers_read(controller, fake_modbus):
+    poller = Poller(controller, spans=[DYNAMIC_DATA_BLOCK])
+    snapshot = poller.poll()
+
+    assert min(snapshot.registers) == DYNAMIC_DATA_BLOCK.address
+    assert max(snapshot.registers) == DYNAMIC_DATA_BLOCK.end - 1
+
+
+def test_poller_start_and_stop(controller):
+    poller = Poller(controller, interval=0.01)
+    subscriber = mock.Mock()
+    poller.subscribe(subscriber)
+
+    poller.start()
+    deadline = time.monotonic() + 2
+    while subscriber.call_count < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    poller.stop()
+
+    assert subscriber.call_count >= 3
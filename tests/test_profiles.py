@@ -0,0 +1,152 @@
+import threading
+from typing import Any
+from unittest import mock
+
+import minimalmodbus
+import pytest
+
+from pyrover import profiles
+from pyrover.poller import Poller
+from pyrover.profiles import ROVER, DeviceProfile, profile_for_model
+from pyrover.registers import DYNAMIC_DATA_BLOCK, SETTINGS_BLOCK, SYSTEM_INFO_BLOCK, RegisterSpan
+from pyrover.renogy_rover import RenogyRoverController
+from pyrover.scheduler import PollScheduler
+from tests.fakes.fake_modbus import create_fake_modbus
+
+
+def _fake_model(model, unsupported):
+    fake_modbus: Any = create_fake_modbus()
+    fake_modbus.set_value(0x000C, model.rjust(16))
+
+    def check(read):
+        def wrapper(address, *args, number_of_registers=1, **kwargs):
+            if any(a in unsupported for a in range(address, address + number_of_registers)):
+                raise minimalmodbus.IllegalRequestError("Slave reported illegal data address")
+            return read(address, *args, number_of_registers=number_of_registers, **kwargs)
+
+        return wrapper
+
+    fake_modbus.read_registers.side_effect = check(fake_modbus.read_registers.side_effect)
+    fake_modbus.read_register.side_effect = check(fake_modbus.read_register.side_effect)
+    return fake_modbus
+
+
+# A model without the load timer, light control and special power control settings
+NO_LOAD_SETTINGS = DeviceProfile("no load settings", unsupported=(RegisterSpan(0xE015, 13),))
+
+
+@pytest.fixture
+def no_load_settings():
+    fake_modbus = _fake_model("RNG-CTRL-WND30", set(range(0xE015, 0xE022)))
+    with mock.patch("pyrover.renogy_rover._create_controller", return_value=fake_modbus):
+        yield RenogyRoverController(port="/dev/ttyUSB0", profile=NO_LOAD_SETTINGS), fake_modbus
+
+
+@pytest.fixture(autouse=True)
+def clear_probed():
+    profiles._probed.clear()
+
+
+def test_profile_for_model():
+    assert profile_for_model("RNG-CTRL-RVR40") is ROVER
+    assert profile_for_model("RNG-CTRL-WND30") is None
+    assert profile_for_model("SOMETHING-ELSE") is None
+
+
+def test_profile_trim():
+    profile = DeviceProfile("test", unsupported=(RegisterSpan(0x0104, 3), RegisterSpan(0x0120, 1)))
+
+    assert profile.trim(DYNAMIC_DATA_BLOCK) == [
+        RegisterSpan(0x0100, 4),
+        RegisterSpan(0x0107, 25),
+        RegisterSpan(0x0121, 2),
+    ]
+    assert profile.trim(RegisterSpan(0x0104, 2)) == []
+    assert profile.trim(SYSTEM_INFO_BLOCK) == [SYSTEM_INFO_BLOCK]
+    assert not profile.supports(RegisterSpan(0x0106, 1))
+    assert "load_power" not in profile.fields
+    assert "charging_power" in profile.fields
+
+
+def test_profile_blocks():
+    assert NO_LOAD_SETTINGS.blocks == (SYSTEM_INFO_BLOCK, DYNAMIC_DATA_BLOCK, RegisterSpan(0xE002, 19))
+    assert ROVER.blocks == (SYSTEM_INFO_BLOCK, DYNAMIC_DATA_BLOCK, SETTINGS_BLOCK)
+
+
+def test_detected_profile_skips_unsupported_fields():
+    fake_modbus = _fake_model("RNG-CTRL-WND30", set(range(0xE015, 0xE022)))
+    with mock.patch("pyrover.renogy_rover._create_controller", return_value=fake_modbus):
+        controller = RenogyRoverController(port="/dev/ttyUSB0", detect_profile=True)
+    assert controller.profile is not None and controller.profile.name == "RNG-CTRL-WND30"
+    assert controller.profile.blocks == NO_LOAD_SETTINGS.blocks
+
+    data = controller.all_data()
+    assert "load_working_mode" not in data
+    assert "charging_method" not in data
+    assert data["battery_type"] is not None
+    assert data["product_model"] == "RNG-CTRL-WND30"
+
+
+def test_poller_reads_supported_blocks_only(no_load_settings):
+    controller, fake_modbus = no_load_settings
+    fake_modbus.reset_mock()
+    snapshot = Poller(controller).poll()
+
+    assert fake_modbus.read_registers.call_count == 3
+    assert "led_load_current_setting" not in snapshot.values
+    assert 0xE015 not in snapshot.registers
+
+
+def test_scheduler_skips_unsupported_registers(no_load_settings):
+    controller, _ = no_load_settings
+    scheduler = PollScheduler(controller)
+    for _ in range(20):
+        scheduler.step()
+
+    assert scheduler.latest is not None
+    assert "no_charging_below_freezing" not in scheduler.latest.values
+    assert all(stats.errors == 0 for stats in scheduler.stats())
+
+
+def test_unknown_model_is_probed_once():
+    fake_modbus = _fake_model("ACME-MPPT-20", {0x0120})
+    with mock.patch("pyrover.renogy_rover._create_controller", return_value=fake_modbus):
+        controller = RenogyRoverController(port="/dev/ttyUSB0", detect_profile=True)
+        assert controller.profile == DeviceProfile("ACME-MPPT-20", unsupported=(RegisterSpan(0x0120, 1),))
+        assert "charging_state" not in controller.all_data()
+
+        fake_modbus.reset_mock()
+        other = RenogyRoverController(port="/dev/ttyUSB0", address=2, detect_profile=True)
+        assert other.profile is controller.profile
+        fake_modbus.read_registers.assert_not_called()
+
+
+def test_probing_does_not_block_other_ports():
+    slow = _fake_model("ACME-MPPT-20", {0x0120})
+    fast = _fake_model("ACME-MPPT-40", {0x0120})
+    probing, release = threading.Event(), threading.Event()
+    read_registers = slow.read_registers.side_effect
+
+    def blocking_read(address, *args, **kwargs):
+        if address == 0x0100:
+            probing.set()
+            release.wait(5)
+        return read_registers(address, *args, **kwargs)
+
+    slow.read_registers.side_effect = blocking_read
+    detected = []
+    with mock.patch("pyrover.renogy_rover._create_controller", side_effect=[slow, fast]):
+        first = threading.Thread(target=lambda: RenogyRoverController(port="/dev/ttyUSB0", detect_profile=True))
+        first.start()
+        try:
+            assert probing.wait(5)
+            # Detected while the other port is still being probed
+            second = threading.Thread(
+                target=lambda: detected.append(RenogyRoverController(port="/dev/ttyUSB1", detect_profile=True))
+            )
+            second.start()
+            second.join(2)
+            assert [controller.profile.name for controller in detected] == ["ACME-MPPT-40"]
+        finally:
+            release.set()
+            first.join(5)
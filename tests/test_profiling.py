@@ -0,0 +1,113 @@
+import json
+
+import minimalmodbus
+import pytest
+
+from pyrover.poller import Poller
+from pyrover.registers import BLOCKS, SETTINGS_BLOCK
+from pyrover.renogy_rover import RenogyRoverController
+from pyrover.types import Toggle
+
+
+def test_profiling_attributes_transactions_to_getters(controller: RenogyRoverController):
+    with controller.profiling() as profile:
+        controller.battery_percentage()
+        controller.product_model()
+        controller.serial_number()
+
+    assert [(t.kind, t.address, t.caller) for t in profile.transactions] == [
+        ("read_register", 0x0100, "battery_percentage"),
+        ("read_string", 0x000C, "product_model"),
+        ("read_registers", 0x0018, "serial_number"),
+    ]
+    assert [(t.bytes_sent, t.bytes_received) for t in profile.transactions] == [(8, 7), (8, 21), (8, 9)]
+    assert [call.name for call in profile.calls] == ["battery_percentage", "product_model", "serial_number"]
+    assert all(call.processing_time >= 0 for call in profile.calls)
+
+
+def test_profiling_nested_calls(controller: RenogyRoverController):
+    with controller.profiling() as profile:
+        controller.all_data()
+
+    (all_data,) = [call for call in profile.calls if call.name == "all_data"]
+    (prefetch,) = [call for call in profile.calls if call.name == "prefetch"]
+    getters = [call for call in profile.calls if call.name not in ("all_data", "prefetch")]
+    assert len(getters) == len(controller.all_data_keys())
+    assert all_data.children == pytest.approx(prefetch.duration + sum(call.duration for call in getters))
+    assert all_data.wire_time == 0
+    assert all(t.caller == "prefetch" for t in profile.transactions)
+
+
+def test_profiling_contexts_can_be_nested(controller: RenogyRoverController):
+    with controller.profiling() as outer:
+        with controller.profiling() as inner:
+            controller.battery_percentage()
+            Poller(controller).poll()
+        controller.charging_power()
+
+    assert [call.name for call in inner.calls][0] == "battery_percentage"
+    assert [call.name for call in outer.calls] == [call.name for call in inner.calls] + ["charging_power"]
+    assert "charging_power" not in controller.__dict__
+    # The outer profile also records the transactions made while the inner one was active
+    assert [t.caller for t in inner.transactions] == ["battery_percentage"] + ["prefetch"] * len(BLOCKS)
+    assert [t.caller for t in outer.transactions] == [t.caller for t in inner.transactions] + ["charging_power"]
+    assert sum(t.wire_time for t in outer.transactions) > sum(t.wire_time for t in inner.transactions)
+    assert outer.transactions[0].wire_time == inner.transactions[0].wire_time
+
+
+def test_profiling_block_reads(controller: RenogyRoverController):
+    with controller.profiling() as profile:
+        Poller(controller).poll()
+
+    assert [(t.caller, t.number_of_registers) for t in profile.transactions] == [
+        ("prefetch", block.number_of_registers) for block in BLOCKS
+    ]
+    summary = {row.caller: row for row in profile.summary()}
+    assert summary["prefetch"].transactions == len(BLOCKS)
+    assert summary["prefetch"].bytes == sum(8 + 5 + 2 * block.number_of_registers for block in BLOCKS)
+    assert summary["charging_power"].transactions == 0
+    assert summary["charging_power"].calls == 1
+
+
+def test_profiling_writes_and_errors(controller: RenogyRoverController, fake_modbus):
+    with controller.profiling() as profile:
+        controller.set_street_light(Toggle.ON)
+        fake_modbus.read_registers.side_effect = minimalmodbus.NoResponseError("no answer")
+        with pytest.raises(minimalmodbus.NoResponseError):
+            with controller.prefetch(SETTINGS_BLOCK):
+                pass
+
+    write = next(t for t in profile.transactions if t.kind == "write_register")
+    assert (write.caller, write.bytes_sent, write.bytes_received) == ("set_street_light", 11, 8)
+    failed = profile.transactions[-1]
+    assert failed.error == "NoResponseError: no answer"
+    assert failed.bytes_received == 0
+
+
+def test_profiling_is_opt_in(controller: RenogyRoverController):
+    with controller.profiling() as profile:
+        controller.battery_voltage()
+    controller.battery_voltage()
+
+    assert len(profile.transactions) == 1
+    assert "battery_voltage" not in vars(controller)
+    assert "profiling" not in controller.all_data_keys()
+
+
+def test_profiling_exports(controller: RenogyRoverController, tmp_path):
+    with controller.profiling() as profile:
+        controller.charging_state()
+
+    path = tmp_path / "trace.json"
+    profile.save_chrome_trace(str(path))
+    events = json.loads(path.read_text())["traceEvents"]
+    assert [(event["cat"], event["ph"]) for event in events] == [("call", "X"), ("transaction", "X")]
+    assert events[1]["args"]["address"] == "0x120"
+
+    exported = json.loads(json.dumps(profile.to_json()))
+    assert exported["transactions"][0]["caller"] == "charging_state"
+    assert "processing_time" in exported["calls"][0]
+
+    table = profile.format_summary()
+    assert "charging_state" in table
+    assert "1 transaction(s), 15 bytes" in table
@@ -0,0 +1,196 @@
+import json
+import re
+
+import pytest
+
+from pyrover.poller import Poller, Snapshot
+from pyrover.publisher import LocalBroker, Publisher, topic_matches
+from pyrover.types import ChargingState
+
+
+def _snapshot(timestamp, **values):
+    defaults = {"battery_voltage": 12.6, "charging_power": 100, "charging_state": ChargingState.MPPT}
+    defaults.update(values)
+    return Snapshot(timestamp=timestamp, values=defaults, registers={})
+
+
+def _payloads(broker, topic):
+    return [json.loads(message.payload) for message in broker.messages if message.topic == topic]
+
+
+@pytest.mark.parametrize(
+    "pattern,topic,expected",
+    [
+        ("pyrover/+/state", "pyrover/rover1/state", True),
+        ("pyrover/#", "pyrover/rover1/backlog", True),
+        ("pyrover/+", "pyrover/rover1/state", False),
+        ("pyrover/rover1/state", "pyrover/rover2/state", False),
+    ],
+)
+def test_topic_matches(pattern, topic, expected):
+    assert topic_matches(pattern, topic) == expected
+
+
+def test_publisher_sends_one_compact_message_per_cycle():
+    broker = LocalBroker()
+    received = []
+    broker.subscribe("pyrover/+/state", received.append)
+    publisher = Publisher(broker, device_id="rover1")
+    publisher.update(_snapshot(1.0))
+
+    assert len(received) == 1
+    assert json.loads(received[0].payload) == {
+        "ts": 1.0,
+        "v": {"battery_voltage": 12.6, "charging_power": 100, "charging_state": "MPPT"},
+    }
+    assert b" " not in received[0].payload
+
+
+def test_publisher_encodes_unknown_enum_values():
+    broker = LocalBroker()
+    publisher = Publisher(broker, device_id="rover1")
+    publisher.update(_snapshot(1.0, charging_state=ChargingState(7)))
+
+    assert _payloads(broker, publisher.state_topic)[0]["v"]["charging_state"] == 7
+
+
+def test_publisher_delta_mode_with_keyframes():
+    broker = LocalBroker()
+    publisher = Publisher(broker, device_id="rover1", delta=True, keyframe_interval=3)
+    publisher.update(_snapshot(1.0))
+    publisher.update(_snapshot(2.0, charging_power=120))
+    publisher.update(_snapshot(3.0, charging_power=120))
+    publisher.update(_snapshot(4.0, charging_power=120))
+
+    assert [payload["v"] for payload in _payloads(broker, publisher.state_topic)] == [
+        {"battery_voltage": 12.6, "charging_power": 100, "charging_state": "MPPT"},
+        {"charging_power": 120},
+        {},
+        {"battery_voltage": 12.6, "charging_power": 120, "charging_state": "MPPT"},
+    ]
+
+
+def test_publisher_buffers_while_offline_and_drains_in_batches():
+    broker = LocalBroker()
+    publisher = Publisher(broker, device_id="rover1", batch_size=2, retry_interval=0)
+    broker.online = False
+    for t in range(5):
+        publisher.update(_snapshot(float(t), charging_power=t))
+    assert publisher.buffered == 5
+    assert broker.messages == []
+
+    broker.online = True
+    assert publisher.flush() == 5
+
+    backlog = _payloads(broker, publisher.backlog_topic)
+    assert [[cycle["ts"] for cycle in batch] for batch in backlog] == [[0.0, 1.0], [2.0, 3.0]]
+    assert [payload["ts"] for payload in _payloads(broker, publisher.state_topic)] == [4.0]
+    assert publisher.buffered == 0
+    assert publisher.published == 5
+
+
+def test_publisher_buffer_is_bounded():
+    broker = LocalBroker()
+    broker.online = False
+    publisher = Publisher(broker, device_id="rover1", max_buffer=3, delta=True, retry_interval=0)
+    for t in range(5):
+        publisher.update(_snapshot(float(t), charging_power=t))
+
+    assert publisher.buffered == 3
+    assert publisher.dropped == 2
+    assert publisher.backpressure
+
+    broker.online = True
+    publisher.flush()
+    # The oldest remaining delta carries the values of the dropped keyframe
+    first = _payloads(broker, publisher.backlog_topic)[0][0]
+    assert first == {"ts": 2.0, "k": 1, "v": {"battery_voltage": 12.6, "charging_power": 2, "charging_state": "MPPT"}}
+
+
+def test_publisher_reject_overflow():
+    broker = LocalBroker()
+    broker.online = False
+    publisher = Publisher(broker, device_id="rover1", max_buffer=1, overflow="reject", retry_interval=0)
+
+    assert publisher.update(_snapshot(1.0))
+    assert not publisher.update(_snapshot(2.0))
+    assert publisher.rejected == 1
+
+
+def test_publisher_waits_before_retrying():
+    broker = LocalBroker()
+    broker.online = False
+    publisher = Publisher(broker, device_id="rover1", retry_interval=60)
+    publisher.update(_snapshot(1.0))
+    broker.online = True
+
+    assert publisher.flush() == 0
+    assert publisher.flush(force=True) == 1
+
+
+def test_publisher_home_assistant_discovery():
+    broker = LocalBroker()
+    publisher = Publisher(broker, device_id="rover1", fields=["battery_percentage", "charging_power", "charging_state"])
+    publisher.publish_discovery(model="RNG-CTRL-RVR40")
+
+    configs = {topic: json.loads(payload) for topic, payload in broker.retained.items()}
+    assert sorted(configs) == [
+        "homeassistant/sensor/pyrover_rover1/battery_percentage/config",
+        "homeassistant/sensor/pyrover_rover1/charging_power/config",
+        "homeassistant/sensor/pyrover_rover1/charging_state/config",
+    ]
+    power = configs["homeassistant/sensor/pyrover_rover1/charging_power/config"]
+    assert power["state_topic"] == "pyrover/rover1/state"
+    assert power["value_template"] == "{{ value_json.v.charging_power }}"
+    assert power["unit_of_measurement"] == "W"
+    assert power["device_class"] == "power"
+    assert power["state_class"] == "measurement"
+    assert power["device"]["model"] == "RNG-CTRL-RVR40"
+    assert configs["homeassistant/sensor/pyrover_rover1/battery_percentage/config"]["device_class"] == "battery"
+    assert "device_class" not in configs["homeassistant/sensor/pyrover_rover1/charging_state/config"]
+
+
+def _render(template, payload, state):
+    # The subset of Home Assistant's templates used by the discovery configs
+    match = re.fullmatch(r"\{\{ value_json\.v\.(\w+)(?: \| default\(this\.state\))? \}\}", template)
+    assert match is not None, template
+    value = payload["v"].get(match.group(1), _UNDEFINED)
+    if value is _UNDEFINED:
+        assert "default(this.state)" in template, f"{match.group(1)} is undefined"
+        return state
+    return value
+
+
+_UNDEFINED = object()
+
+
+def test_publisher_discovery_templates_read_delta_messages():
+    broker = LocalBroker()
+    publisher = Publisher(broker, device_id="rover1", fields=["battery_voltage", "charging_power"], delta=True)
+    publisher.publish_discovery()
+    templates = {
+        json.loads(payload)["unique_id"]: json.loads(payload)["value_template"] for payload in broker.retained.values()
+    }
+    publisher.update(_snapshot(1.0))
+    publisher.update(_snapshot(2.0, charging_power=120))
+
+    states = {}
+    for payload in _payloads(broker, publisher.state_topic):
+        states = {sensor: _render(template, payload, states.get(sensor)) for sensor, template in templates.items()}
+
+    assert states == {"pyrover_rover1_battery_voltage": 12.6, "pyrover_rover1_charging_power": 120}
+
+
+def test_publisher_on_poller(controller):
+    broker = LocalBroker()
+    poller = Poller(controller)
+    poller.subscribe(Publisher(broker, device_id="rover1").update)
+    poller.poll()
+
+    (payload,) = _payloads(broker, "pyrover/rover1/state")
+    assert payload["v"]["charging_state"] == "MPPT"
+    assert payload["v"]["controller_fault_information"] == [
+        "BATTERY_OVER_DISCHARGE",
+        "PHOTOVOLTAIC_INPUT_SHORT_CIRCUIT",
+    ]
+    assert len(payload["v"]) == 79
@@ -0,0 +1,158 @@
+import calendar
+import sqlite3
+from typing import List
+
+import pytest
+
+from pyrover.poller import Snapshot
+from pyrover.query import HistoryQuery
+from pyrover.sqlite_sink import DAY, HOUR, SqliteSink
+from pyrover.types import ChargingState
+
+# 2024-06-01 00:00:00 UTC
+T0 = calendar.timegm((2024, 6, 1, 0, 0, 0))
+DAYS = 3
+
+
+def _power(t: int) -> int:
+    # Daytime between 6:00 and 18:00, peaking at noon
+    seconds = t % 86400
+    return max(0, 600 - abs(seconds - 43200) // 36) if 21600 <= seconds < 64800 else 0
+
+
+def _state(t: int) -> ChargingState:
+    return ChargingState.MPPT if _power(t) else ChargingState.DEACTIVATED
+
+
+@pytest.fixture(scope="module")
+def path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("query") / "history.db")
+    sink = SqliteSink(path, fields=["charging_power", "battery_voltage"], grace=0)
+    for t in range(0, DAYS * 86400, 10):
+        day = t // 86400
+        values = {"charging_power": _power(t) + day, "battery_voltage": 12.0 + day / 10, "charging_state": _state(t)}
+        sink.record("rover", Snapshot(timestamp=T0 + t, values=values, registers={}))
+        if t % 3600 == 0:
+            sink.flush()
+    sink.close()
+    return path
+
+
+@pytest.fixture
+def history(path):
+    history = HistoryQuery(path)
+    yield history
+    history.close()
+
+
+def _brute_force(t_start: int, t_end: int) -> List[int]:
+    return [_power(t) + t // 86400 for t in range(0, DAYS * 86400, 10) if t_start <= t < t_end]
+
+
+def test_plan_uses_the_coarsest_rollups(history: HistoryQuery):
+    start, end = T0 + 90.5, T0 + 2 * 86400 + 3 * 3600 + 150
+    plan = history.plan(start, end)
+    assert [level for level, _, _ in plan] == ["samples", "minute", "hour", "day", "hour", "minute", "samples"]
+    assert plan[3] == ("day", T0 + 86400, T0 + 2 * 86400)
+    assert (plan[0][1], plan[-1][2]) == (start, end)
+
+
+@pytest.mark.parametrize(
+    "start, end",
+    [
+        (0, DAYS * 86400),
+        (95, 86400 + 3700),
+        (43195, 43205),
+        (3600, 7200),
+    ],
+)
+def test_aggregate_matches_samples(history: HistoryQuery, start, end):
+    expected = _brute_force(start, end)
+    aggregate = history.aggregate("rover", "charging_power", T0 + start, T0 + end)
+
+    assert aggregate.samples == len(expected)
+    assert aggregate.min == min(expected)
+    assert aggregate.max == max(expected)
+    assert aggregate.sum == sum(expected)
+    assert aggregate.mean == pytest.approx(sum(expected) / len(expected))
+    assert aggregate.integral == pytest.approx(sum(expected) * 10, rel=0.01)
+    assert aggregate.value("max") == max(expected)
+    with pytest.raises(ValueError):
+        aggregate.value("median")
+
+
+def test_daily_peak(history: HistoryQuery):
+    series = history.series("rover", "charging_power", T0 + 3600, T0 + DAYS * 86400, DAY, "max")
+    assert series == [(T0 + day * 86400, 600 + day) for day in range(DAYS)]
+
+    hourly = history.series("rover", "battery_voltage", T0 + 86400 - 1800, T0 + 86400 + 7200, HOUR, "mean")
+    assert hourly == [
+        (T0 + 82800, pytest.approx(12.0)),
+        (T0 + 86400, pytest.approx(12.1)),
+        (T0 + 90000, pytest.approx(12.1)),
+    ]
+
+
+def test_time_in_state(history: HistoryQuery):
+    hours = {state: seconds / 3600 for state, seconds in history.time_in_state("rover", T0, T0 + 86400).items()}
+    charging = sum(10 for t in range(0, 86400, 10) if _power(t)) / 3600
+    assert hours == {
+        ChargingState.DEACTIVATED: pytest.approx(24 - charging),
+        ChargingState.MPPT: pytest.approx(charging),
+    }
+
+    by_state = history.aggregate_by_state("rover", "charging_power", T0 + 3 * 3600, T0 + 9 * 3600)
+    assert by_state[ChargingState.DEACTIVATED].max == 0
+    assert (by_state[ChargingState.MPPT].min or 0) > 0
+
+
+def test_samples(history: HistoryQuery):
+    assert history.samples("rover", "charging_power", T0 + 43195, T0 + 43215) == [
+        (T0 + 43200.0, 600),
+        (T0 + 43210.0, 600),
+    ]
+
+
+def test_queries_only_read_the_window(path):
+    history = HistoryQuery(path)
+    statements: List[str] = []
+    history._connection.set_trace_callback(statements.append)
+
+    history.aggregate("rover", "charging_power", T0 + 86400 + 30, T0 + 86400 + 7200)
+    tables = {word for statement in statements for word in statement.replace(",", " ").split() if "_2024" in word}
+    assert tables == {"samples_20240602", "minute_20240602", "hour_202406"}
+    history.close()
+
+
+def test_missing_values_are_not_averaged(tmp_path):
+    path = str(tmp_path / "gaps.db")
+    sink = SqliteSink(path, fields=["battery_voltage", "battery_temperature"], grace=0)
+    for t in range(0, 7200, 10):
+        # The temperature probe only answers every other sample
+        values = {"battery_voltage": 12.5, "battery_temperature": 20 if t % 20 else None}
+        sink.record("rover", Snapshot(timestamp=T0 + t, values=values, registers={}))
+    sink.record("rover", Snapshot(timestamp=T0 + 7200, values={"battery_voltage": 12.5}, registers={}))
+    sink.close()
+    history = HistoryQuery(path)
+
+    assert [level for level, _, _ in history.plan(T0, T0 + 7200)] == ["hour"]
+    aggregate = history.aggregate("rover", "battery_temperature", T0, T0 + 7200)
+    assert (aggregate.samples, aggregate.mean) == (360, 20)
+    assert aggregate.integral == pytest.approx(20 * 7200)
+    assert history.series("rover", "battery_temperature", T0, T0 + 7200, HOUR) == [(T0, 20), (T0 + 3600, 20)]
+    assert history.aggregate("rover", "battery_voltage", T0, T0 + 7200).samples == 720
+    history.close()
+
+
+def test_unknown_device_and_field(history: HistoryQuery):
+    with pytest.raises(KeyError):
+        history.aggregate("wanderer", "charging_power", T0, T0 + 60)
+    with pytest.raises(ValueError):
+        history.aggregate("rover", "charging_power; DROP TABLE devices", T0, T0 + 60)
+    assert history.devices() == ["rover"]
+    assert history.fields() == ["battery_voltage", "charging_power", "charging_state"]
+
+
+def test_read_only(history: HistoryQuery):
+    with pytest.raises(sqlite3.OperationalError):
+        history._connection.execute("DELETE FROM devices")
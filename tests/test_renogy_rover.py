@@ -1,7 +1,11 @@
+from typing import List
+import threading
+import time
 from unittest import mock
 
 import pytest
 
+from pyrover.registers import BLOCKS, FIELD_REGISTERS
 from pyrover.renogy_rover import RenogyRoverController
 from pyrover.types import (
     BatteryType,
@@ -13,19 +17,6 @@ from pyrover.types import (
     Toggle,
     ProductType,
 )
-from tests.fakes.fake_modbus import create_fake_modbus
-
-
-@pytest.fixture
-def fake_modbus():
-    return create_fake_modbus()
-
-
-@pytest.fixture()
-def controller(fake_modbus):
-    with mock.patch("pyrover.renogy_rover._create_controller") as mock_create_controller:
-        mock_create_controller.return_value = fake_modbus
-        yield RenogyRoverController(port="/dev/ttyUSB0", address=123)
 
 
 def test_controller_init_fails_if_controller_serial_is_none(fake_modbus):
@@ -281,3 +272,157 @@ def test_controller_individual_fault_codes_and_messages(
     fault = faults[0]
     assert fault == expected
     assert str(fault) == expected_str
+
+
+def test_controller_prefetch_serves_getters_from_block_reads(controller, fake_modbus):
+    expected = controller.all_data()
+    fake_modbus.reset_mock()
+
+    with controller.prefetch(*BLOCKS):
+        assert controller.all_data() == expected
+
+    assert fake_modbus.read_registers.call_count == len(BLOCKS)
+    fake_modbus.read_register.assert_not_called()
+    fake_modbus.read_string.assert_not_called()
+
+
+def test_controller_all_data_reads_each_register_once(controller, fake_modbus):
+    data = controller.all_data()
+
+    assert fake_modbus.read_registers.call_count == len(BLOCKS)
+    fake_modbus.read_register.assert_not_called()
+    fake_modbus.read_string.assert_not_called()
+    assert data["charging_state"] == ChargingState.MPPT
+    assert data["street_light_brightness"] == 62
+    assert data["total_battery_charge_amphours"] == 5439745
+
+
+def _tear_block_reads(fake_modbus, address: int, words: List[int]) -> None:
+    # Block reads return `words` at `address`, as if read while the controller updated them
+    read_registers = fake_modbus.read_registers.side_effect
+
+    def torn_read(addr: int, number_of_registers: int = 1, **kwargs) -> List[int]:
+        values = read_registers(addr, number_of_registers=number_of_registers, **kwargs)
+        if number_of_registers > 2 and addr <= address < addr + number_of_registers:
+            values = list(values)
+            values[address - addr : address - addr + 2] = words
+        return values
+
+    fake_modbus.read_registers.side_effect = torn_read
+
+
+def test_controller_rereads_torn_counters(controller, fake_modbus):
+    read_registers = fake_modbus.read_registers.side_effect
+    fake_modbus.set_value(0x0118, [0x0053, 0xFFFF])
+    controller.all_data()
+    # The low word rolled over but the block read caught the old high word
+    fake_modbus.set_value(0x0118, [0x0054, 0x0000])
+    _tear_block_reads(fake_modbus, 0x0118, [0x0053, 0x0000])
+    fake_modbus.reset_mock()
+
+    with controller.prefetch(*BLOCKS) as registers:
+        assert controller.total_battery_charge_amphours() == 0x00540000
+    assert registers[0x0118] == 0x0054
+    assert controller.torn_reads == 1
+    assert fake_modbus.read_registers.call_count == len(BLOCKS) + 1
+    assert mock.call(0x0118, number_of_registers=2) in fake_modbus.read_registers.call_args_list
+
+    # The old low word with the new high word, jumping ahead by a whole high word
+    fake_modbus.read_registers.side_effect = read_registers
+    fake_modbus.set_value(0x0118, [0x0054, 0xFFFF])
+    controller.all_data()
+    fake_modbus.set_value(0x0118, [0x0055, 0x0001])
+    _tear_block_reads(fake_modbus, 0x0118, [0x0055, 0xFFFF])
+    assert controller.all_data()["total_battery_charge_amphours"] == 0x00550001
+    assert controller.torn_reads == 2
+
+
+def test_controller_keeps_consistent_double_words(controller, fake_modbus):
+    controller.all_data()
+    fake_modbus.set_value(0x0118, [0x0053, 0x0102])
+    fake_modbus.reset_mock()
+
+    assert controller.all_data()["total_battery_charge_amphours"] == 0x00530102
+    assert fake_modbus.read_registers.call_count == len(BLOCKS)
+    assert controller.torn_reads == 0
+
+
+def test_controller_accepts_confirmed_counter_reset(controller, fake_modbus):
+    controller.all_data()
+    fake_modbus.set_value(0x011C, [0x0000, 0x0010])
+    fake_modbus.set_value(0x0018, [0x4321, 0x8765])
+    fake_modbus.reset_mock()
+
+    data = controller.all_data()
+
+    assert data["cumulative_power_generation"] == 0.016
+    assert data["serial_number"] == 0x43218765
+    # One read of each pair confirms the new value
+    assert fake_modbus.read_registers.call_count == len(BLOCKS) + 2
+    assert controller.all_data()["cumulative_power_generation"] == 0.016
+    assert controller.torn_reads == 2
+
+
+def test_controller_field_registers_cover_all_data_keys(controller):
+    assert sorted(FIELD_REGISTERS) == sorted(controller.all_data_keys())
+    assert all(any(block.contains(span) for block in BLOCKS) for span in FIELD_REGISTERS.values())
+
+
+def test_controllers_on_the_same_port_share_a_lock(fake_modbus):
+    with mock.patch("pyrover.renogy_rover._create_controller", return_value=fake_modbus):
+        first = RenogyRoverController(port="/dev/ttyUSB7", address=1)
+        second = RenogyRoverController(port="/dev/ttyUSB7", address=2)
+        other = RenogyRoverController(port="/dev/ttyUSB8", address=1)
+    assert first.lock is second.lock
+    assert first.lock is not other.lock
+
+
+def test_controller_transactions_do_not_interleave(fake_modbus):
+    active = []
+    overlaps = []
+    read_register = fake_modbus.read_register.side_effect
+
+    def slow_read_register(*args, **kwargs):
+        active.append(threading.get_ident())
+        if len(active) > 1:
+            overlaps.append(list(active))
+        time.sleep(0.001)
+        active.remove(threading.get_ident())
+        return read_register(*args, **kwargs)
+
+    fake_modbus.read_register.side_effect = slow_read_register
+    with mock.patch("pyrover.renogy_rover._create_controller", return_value=fake_modbus):
+        controllers = [RenogyRoverController(port="/dev/ttyUSB9", address=address) for address in (1, 2)]
+    threads = [
+        threading.Thread(target=lambda c=c: [c.battery_percentage() for _ in range(20)]) for c in controllers * 2
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert overlaps == []
+
+
+def test_controller_prefetch_is_per_thread(controller: RenogyRoverController, fake_modbus):
+    expected = controller.battery_percentage()
+    values = []
+    with controller.prefetch(registers={0x0100: 42}):
+        thread = threading.Thread(target=lambda: values.append(controller.battery_percentage()))
+        thread.start()
+        thread.join()
+        values.append(controller.battery_percentage())
+    assert values == [expected, 42]
+
+
+def test_controller_cached_data(controller: RenogyRoverController, fake_modbus):
+    assert controller.cached_at is None
+    data = controller.cached_data()
+    assert controller.cached_at is not None
+    fake_modbus.reset_mock()
+
+    assert controller.cached_data() == data
+    fake_modbus.read_registers.assert_not_called()
+
+    with mock.patch("pyrover.renogy_rover.time.time", return_value=controller.cached_at + 10):
+        controller.cached_data(max_age=5)
+    fake_modbus.read_registers.assert_called()
@@ -0,0 +1,102 @@
+from typing import Any, Dict
+from unittest import mock
+
+import pytest
+
+from pyrover.registers import SETTINGS_BLOCK
+from pyrover.rollout import Device, SettingChange, apply_settings, diff_settings, rollout, validate_profile
+from pyrover.types import BatteryType, Toggle
+from tests.fakes.fake_modbus import create_fake_modbus
+
+
+def test_diff_settings_reads_settings_block_once(controller, fake_modbus):
+    profile = {"battery_type": BatteryType.LITHIUM, "floating_voltage": 14.4, "end_of_discharge_soc": 30}
+    changes = diff_settings(controller, profile)
+
+    assert changes == [
+        SettingChange("battery_type", BatteryType.SEALED, BatteryType.LITHIUM),
+        SettingChange("end_of_discharge_soc", 50, 30),
+    ]
+    fake_modbus.read_registers.assert_called_once_with(
+        SETTINGS_BLOCK.address, number_of_registers=SETTINGS_BLOCK.number_of_registers
+    )
+    fake_modbus.read_register.assert_not_called()
+
+
+def test_apply_settings_writes_only_changed_registers(controller, fake_modbus):
+    profile = {
+        "battery_type": BatteryType.LITHIUM,
+        "end_of_discharge_soc": 30,
+        "end_of_charge_soc": 100,
+        "special_power_control_state": Toggle.ON,
+        "led_load_current_setting": 6.6,
+    }
+    changes = apply_settings(controller, profile)
+
+    assert [change.name for change in changes] == [
+        "battery_type",
+        "end_of_discharge_soc",
+        "special_power_control_state",
+    ]
+    assert fake_modbus.write_register.call_args_list == [
+        mock.call(0xE004, 0x0004),
+        mock.call(0xE00F, 0x641E),
+        mock.call(0xE021, 0x0205),
+    ]
+    assert diff_settings(controller, profile) == []
+
+
+def test_apply_settings_dry_run_does_not_write(controller, fake_modbus):
+    changes = apply_settings(controller, {"boost_charging_voltage": 14.6}, dry_run=True)
+
+    assert changes == [SettingChange("boost_charging_voltage", 14.4, 14.6)]
+    fake_modbus.write_register.assert_not_called()
+
+
+def test_apply_settings_fails_if_write_does_not_take_effect(controller, fake_modbus):
+    fake_modbus.write_register.side_effect = None
+
+    with pytest.raises(IOError, match="boost_charging_voltage"):
+        apply_settings(controller, {"boost_charging_voltage": 14.6})
+
+
+@pytest.mark.parametrize(
+    "profile,message",
+    [
+        ({"not_a_setting": 1}, "unknown setting"),
+        ({"nominal_battery_capacity": 100}, "read-only"),
+        ({"end_of_charge_soc": 300}, "out of range"),
+    ],
+)
+def test_validate_profile(profile, message):
+    with pytest.raises(ValueError, match=message):
+        validate_profile(profile)
+
+
+def test_rollout_reports_each_device_in_order():
+    devices = [Device("/dev/ttyUSB0", 1), Device("/dev/ttyUSB1", 1), Device("/dev/ttyUSB0", 2)]
+    fakes: Dict[Device, Any] = {device: create_fake_modbus() for device in devices}
+    fakes[devices[1]].read_registers.side_effect = IOError("No communication with the instrument")
+
+    with mock.patch("pyrover.renogy_rover._create_controller") as mock_create_controller:
+        mock_create_controller.side_effect = lambda port, address: fakes[Device(port, address)]
+        report = rollout(devices, {"battery_type": BatteryType.GEL}, max_concurrency=2)
+
+    assert [result.device for result in report.results] == devices
+    assert [result.ok for result in report.results] == [True, False, True]
+    assert [result.applied for result in report.results] == [True, False, True]
+    assert report.failed[0].error == "No communication with the instrument"
+    assert "2 succeeded, 1 failed" in report.summary()
+    fakes[devices[0]].write_register.assert_called_once_with(0xE004, 0x0003)
+
+
+def test_rollout_dry_run_reports_pending_changes():
+    with mock.patch("pyrover.renogy_rover._create_controller") as mock_create_controller:
+        fake: Any = create_fake_modbus()
+        mock_create_controller.return_value = fake
+        report = rollout([Device("/dev/ttyUSB0", 1)], {"floating_voltage": 13.8}, dry_run=True)
+
+    assert report.results[0].changes == [SettingChange("floating_voltage", 14.4, 13.8)]
+    assert not report.results[0].applied
+    assert "1 pending change(s)" in report.summary()
+    fake.write_register.assert_not_called()
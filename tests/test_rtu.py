@@ -0,0 +1,162 @@
+import struct
+from array import array
+from typing import Any, Dict, List
+from unittest import mock
+
+import minimalmodbus
+import pytest
+
+from pyrover import rtu
+from pyrover.registers import DYNAMIC_DATA_BLOCK
+from pyrover.renogy_rover import RenogyRoverController
+from pyrover.rtu import RtuInstrument, crc16, silence_time
+
+
+class FakeSerial:
+    """
+    Serial line with a slave answering from a register map
+    """
+
+    def __init__(self, registers: Dict[int, int], address: int = 1):
+        self.registers = registers
+        self.address = address
+        self.baudrate = 9600
+        self.timeout = 0.05
+        self.requests: List[bytes] = []
+        self.reads: List[int] = []
+        self.pending = b""
+        self.exception = 0
+        self.flushed = 0
+
+    def write(self, request: bytes) -> None:
+        self.requests.append(request)
+        assert struct.unpack_from("<H", request, len(request) - 2)[0] == crc16(request[:-2])
+        address, function = request[0], request[1]
+        if address != self.address:
+            return
+        if self.exception:
+            pdu = bytes([address, function | 0x80, self.exception])
+        elif function == 3:
+            start, count = struct.unpack_from(">HH", request, 2)
+            values = [self.registers.get(a, 0) for a in range(start, start + count)]
+            pdu = struct.pack(f">BBB{count}H", address, function, 2 * count, *values)
+        else:
+            start, _, _, value = struct.unpack_from(">HHBH", request, 2)
+            self.registers[start] = value
+            pdu = request[:6]
+        self.pending += pdu + struct.pack("<H", crc16(pdu))
+
+    def read(self, size: int) -> bytes:
+        self.reads.append(size)
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+    def reset_input_buffer(self) -> None:
+        self.flushed += 1
+        self.pending = b""
+
+
+@pytest.fixture
+def line():
+    rtu._last_frame.clear()
+    return FakeSerial({0x000C: 0x2020, 0x000D: 0x524E, 0x0100: 98, 0x0101: 124, 0x0103: 0x8514})
+
+
+@pytest.fixture
+def instrument(line):
+    return RtuInstrument("/dev/ttyFAKE", 1, connection=line)
+
+
+def test_crc16():
+    # Examples of the Renogy protocol documentation
+    assert struct.pack("<H", crc16(bytes.fromhex("0103000A0001"))) == bytes.fromhex("A408")
+    assert struct.pack("<H", crc16(bytes.fromhex("010302181E"))) == bytes.fromhex("324C")
+    frame = bytes(range(256))
+    assert struct.pack("<H", crc16(frame)).decode("latin1") == minimalmodbus._calculate_crc_string(
+        frame.decode("latin1")
+    )
+
+
+def test_silence_time():
+    assert silence_time(9600) == pytest.approx(3.5 * 11 / 9600)
+    assert silence_time(19200) == pytest.approx(3.5 * 11 / 19200)
+    assert silence_time(115200) == 0.00175
+
+
+def test_read_registers(instrument: RtuInstrument, line: FakeSerial):
+    assert instrument.read_register(0x0100) == 98
+    assert instrument.read_registers(0x0100, 2) == [98, 124]
+    assert instrument.read_string(0x000C, 2) == "  RN"
+    assert line.requests[0] == bytes.fromhex("010301000001") + struct.pack("<H", crc16(bytes.fromhex("010301000001")))
+    # Reads up to the expected length, never waiting for the timeout
+    assert line.reads == [3, 4, 3, 6, 3, 6]
+
+
+def test_read_registers_into(instrument: RtuInstrument):
+    buffer = array("H", bytes(8))
+    instrument.read_registers_into(0x0100, buffer, 1, 2)
+    assert list(buffer) == [0, 98, 124, 0]
+
+
+def test_requests_are_reused(instrument: RtuInstrument, line: FakeSerial):
+    instrument.read_registers(0x0100, 2)
+    instrument.read_registers(0x0100, 2)
+    assert line.requests[0] is line.requests[1]
+
+
+def test_write_register(instrument: RtuInstrument, line: FakeSerial):
+    instrument.write_register(0xE002, 200)
+    assert line.registers[0xE002] == 200
+    assert line.requests[0][:9] == bytes.fromhex("0110E00200010200C8")
+
+
+def test_exceptions(instrument: RtuInstrument, line: FakeSerial):
+    line.exception = 2
+    with pytest.raises(minimalmodbus.IllegalRequestError):
+        instrument.read_registers(0xF000, 10)
+    # Exception responses are 5 bytes long
+    assert line.reads == [3, 2]
+
+    line.exception = 0
+    line.address = 2
+    with pytest.raises(minimalmodbus.NoResponseError):
+        instrument.read_register(0x0100)
+
+
+def test_invalid_response(instrument: RtuInstrument, line: FakeSerial):
+    write = line.write
+
+    def corrupt(request: bytes) -> None:
+        write(request)
+        line.pending = line.pending[:-1] + bytes([line.pending[-1] ^ 0xFF])
+
+    line.write = corrupt
+    with pytest.raises(minimalmodbus.InvalidResponseError):
+        instrument.read_register(0x0100)
+    assert line.flushed == 1
+
+
+def test_silence_between_frames(instrument: RtuInstrument):
+    clock: Any = mock.Mock()
+    clock.monotonic.side_effect = [10.0, 10.0, 10.001, 10.001, 20.0, 20.0]
+    with mock.patch.object(rtu, "time", clock):
+        instrument.read_register(0x0100)
+        instrument.read_register(0x0100)
+        instrument.read_register(0x0100)
+    # Only what is left of the silence is waited, nothing once it has elapsed
+    clock.sleep.assert_called_once_with(pytest.approx(silence_time(9600) - 0.001))
+
+
+def test_controller_transport(line: FakeSerial):
+    with mock.patch("pyrover.rtu._open", return_value=line):
+        controller = RenogyRoverController(port="/dev/ttyFAKE", address=1, baudrate=19200, transport="rtu")
+    assert isinstance(controller.device, RtuInstrument)
+    assert line.baudrate == 19200
+    assert controller.battery_percentage() == 98
+    assert controller.controller_temperature() == -5
+    buffer = array("H", bytes(2 * DYNAMIC_DATA_BLOCK.number_of_registers))
+    controller.read_into(DYNAMIC_DATA_BLOCK, buffer)
+    assert buffer[1] == 124
+
+    with pytest.raises(ValueError):
+        RenogyRoverController(port="/dev/ttyFAKE", transport="modbus-tcp")
@@ -0,0 +1,132 @@
+from unittest import mock
+
+import pytest
+
+from pyrover.registers import SETTINGS_BLOCK, SYSTEM_INFO_BLOCK, RegisterSpan
+from pyrover.scheduler import DEFAULT_GROUPS, PollGroup, PollScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(fake_modbus):
+    clock = FakeClock()
+    read_registers = fake_modbus.read_registers.side_effect
+
+    def slow_read_registers(*args, **kwargs):
+        clock.now += 0.02  # bus time of one transaction
+        return read_registers(*args, **kwargs)
+
+    fake_modbus.read_registers.side_effect = slow_read_registers
+    return clock
+
+
+def _run(scheduler, clock, until):
+    while clock.now < until:
+        clock.now += scheduler.step()
+
+
+def test_poll_group_chunks_do_not_split_fields():
+    group = PollGroup("system_info", SYSTEM_INFO_BLOCK, interval=60, chunk_size=4)
+    chunks = group.chunks()
+
+    assert chunks[0] == RegisterSpan(0x000A, 2)  # 0x000C-0x0013 is the product model
+    assert chunks[1] == RegisterSpan(0x000C, 8)
+    assert sum(chunk.number_of_registers for chunk in chunks) == SYSTEM_INFO_BLOCK.number_of_registers
+    assert all(chunk.number_of_registers <= 4 for chunk in chunks[2:])
+
+
+def test_poll_group_fields():
+    assert PollGroup("solar", RegisterSpan(0x0107, 3), interval=0.1).fields == [
+        "solar_voltage",
+        "solar_current",
+        "charging_power",
+    ]
+    covered = {name for group in DEFAULT_GROUPS for name in group.fields}
+    assert len(covered) == 79
+
+
+def test_scheduler_fast_group_waits_for_at_most_one_slow_chunk(controller, fake_modbus, clock):
+    groups = [
+        PollGroup("solar", RegisterSpan(0x0107, 3), interval=0.1),
+        PollGroup("settings", SETTINGS_BLOCK, interval=1.0, chunk_size=8),
+    ]
+    scheduler = PollScheduler(controller, groups, clock=clock)
+    _run(scheduler, clock, until=2.0)
+
+    addresses = [c.args[0] for c in fake_modbus.read_registers.call_args_list]
+    assert addresses.count(0x0107) == 20
+    assert sum(address >= 0xE000 for address in addresses) == 8
+
+    solar, settings = scheduler.stats()
+    assert solar.samples == 20
+    assert solar.achieved_rate == pytest.approx(10, rel=0.01)
+    assert solar.jitter_max is not None and solar.jitter_max <= 0.02 + 1e-9
+    assert settings.samples == 2
+    assert settings.errors == 0
+
+
+def test_scheduler_publishes_merged_snapshots(controller, clock):
+    groups = [
+        PollGroup("solar", RegisterSpan(0x0107, 3), interval=0.1),
+        PollGroup("settings", SETTINGS_BLOCK, interval=1.0, chunk_size=8),
+    ]
+    scheduler = PollScheduler(controller, groups, clock=clock)
+    all_snapshots = mock.Mock()
+    settings_snapshots = mock.Mock()
+    scheduler.subscribe(all_snapshots)
+    scheduler.subscribe(settings_snapshots, group="settings")
+    _run(scheduler, clock, until=0.5)
+
+    settings_snapshots.assert_called_once()
+    assert all_snapshots.call_count == 6
+    latest = scheduler.latest
+    assert latest is not None
+    assert latest.values["solar_voltage"] == 12.5
+    assert latest.values["battery_type"] is not None
+    assert "battery_voltage" not in latest.values
+
+
+def test_scheduler_records_errors_and_keeps_going(controller, fake_modbus, clock):
+    read_registers = fake_modbus.read_registers.side_effect
+
+    def flaky_read_registers(address, *args, **kwargs):
+        if address >= 0xE000:
+            raise IOError("No communication with the instrument")
+        return read_registers(address, *args, **kwargs)
+
+    fake_modbus.read_registers.side_effect = flaky_read_registers
+    groups = [
+        PollGroup("solar", RegisterSpan(0x0107, 3), interval=0.1),
+        PollGroup("settings", SETTINGS_BLOCK, interval=0.5),
+    ]
+    scheduler = PollScheduler(controller, groups, clock=clock)
+    _run(scheduler, clock, until=0.95)
+
+    solar, settings = scheduler.stats()
+    assert solar.samples == 10
+    assert settings.samples == 0
+    assert settings.errors == 2
+
+
+def test_scheduler_survives_decoding_errors(controller, clock):
+    scheduler = PollScheduler(controller, [PollGroup("solar", RegisterSpan(0x0107, 3), interval=0.1)], clock=clock)
+    with mock.patch.object(controller, "solar_voltage", side_effect=ValueError("unexpected value")):
+        _run(scheduler, clock, until=0.25)
+    _run(scheduler, clock, until=0.55)
+
+    (solar,) = scheduler.stats()
+    assert solar.errors == 3
+    assert solar.samples == 3
+    assert scheduler.latest is not None and scheduler.latest.values["solar_voltage"] == 12.5
+
+
+def test_scheduler_rejects_duplicate_group_names(controller):
+    with pytest.raises(ValueError):
+        PollScheduler(controller, [DEFAULT_GROUPS[0], DEFAULT_GROUPS[0]])
@@ -0,0 +1,119 @@
+import json
+from typing import Any, Tuple
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from pyrover.poller import Snapshot
+from pyrover.serve import SnapshotCache, _parse_args, create_server
+from pyrover.types import ChargingState
+
+
+def _snapshot(timestamp, charging_power=305):
+    values = {"charging_power": charging_power, "charging_state": ChargingState.MPPT, "battery_voltage": 13.1}
+    return Snapshot(timestamp=timestamp, values=values, registers={})
+
+
+@pytest.fixture
+def cache():
+    cache = SnapshotCache(history=3)
+    cache.update(_snapshot(1.0))
+    return cache
+
+
+@pytest.fixture
+def url(cache):
+    server = create_server(cache, port=0)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _get(url, etag=None) -> Tuple[int, Any, Any]:
+    request = urllib.request.Request(url, headers={"If-None-Match": etag} if etag else {})
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, response.headers.get("ETag"), json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        body = e.read()
+        return e.code, e.headers.get("ETag"), json.loads(body) if body else None
+
+
+def test_serve_snapshot(url):
+    status, etag, body = _get(f"{url}/snapshot")
+    assert status == 200
+    assert etag
+    assert body == {
+        "seq": 1,
+        "ts": 1.0,
+        "values": {"charging_power": 305, "charging_state": "MPPT", "battery_voltage": 13.1},
+    }
+
+
+def test_serve_etag(url, cache):
+    _, etag, _ = _get(f"{url}/snapshot")
+    assert _get(f"{url}/snapshot", etag)[0] == 304
+
+    cache.update(_snapshot(2.0, charging_power=310))
+    status, new_etag, body = _get(f"{url}/snapshot", etag)
+    assert status == 200
+    assert new_etag != etag
+    assert body["values"]["charging_power"] == 310
+
+
+def test_serve_long_poll(url, cache):
+    _, etag, _ = _get(f"{url}/snapshot")
+    timer = threading.Timer(0.1, lambda: cache.update(_snapshot(2.0, charging_power=0)))
+    timer.start()
+    started = time.monotonic()
+    status, _, body = _get(f"{url}/fields/charging_power?wait=5", etag)
+
+    assert status == 200
+    assert body["value"] == 0
+    assert 0.05 < time.monotonic() - started < 4
+
+
+def test_serve_long_poll_timeout(url):
+    _, etag, _ = _get(f"{url}/snapshot")
+    assert _get(f"{url}/snapshot?wait=0.1", etag)[0] == 304
+
+
+def test_serve_field(url):
+    status, _, body = _get(f"{url}/fields/battery_voltage")
+    assert status == 200
+    assert body == {"seq": 1, "ts": 1.0, "name": "battery_voltage", "value": 13.1, "unit": "V"}
+
+    assert _get(f"{url}/fields/nope")[0] == 404
+
+
+def test_serve_history(url, cache):
+    for t in range(2, 6):
+        cache.update(_snapshot(float(t), charging_power=t))
+
+    _, _, history = _get(f"{url}/history")
+    assert [entry["seq"] for entry in history] == [3, 4, 5]
+
+    _, _, history = _get(f"{url}/history?field=charging_power&limit=2")
+    assert history == [{"seq": 4, "ts": 4.0, "value": 4}, {"seq": 5, "ts": 5.0, "value": 5}]
+
+    assert _get(f"{url}/history?limit=x")[0] == 400
+
+
+def test_serve_unknown_path(url):
+    assert _get(f"{url}/nope")[0] == 404
+
+
+def test_serve_snapshot_encoded_once_per_sample(cache):
+    assert cache.snapshot_body()[1] is cache.snapshot_body()[1]
+    cache.update(_snapshot(2.0))
+    assert cache.snapshot_body()[0] == 2
+
+
+def test_serve_arguments():
+    args = _parse_args(["/dev/ttyUSB0", "--address", "3", "--http-port", "9000"])
+    assert (args.port, args.address, args.http_port, args.interval) == ("/dev/ttyUSB0", 3, 9000, 1.0)
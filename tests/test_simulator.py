@@ -0,0 +1,76 @@
+from datetime import datetime
+
+import minimalmodbus
+import pytest
+
+from pyrover.registers import BLOCKS
+from pyrover.renogy_rover import RenogyRoverController
+from pyrover.simulator import SimulatedClock, SimulatedInstrument
+from pyrover.types import ChargingState, Toggle
+
+
+class ManualClock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _at(hour: int) -> float:
+    return datetime(2024, 6, 1, hour).timestamp()
+
+
+def test_simulated_controller_reads_like_a_rover():
+    rover = RenogyRoverController(port="sim0", address=7, transport="simulated")
+    device = rover.device
+    assert isinstance(device, SimulatedInstrument)
+    data = rover.all_data()
+
+    assert data["product_model"] == "RNG-CTRL-RVR20"
+    assert data["serial_number"] & 0xFFFF == 7
+    assert data["device_address"] == 7
+    assert data["nominal_battery_capacity"] == 200
+    assert 0 <= data["battery_percentage"] <= 100
+    assert device.reads == len(BLOCKS)
+
+
+def test_simulated_day_and_night():
+    clock = ManualClock(_at(12))
+    device = SimulatedInstrument("sim0", 1, clock=clock)
+    rover = RenogyRoverController(port="sim0", address=1, transport="simulated")
+    rover.device = device
+
+    noon = rover.all_data()
+    assert noon["charging_state"] == ChargingState.MPPT
+    assert noon["charging_power"] > 300
+    assert noon["street_light_status"] == Toggle.OFF
+
+    clock.now = _at(23)
+    night = rover.all_data()
+    assert night["charging_state"] == ChargingState.DEACTIVATED
+    assert night["charging_power"] == 0
+    assert night["load_power"] > 0
+    assert night["street_light_status"] == Toggle.ON
+    assert night["cumulative_power_generation"] > noon["cumulative_power_generation"]
+    assert night["power_generation_today"] > 0
+
+    clock.now = _at(23) + 2 * 3600
+    after_midnight = rover.all_data()
+    assert after_midnight["total_operating_days"] == night["total_operating_days"] + 1
+    assert after_midnight["power_generation_today"] == 0
+
+
+def test_simulated_device_rejects_unknown_registers():
+    device = SimulatedInstrument("sim0", 1)
+    with pytest.raises(minimalmodbus.IllegalRequestError):
+        device.read_registers(0xF000, 10)
+    with pytest.raises(minimalmodbus.IllegalRequestError):
+        device.write_register(0x2000, 1)
+    device.write_register(0xE004, 2)
+    assert device.read_register(0xE004) == 2
+
+
+def test_simulated_clock_speed():
+    clock = SimulatedClock(speed=1000.0, start=0.0)
+    assert 0.0 <= clock() < 1000.0
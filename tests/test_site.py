@@ -0,0 +1,145 @@
+import json
+from typing import Any, Dict, List
+
+import pytest
+
+from pyrover.fleet import AlignedSample, FleetSnapshot
+from pyrover.poller import Poller, Snapshot
+from pyrover.publisher import LocalBroker, Message, Publisher
+from pyrover.renogy_rover import RenogyRoverController
+from pyrover.rollout import Device
+from pyrover.serve import SnapshotCache
+from pyrover.site import SiteAggregator, SiteStatus
+from pyrover.types import Fault
+
+NOW = 1_700_000_000.0
+
+
+def _snapshot(timestamp: float = NOW, faults: Any = None, **values: Any) -> Snapshot:
+    values.setdefault("charging_power", 100)
+    values.setdefault("power_generation_today", 1.5)
+    values.setdefault("charging_amphours_today", 40)
+    values["controller_fault_information"] = faults or []
+    return Snapshot(timestamp=timestamp, values=values, registers={})
+
+
+def test_totals_are_published_once_per_cycle():
+    site = SiteAggregator(["a", "b", "c"])
+    published: List[Snapshot] = []
+    site.subscribe(published.append)
+
+    assert site.update("a", _snapshot(charging_power=300, faults=[Fault.LOAD_OVER_CURRENT])) is None
+    assert site.update("b", _snapshot(charging_power=200, power_generation_today=0.25)) is None
+    totals = site.update(
+        "c", _snapshot(NOW + 1, charging_power=150, faults=[Fault.BATTERY_OVER_VOLTAGE, Fault.LOAD_OVER_CURRENT])
+    )
+
+    assert totals is not None and totals.values == {
+        "charging_power": 650,
+        "power_generation_today": 3.25,
+        "charging_amphours_today": 120,
+        "controller_fault_information": [Fault.BATTERY_OVER_VOLTAGE, Fault.LOAD_OVER_CURRENT],
+        "reporting_devices": 3,
+        "stale_devices": 0,
+    }
+    assert totals.timestamp == NOW + 1
+    assert published[-1] == site.latest == totals
+    assert len(published) == 1
+
+    # A device that reports again closes a cycle the others missed
+    site.update("a", _snapshot(NOW + 2, charging_power=0))
+    site.update("b", _snapshot(NOW + 2, charging_power=210))
+    assert len(published) == 1
+    site.update("a", _snapshot(NOW + 3, charging_power=0))
+    assert len(published) == 2
+    assert published[-1].values["charging_power"] == 360
+    assert published[-1].timestamp == NOW + 2
+    # Cleared faults leave the site set once no device reports them
+    site.update("c", _snapshot(NOW + 3, charging_power=150))
+    assert site.snapshot(NOW + 3).values["controller_fault_information"] == []
+
+
+def test_stale_devices():
+    site = SiteAggregator(["a", "b", "c"], max_age=10.0, counter_max_age=100.0)
+    site.update("a", _snapshot(NOW, faults=[Fault.LOAD_SHORT_CIRCUIT]))
+    site.update("b", _snapshot(NOW))
+    assert site.status(NOW) == SiteStatus(reporting=["a", "b"], stale=[], missing=["c"])
+
+    # Stale for the instantaneous totals, not yet for the energy of the day
+    site.update("b", _snapshot(NOW + 20))
+    values = site.snapshot(NOW + 20).values
+    assert (values["charging_power"], values["power_generation_today"]) == (100, 3.0)
+    assert (values["reporting_devices"], values["stale_devices"]) == (1, 2)
+    assert values["controller_fault_information"] == []
+    assert site.status(NOW + 20) == SiteStatus(reporting=["b"], stale=["a"], missing=["c"])
+
+    values = site.snapshot(NOW + 200).values
+    assert (values["charging_power"], values["power_generation_today"], values["stale_devices"]) == (0, 0.0, 3)
+
+    # Back in once it reports again
+    site.update("a", _snapshot(NOW + 201))
+    assert site.snapshot(NOW + 201).values["charging_power"] == 100
+
+
+def test_partial_snapshots_keep_the_other_values():
+    devices = [Device("/dev/ttyUSB0", 1), Device("/dev/ttyUSB0", 2)]
+    site = SiteAggregator(devices, counter_max_age=None)
+    for device in devices:
+        site.update(device, _snapshot(NOW, power_generation_today=2.0, faults=[Fault.SOLAR_COUNTER_CURRENT]))
+
+    # The fleet sampler only reads the telemetry block
+    samples = {
+        device: AlignedSample(device, NOW + 31, 0.01, 0.0, {"charging_power": power}, {})
+        for device, power in zip(devices, (250, 260))
+    }
+    samples[devices[1]] = samples[devices[1]]._replace(values={}, error="no response")
+    totals = site.update_fleet(FleetSnapshot(trigger=NOW + 31, samples=samples, skew=0.0))
+
+    assert totals.values["charging_power"] == 250
+    assert totals.values["power_generation_today"] == 4.0
+    assert totals.values["controller_fault_information"] == [Fault.SOLAR_COUNTER_CURRENT]
+    assert site.status(NOW + 31).stale == [devices[1]]
+
+
+def test_running_totals_match_a_full_sum():
+    site = SiteAggregator(list(range(5)), max_age=None)
+    expected: Dict[int, float] = {}
+    for cycle in range(3000):
+        device = cycle % 5
+        expected[device] = (cycle * 7 % 13) / 10
+        site.update(device, _snapshot(NOW + cycle, power_generation_today=expected[device]))
+        assert site.snapshot(NOW + cycle).values["power_generation_today"] == pytest.approx(sum(expected.values()))
+    assert site.latest is not None and site.latest.timestamp == NOW + 2999
+
+
+def test_invalid_configuration():
+    with pytest.raises(ValueError):
+        SiteAggregator(["a", "a"])
+    with pytest.raises(ValueError):
+        SiteAggregator(["a"], totals=["model"])
+    with pytest.raises(KeyError):
+        SiteAggregator(["a"]).update("b", _snapshot())
+
+
+def test_site_snapshots_feed_the_exporters(controller: RenogyRoverController):
+    site = SiteAggregator(["rover1", "rover2"])
+    broker = LocalBroker()
+    messages: List[Message] = []
+    broker.subscribe("pyrover/site1/#", messages.append)
+    cache = SnapshotCache()
+    site.subscribe(Publisher(broker, device_id="site1", fields=site.fields).update)
+    site.subscribe(cache.update)
+    poller = Poller(controller)
+    poller.subscribe(site.subscriber("rover1"))
+    poller.subscribe(site.subscriber("rover2"))
+
+    poller.poll()
+
+    state = json.loads(messages[-1].payload)["v"]
+    expected = controller.all_data()
+    assert state["charging_power"] == 2 * expected["charging_power"]
+    assert state["power_generation_today"] == pytest.approx(2 * expected["power_generation_today"])
+    assert state["controller_fault_information"] == [
+        fault.name for fault in sorted(expected["controller_fault_information"], key=lambda fault: fault.value)
+    ]
+    assert cache.latest == site.latest
@@ -0,0 +1,119 @@
+import json
+import time
+from typing import List
+
+from pyrover.poller import Snapshot
+from pyrover.soak import SoakReport, SoakThresholds, compare, main, run_soak
+
+
+def test_soak_run_passes_and_reports():
+    # Latency of a short run on a busy machine is too noisy to gate on
+    thresholds = SoakThresholds(latency_drift=100.0)
+    report = run_soak(1.0, devices=2, sample_interval=0.1, warmup=0.3, warmup_cycles=10, thresholds=thresholds)
+
+    assert report.passed, report.failures
+    assert report.cycles > 10
+    assert len(report.samples) >= 5
+    assert report.samples[-1].cycles == report.cycles
+    assert 0 < report.latency["p50"] <= report.latency["p99"] <= report.latency["max"]
+    assert report.growth["objects"] is not None
+    assert "pyrover" in report.format()
+    assert SoakReport.from_json(json.loads(json.dumps(report.to_json()))) == report
+
+
+def test_soak_run_detects_leaks():
+    leaked: List[List[int]] = []
+
+    def leak(snapshot: Snapshot) -> None:
+        leaked.append([0] * 1000)
+
+    # A fixed number of cycles, so the leak is the same on a slow machine
+    report = run_soak(
+        None,
+        max_cycles=400,
+        sample_every=20,
+        warmup=0.25,
+        warmup_cycles=10,
+        thresholds=SoakThresholds(traced=256 << 10, latency_drift=100.0),
+        subscribers=[leak],
+    )
+
+    assert report.cycles == len(leaked) == 400
+    assert [failure.split()[0] for failure in report.failures] == ["traced"]
+    assert (report.growth["traced"] or 0) > 300 * 8000
+    assert report.object_growth["list"] >= 300
+
+
+def test_soak_run_shorter_than_the_warmup_fails():
+    leaked: List[List[int]] = []
+
+    def leak(snapshot: Snapshot) -> None:
+        leaked.append([0] * 1000)
+
+    report = run_soak(None, max_cycles=50, sample_every=10, subscribers=[leak])
+
+    assert not report.passed
+    assert report.failures[0].startswith("run ended before the end of the warmup")
+    # The growth is measured from the start of the run instead
+    assert (report.growth["traced"] or 0) > 40 * 8000
+
+
+def test_soak_run_detects_latency_drift(monkeypatch):
+    # The cycles after the 250th take a second longer on the clock timing them, whatever the load of the machine
+    perf_counter = time.perf_counter
+    cycles = 0
+    delay = 0.0
+
+    def slow_down(snapshot: Snapshot) -> None:
+        nonlocal cycles, delay
+        cycles += 1
+        if cycles > 250:
+            delay += 1.0
+
+    monkeypatch.setattr(time, "perf_counter", lambda: perf_counter() + delay)
+    report = run_soak(None, max_cycles=400, sample_every=20, warmup=0.25, warmup_cycles=10, subscribers=[slow_down])
+
+    assert [failure.split()[0] for failure in report.failures] == ["p99"]
+    assert (report.growth["latency_drift"] or 0) > 100
+
+
+def test_soak_compare_flags_regressions():
+    report = run_soak(
+        0.5, sample_interval=0.1, warmup=0.2, warmup_cycles=10, thresholds=SoakThresholds(latency_drift=100.0)
+    )
+
+    assert compare(report, report) == []
+    slower = report._replace(latency={name: value * 2 for name, value in report.latency.items()})
+    assert [r.split()[1] for r in compare(slower, report)] == ["p50", "p95", "p99", "max"]
+    leaking = report._replace(growth={**report.growth, "traced": (report.growth["traced"] or 0) + (10 << 20)})
+    assert compare(leaking, report) == [
+        f"traced growth {leaking.growth['traced']:.0f}, was {report.growth['traced']:.0f}"
+    ]
+
+
+def test_soak_command_line(tmp_path, capsys):
+    path = tmp_path / "soak.json"
+    args = [
+        "--duration",
+        "0.5",
+        "--sample-interval",
+        "0.1",
+        "--warmup-cycles",
+        "10",
+        "--max-latency-drift",
+        "100",
+        "--report",
+        str(path),
+    ]
+
+    assert main(args) == 0
+    assert main(args + ["--baseline", str(path), "--tolerance", "100"]) == 0
+    assert SoakReport.from_json(json.loads(path.read_text())).cycles > 0
+    assert "latency" in capsys.readouterr().out
+
+    # A fixed number of cycles, without the default duration
+    args = ["--cycles", "200", "--sample-every", "20", "--warmup", "0.2", "--warmup-cycles", "10"]
+    assert main(args + ["--max-latency-drift", "100", "--report", str(path)]) == 0
+    report = SoakReport.from_json(json.loads(path.read_text()))
+    assert report.cycles == 200
+    assert [sample.cycles for sample in report.samples] == list(range(20, 220, 20))
@@ -0,0 +1,161 @@
+import json
+import os
+
+import pytest
+
+from pyrover.poller import Snapshot
+from pyrover.spool import Spool, decode_batch
+from pyrover.types import ChargingState
+
+
+def _records(count, start=0):
+    return [f"record-{i:04d}".encode() * 4 for i in range(start, start + count)]
+
+
+def _drain(spool, **kwargs):
+    batches = []
+    spool.drain(batches.append, **kwargs)
+    return batches
+
+
+def _segments(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".seg"))
+
+
+def test_spool_drains_records_in_order(tmp_path):
+    spool = Spool(str(tmp_path), segment_size=200, max_size=100_000, batch_size=300)
+    for record in _records(20):
+        spool.append(record)
+    assert spool.pending
+
+    batches = _drain(spool)
+    assert len(batches) > 1
+    assert [r for batch in batches for r in decode_batch(batch.data)] == _records(20)
+    assert sum(batch.records for batch in batches) == 20
+    assert not spool.pending
+    # Sent segments are deleted, only the one being written is left
+    assert len(_segments(tmp_path)) == 1
+
+
+def test_spool_batches_are_compressed(tmp_path):
+    spool = Spool(str(tmp_path))
+    for record in _records(100):
+        spool.append(record)
+    (batch,) = _drain(spool)
+    assert len(batch.data) < sum(len(r) for r in _records(100)) / 4
+
+
+def test_spool_syncs_in_batches(tmp_path, monkeypatch):
+    fsyncs = []
+    monkeypatch.setattr(os, "fsync", fsyncs.append)
+    spool = Spool(str(tmp_path), sync_every=10, sync_interval=3_600)
+    for record in _records(25):
+        spool.append(record)
+    assert len(fsyncs) == 2
+
+    spool.sync()
+    assert len(fsyncs) == 3
+
+
+def test_spool_evicts_oldest_segments(tmp_path):
+    spool = Spool(str(tmp_path), segment_size=100, max_size=300)
+    for record in _records(40):
+        spool.append(record)
+
+    assert spool.size <= 300 + 100
+    assert spool.evicted > 0
+    received = [r for batch in _drain(spool) for r in decode_batch(batch.data)]
+    assert len(received) == 40 - spool.evicted
+    assert received == _records(40)[spool.evicted :]
+
+
+def test_spool_failed_send_keeps_records(tmp_path):
+    spool = Spool(str(tmp_path), batch_size=100)
+    for record in _records(10):
+        spool.append(record)
+
+    def send(batch):
+        raise ConnectionError("uplink down")
+
+    with pytest.raises(ConnectionError):
+        spool.drain(send)
+    assert [r for batch in _drain(spool) for r in decode_batch(batch.data)] == _records(10)
+
+
+def test_spool_resumes_after_restart(tmp_path):
+    spool = Spool(str(tmp_path), segment_size=200, max_size=100_000, batch_size=100)
+    for record in _records(20):
+        spool.append(record)
+    first = _drain(spool, max_batches=2)
+    spool.close()
+
+    spool = Spool(str(tmp_path), segment_size=200, max_size=100_000, batch_size=100)
+    rest = _drain(spool)
+    received = [r for batch in first + rest for r in decode_batch(batch.data)]
+    assert received == _records(20)
+
+
+def test_spool_resend_has_same_key(tmp_path):
+    spool = Spool(str(tmp_path))
+    for record in _records(5):
+        spool.append(record)
+    spool.close()
+
+    keys = []
+    for _ in range(2):
+        # Crash after sending, before the position is saved
+        spool = Spool(str(tmp_path))
+        batch = spool._next_batch()
+        assert batch is not None
+        keys.append(batch.key)
+        spool.close()
+    assert keys[0] == keys[1]
+
+
+def test_spool_failed_batch_is_sent_again_unchanged(tmp_path):
+    spool = Spool(str(tmp_path))
+    for record in _records(5):
+        spool.append(record)
+
+    def fail(batch):
+        raise IOError("uplink down")
+
+    with pytest.raises(IOError):
+        spool.drain(fail)
+    failed = spool._next_batch()
+    assert failed is not None
+    # More records arrive before the retry
+    for record in _records(3, start=5):
+        spool.append(record)
+
+    batches = _drain(spool)
+    assert batches[0].key == failed.key
+    assert [decode_batch(batch.data) for batch in batches] == [_records(5), _records(3, start=5)]
+    assert len({batch.key for batch in batches}) == 2
+    spool.close()
+
+
+def test_spool_drops_torn_record(tmp_path):
+    spool = Spool(str(tmp_path))
+    for record in _records(3):
+        spool.append(record)
+    spool.close()
+    (segment,) = _segments(tmp_path)
+    with open(tmp_path / segment, "ab") as file:
+        file.write(b"\x40\x00\x00\x00\x00\x00\x00\x00partial")
+
+    spool = Spool(str(tmp_path))
+    spool.append(b"after crash")
+    received = [r for batch in _drain(spool) for r in decode_batch(batch.data)]
+    assert received == _records(3) + [b"after crash"]
+
+
+def test_spool_update_stores_snapshots(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.update(
+        Snapshot(timestamp=12.5, values={"charging_state": ChargingState.MPPT, "charging_power": 305}, registers={})
+    )
+
+    (batch,) = _drain(spool)
+    (record,) = decode_batch(batch.data)
+    assert json.loads(record) == {"ts": 12.5, "v": {"charging_state": "MPPT", "charging_power": 305}}
@@ -0,0 +1,215 @@
+import calendar
+import sqlite3
+import time
+
+import pytest
+
+from pyrover.poller import Snapshot
+from pyrover.sqlite_sink import DAY, HOUR, MINUTE, SAMPLES, SqliteSink, partition_key, partition_range
+from pyrover.types import ChargingState
+
+# 2024-06-01 00:00:00 UTC
+T0 = calendar.timegm((2024, 6, 1, 0, 0, 0))
+FIELDS = ["battery_voltage", "charging_power"]
+
+
+def _snapshot(timestamp: float, power: int = 100, state: ChargingState = ChargingState.MPPT) -> Snapshot:
+    values = {"battery_voltage": 12.5, "charging_power": power, "charging_state": state, "product_model": "RVR"}
+    return Snapshot(timestamp=timestamp, values=values, registers={})
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "history.db")
+
+
+@pytest.fixture
+def sink(path):
+    sink = SqliteSink(path, fields=FIELDS, grace=0)
+    yield sink
+    sink.close()
+
+
+def _query(path, sql, *args):
+    with sqlite3.connect(path) as connection:
+        return connection.execute(sql, args).fetchall()
+
+
+def test_partitions():
+    assert partition_key(SAMPLES, T0 + 86399) == "20240601"
+    assert partition_key(HOUR, T0) == "202406"
+    assert partition_key(DAY, T0) == "2024"
+    assert partition_range(SAMPLES, "20240601") == (T0, T0 + 86400)
+    assert partition_range(HOUR, "202412") == (
+        calendar.timegm((2024, 12, 1, 0, 0, 0)),
+        calendar.timegm((2025, 1, 1, 0, 0, 0)),
+    )
+    assert partition_range(DAY, "2024") == (
+        calendar.timegm((2024, 1, 1, 0, 0, 0)),
+        calendar.timegm((2025, 1, 1, 0, 0, 0)),
+    )
+
+
+def test_samples_are_written_in_batches(sink: SqliteSink, path):
+    record = sink.subscriber("rover-1")
+    record(_snapshot(T0 + 1.5))
+    sink.record("rover-2", _snapshot(T0 + 2, state=ChargingState.FLOATING))
+    assert _query(path, "SELECT name FROM sqlite_master WHERE name LIKE 'samples%'") == []
+
+    assert sink.flush() == 2
+    assert sink.written == 2
+    assert _query(path, "PRAGMA journal_mode") == [("wal",)]
+    assert _query(path, "SELECT * FROM samples_20240601 ORDER BY device") == [
+        (1, (T0 + 1) * 1000 + 500, 12.5, 100, 2),
+        (2, (T0 + 2) * 1000, 12.5, 100, 5),
+    ]
+    assert _query(path, "SELECT name FROM devices ORDER BY id") == [("rover-1",), ("rover-2",)]
+    assert sink.partitions(SAMPLES) == ["samples_20240601"]
+
+
+def test_rollups(sink: SqliteSink, path):
+    # 2 hours every 10 s, floating for the last 30 minutes
+    for t in range(0, 7200, 10):
+        state = ChargingState.MPPT if t < 5400 else ChargingState.FLOATING
+        sink.record("rover", _snapshot(T0 + t, power=t // 10 % 6, state=state))
+    sink.record("rover", _snapshot(T0 + 86400))
+    sink.flush()
+
+    minute = _query(
+        path, "SELECT ts, state, count, charging_power_min, charging_power_max, charging_power_sum FROM minute_20240601"
+    )
+    assert len(minute) == 120
+    assert minute[0] == (T0 * 1000, 2, 6, 0, 5, 15.0)
+    assert minute[-1][1] == 5
+    hour = _query(path, "SELECT ts, state, count, battery_voltage_max FROM hour_202406 ORDER BY ts, state")
+    assert hour == [(T0 * 1000, 2, 360, 12.5), ((T0 + 3600) * 1000, 2, 180, 12.5), ((T0 + 3600) * 1000, 5, 180, 12.5)]
+    day = _query(path, "SELECT ts, SUM(count), SUM(charging_power_sum) FROM day_2024 GROUP BY ts")
+    assert day == [(T0 * 1000, 720, 120 * 15.0)]
+
+
+def test_rollups_wait_for_complete_buckets(path):
+    sink = SqliteSink(path, fields=FIELDS, grace=5)
+    for t in range(0, 64):
+        sink.record("rover", _snapshot(T0 + t))
+    sink.flush()
+    assert sink.partitions(MINUTE) == []
+
+    sink.record("rover", _snapshot(T0 + 65))
+    sink.flush()
+    assert _query(path, "SELECT count FROM minute_20240601") == [(60,)]
+    sink.close()
+
+
+def test_late_samples_are_rolled_up(sink: SqliteSink, path):
+    for t in range(0, 7200, 60):
+        sink.record("rover-1", _snapshot(T0 + t))
+    sink.record("rover-1", _snapshot(T0 + 86400))
+    sink.flush()
+
+    # A device reconnecting sends its backlog once the buckets were rolled up
+    for t in range(0, 600, 60):
+        sink.record("rover-2", _snapshot(T0 + t, power=200, state=ChargingState.FLOATING))
+    sink.record("rover-1", _snapshot(T0 + 30, power=400))
+    sink.flush()
+
+    minute = _query(
+        path, "SELECT device, state, count, charging_power_sum FROM minute_20240601 WHERE ts = ?", T0 * 1000
+    )
+    assert minute == [(1, 2, 2, 500.0), (2, 5, 1, 200.0)]
+    hour = _query(path, "SELECT device, state, count, charging_power_sum FROM hour_202406 WHERE ts = ?", T0 * 1000)
+    assert hour == [(1, 2, 61, 6400.0), (2, 5, 10, 2000.0)]
+    day = _query(path, "SELECT device, SUM(count), SUM(charging_power_sum) FROM day_2024 GROUP BY device")
+    assert day == [(1, 121, 12400.0), (2, 10, 2000.0)]
+
+    # A day no other device wrote to
+    sink.record("rover-1", _snapshot(T0 + 3 * 86400))
+    sink.flush()
+    sink.record("rover-2", _snapshot(T0 + 2 * 86400, power=300))
+    sink.flush()
+    day = _query(path, "SELECT device, count, charging_power_sum FROM day_2024 WHERE ts = ?", (T0 + 2 * 86400) * 1000)
+    assert day == [(2, 1, 300.0)]
+
+
+def test_late_samples_past_the_retention_keep_the_rollups(path):
+    sink = SqliteSink(path, fields=FIELDS, grace=0, retention={"samples": 86400})
+    for t in range(0, 600, 60):
+        sink.record("rover", _snapshot(T0 + t))
+    sink.record("rover", _snapshot(T0 + 2 * 86400))
+    sink.flush()
+    assert "samples_20240601" not in sink.partitions(SAMPLES)
+
+    # Its bucket would be rolled up from this sample alone
+    sink.record("rover", _snapshot(T0 + 30, power=400))
+    sink.flush()
+    assert _query(path, "SELECT charging_power_sum FROM minute_20240601 WHERE ts = ?", T0 * 1000) == [(100.0,)]
+    assert _query(path, "SELECT charging_power_sum FROM hour_202406 WHERE ts = ?", T0 * 1000) == [(1000.0,)]
+    sink.close()
+
+
+def test_retention_drops_partitions(path):
+    sink = SqliteSink(path, fields=FIELDS, grace=0, retention={"samples": 86400, "minute": 2 * 86400})
+    for day in range(4):
+        sink.record("rover", _snapshot(T0 + day * 86400))
+        sink.flush()
+
+    assert sink.partitions(SAMPLES) == ["samples_20240603", "samples_20240604"]
+    assert sink.partitions(MINUTE) == ["minute_20240602", "minute_20240603"]
+    tables = {name for (name,) in _query(path, "SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert "samples_20240601" not in tables
+    assert sink.partitions(DAY) == ["day_2024"]
+    sink.close()
+
+
+def test_reopen(sink: SqliteSink, path):
+    sink.record("rover", _snapshot(T0))
+    sink.close()
+
+    reopened = SqliteSink(path, fields=FIELDS + ["load_power"], grace=0)
+    assert reopened.partitions(SAMPLES) == ["samples_20240601"]
+    reopened.record("rover", _snapshot(T0 + 1))
+    reopened.flush()
+    assert _query(path, "SELECT device, load_power FROM samples_20240601") == [(1, None), (1, None)]
+    reopened.close()
+
+
+def test_max_pending(path):
+    sink = SqliteSink(path, fields=FIELDS, max_pending=2)
+    for t in range(3):
+        sink.record("rover", _snapshot(T0 + t))
+    assert sink.dropped == 1
+    assert sink.flush() == 2
+    sink.close()
+
+
+def test_failed_transaction_is_retried(sink: SqliteSink, path, monkeypatch):
+    set_meta = sink._set_meta
+
+    def fail_once(key, value):
+        monkeypatch.setattr(sink, "_set_meta", set_meta)
+        raise sqlite3.OperationalError("database or disk is full")
+
+    monkeypatch.setattr(sink, "_set_meta", fail_once)
+    sink.record("rover", _snapshot(T0))
+    with pytest.raises(sqlite3.OperationalError):
+        sink.flush()
+    # The rolled back partition is created again
+    assert sink.partitions(SAMPLES) == []
+
+    assert sink.flush() == 1
+    assert _query(path, "SELECT COUNT(*) FROM samples_20240601") == [(1,)]
+
+
+def test_invalid_fields(path):
+    with pytest.raises(ValueError):
+        SqliteSink(path, fields=["product_model"])
+
+
+def test_background_flush(path):
+    sink = SqliteSink(path, fields=FIELDS, flush_interval=0.01)
+    sink.start()
+    sink.record("rover", _snapshot(T0))
+    deadline = time.monotonic() + 5
+    while sink.written == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    sink.close()
+    assert sink.written == 1
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+from pyrover.decoders import BufferDecoder
+from pyrover.fields import encode_value
+from pyrover.poller import Poller, Snapshot
+from pyrover.registers import RegisterSpan
+from pyrover.wire import FLAG_COMPRESSED, FLAG_DELTA, SCHEMA_VERSION, WireDecoder, WireEncoder
+
+
+@pytest.fixture
+def snapshot(controller):
+    return Poller(controller).poll()
+
+
+def _changed(snapshot, timestamp, registers):
+    changed = dict(snapshot.registers)
+    changed.update(registers)
+    return snapshot._replace(timestamp=timestamp, registers=changed)
+
+
+def test_wire_roundtrip(snapshot):
+    frame = WireEncoder().encode(snapshot)
+    decoded = WireDecoder().decode(frame)
+
+    assert frame[0] == SCHEMA_VERSION
+    assert decoded.registers == snapshot.registers
+    assert decoded.values == snapshot.values
+    assert decoded.timestamp == pytest.approx(snapshot.timestamp, abs=1e-3)
+
+
+def test_wire_frames_are_small(snapshot):
+    json_size = len(json.dumps({name: encode_value(value) for name, value in snapshot.values.items()}))
+    encoder = WireEncoder(delta=True)
+    keyframe = encoder.encode(snapshot)
+    delta = encoder.encode(_changed(snapshot, snapshot.timestamp + 1, {0x0101: 130, 0x0109: 310}))
+
+    assert len(keyframe) < json_size / 10
+    assert len(delta) < 30
+    assert delta[1] & FLAG_DELTA
+
+
+def test_wire_compression_only_when_smaller():
+    snapshot = Snapshot(timestamp=1_700_000_000.123, values={}, registers={0x0100: 0x1F2E})
+    frame = WireEncoder().encode(snapshot)
+    assert not frame[1] & FLAG_COMPRESSED
+    assert WireDecoder(decode_values=False).decode(frame).registers == {0x0100: 0x1F2E}
+
+
+def test_wire_delta_sequence(snapshot):
+    encoder = WireEncoder(delta=True, keyframe_interval=3)
+    snapshots = [
+        snapshot,
+        _changed(snapshot, snapshot.timestamp + 1, {0x0101: 130}),
+        _changed(snapshot, snapshot.timestamp + 1.5, {0x0101: 131, 0x0109: 0}),
+        _changed(snapshot, snapshot.timestamp - 2, {0x0101: 131, 0x0109: 0}),
+    ]
+    frames = [encoder.encode(s) for s in snapshots]
+    assert [bool(frame[1] & FLAG_DELTA) for frame in frames] == [False, True, True, False]
+
+    decoder = WireDecoder()
+    decoded = [decoder.decode(frame) for frame in frames]
+    for s, d in zip(snapshots, decoded):
+        assert d.registers == s.registers
+        assert d.timestamp == pytest.approx(s.timestamp, abs=1e-3)
+    assert decoded[-1].values["charging_power"] == 0
+    assert decoded[-1].values["battery_voltage"] == 13.1
+
+
+def test_wire_layout_change_forces_keyframe(snapshot):
+    encoder = WireEncoder(delta=True)
+    encoder.encode(snapshot)
+    telemetry = {address: snapshot.registers[address] for address in range(0x0100, 0x010A)}
+    frame = encoder.encode(snapshot._replace(registers=telemetry))
+
+    assert not frame[1] & FLAG_DELTA
+    decoded = WireDecoder().decode(frame)
+    assert set(decoded.values) == set(BufferDecoder(RegisterSpan(0x0100, 10)).fields)
+    assert decoded.values["charging_power"] == snapshot.values["charging_power"]
+    assert "product_model" not in decoded.values
+
+
+def test_wire_decoder_rejects_out_of_order_delta(snapshot):
+    encoder = WireEncoder(delta=True)
+    encoder.encode(snapshot)
+    delta = encoder.encode(_changed(snapshot, snapshot.timestamp + 1, {0x0101: 130}))
+
+    with pytest.raises(ValueError, match="does not follow"):
+        WireDecoder().decode(delta)
+
+
+def test_wire_decoder_rejects_unknown_version(snapshot):
+    frame = bytearray(WireEncoder().encode(snapshot))
+    frame[0] = SCHEMA_VERSION + 1
+    with pytest.raises(ValueError, match="schema version"):
+        WireDecoder().decode(bytes(frame))